@@ -0,0 +1,874 @@
+# benchmarks for the casebook interpreter
+# run from this directory; each benchmark is a subcommand
+#
+# usage: python benchmark.py memory [sourceFilePath]
+#        python benchmark.py expressions [evalCount]
+#        python benchmark.py lexer [sourceFilePath ...]
+#        python benchmark.py phases [sourceFilePath] [traceJsonFilePath]
+#        python benchmark.py scaling [check|save] [scale ...]
+#        python benchmark.py rendercache [sourceFilePath]
+#        python benchmark.py parallel [sourceFilePath] [workerCount]
+#        python benchmark.py hlapi [leadCount] [queryCount]
+#        python benchmark.py leadcache [leadCount]
+#        python benchmark.py leaddb [leadCount] [queryCount]
+#   memory: parse and convert a casebook and report how much memory the AST takes, in total and per node
+#   expressions: time the resolving of some $if(...) conditions (evalCount times each, default 100k)
+#   lexer: time parsing the sample books with our text_block/rawtext_block terminals vs the original (lookahead at every character) versions, and check they give the same trees
+#   phases: run a full (latex) build with the profiler on, print where the time went (by self time) and save a chrome trace (default logs/<name>_trace.json); also reports the cost of profiling vs a build with it off
+#   scaling: generate (seeded) casebooks at some multiples of the size of wrongbook (default 1 10 100), time each phase of a build and measure peak memory
+#     check (default) compares against benchmark_baseline.json and fails (exit code 1) on a regression; save writes the results as the new baseline
+#     times are compared relative to a calibration run (a fixed workload that uses no casebook code), timed along with the baseline and again with each check, so a baseline saved on one machine can be checked on another
+#   rendercache: time the render of a (latex) build with the render cache on, first with an empty cache and then a warm one, and report hit rates
+#   parallel: time the render of a (latex) build serially and with leads rendered in parallel worker processes (default one per cpu), and check both print the same thing
+#   hlapi: per-query latency of HlApi.findLeadRowSimilarByNameOrAddress over leadCount (seeded) synthetic leads (default 100k), using the trigram index, in one batch (findLeadRowsSimilarByNameOrAddress), and (for a few queries) scanning every row, and how often they agree
+#   leadcache: time HlApi.loadLeads on leadCount (seeded) synthetic leads (default 100k) written as geojson files, parsing the json vs from a cold and a warm lead cache, and after one file changes; also compares the memory held by the geojson features and by the lead table
+#   leaddb: time building and opening an HlApiSqlite database of leadCount (seeded) synthetic leads, and lookups by lead id and similar name against it vs HlApi in memory, and how often the two agree
+
+
+# parser engine
+from lib.jrlark import jrlark
+
+# interpreter
+from lib.casebook.jrinterpCasebook import JrInterpreterCasebook, AstTaskLatex
+from lib.casebook.jrastutilclasses import JrAstContext, JrAstEnvironment, JrSourceLocation
+from lib.casebook.jrastvals import JrAst
+from lib.casebook.jrast import JrAstControlStatementIf
+
+# python modules
+import sys
+import os
+import io
+import contextlib
+import tracemalloc
+import tempfile
+import concurrent.futures
+import multiprocessing
+import time
+import json
+import math
+import random
+import re
+
+# my libs
+from lib.jr import jrfuncs
+from lib.jr.jrfuncs import jrprint
+
+
+
+
+
+# default grammar file and sources
+baseName = "casebook"
+rootDirectory = os.path.dirname(os.path.realpath(__file__))
+grammarDirectory = rootDirectory + "/grammar"
+grammarFilePath = grammarDirectory + "/" + baseName + "_grammar.lark"
+defaultSourceFilePath = grammarDirectory + "/wrongbook." + baseName
+sampleSourceFilePaths = [grammarDirectory + "/" + fileName + "." + baseName for fileName in ["grammar_test", "wrongbook_partial", "wrongbook"]]
+
+# options
+encoding = "utf-8"
+startSymbol = "start"
+
+# $if conditions for expressions benchmark; flag is declared (true) in the env before we run
+defaultExpressionEvalCount = 100000
+expressionBenchmarkConditions = [
+    'true',
+    'true && !false',
+    'flag',
+    'flag == true',
+    '!flag || (flag && !false)',
+    'flag != (true && false)',
+    '(flag == true) && (flag != false)',
+]
+
+# for lexer benchmark: [current terminal regex, original regex] for the prose terminals in our grammars
+# the originals do a negative lookahead at every character
+legacyProseTerminalRegexes = [
+    [r"/[ \t]*(?:[^\r\n${}\/*<>]+|\$(?![a-zA-Z_(])|\/(?![\/*])|\*(?!\/)|<(?!<<)|>(?!>>))+/", r"/[ \t]*((?!(\$[a-zA-Z_(])|\$\(|[{}]|\/\/|\/\*|\*\/|<<<|>>>)[^\r\n])+/"],
+    [r"[ \t]*(?:[^\s${}\/*<>]|\$(?![a-zA-Z_(])|\/(?![\/*])|\*(?!\/)|<(?!<<)|>(?!>>))(?:[^\r\n${}\/*<>]+|\$(?![a-zA-Z_(])|\/(?![\/*])|\*(?!\/)|<(?!<<)|>(?!>>))*/", r"[ \t]*((?!(\$[a-zA-Z_(])|\$\(|[{}]|\/\/|\/\*|\*\/|<<<|>>>)[^\s])((?!(\$[a-zA-Z_(])|\$\(|[{}]|\/\/|\/\*|\*\/|<<<|>>>)[^\r\n])*/"],
+    [r"/(?:[^>]+|>(?!>>))+/", r"/((?!>>>)[\s\S])+/"],
+]
+defaultLexerRepeatCount = 3
+defaultPhasesRepeatCount = 5
+
+# for scaling benchmark: generated casebook options and the sizes (multiples of wrongbook) we build
+defaultScalingScales = [1, 10, 100]
+scalingBaselineFilePath = rootDirectory + "/benchmark_baseline.json"
+scalingGeneratorOptions = {
+    "seed": 1948,
+    "leadsPerSection": 25,
+    "paragraphsPerLead": 4,
+    # chance of a function call after each sentence
+    "callDensity": 0.25,
+    # chance of each lead having a nested $if/$for block, and a raw <<<>>> block
+    "controlDensity": 0.3,
+    "rawDensity": 0.1,
+}
+# a phase regresses if it takes this many times its baseline time (plus a little slack for tiny times), or uses this many times its baseline peak memory
+scalingTimeTolerance = 1.5
+scalingTimeSlackSecs = 0.05
+scalingMemoryTolerance = 1.2
+scalingPhases = ["parse", "convert", "setup", "render"]
+# the calibration workload is timed this many times, and we take the fastest
+scalingCalibrationRunCount = 5
+
+# for hlapi benchmark: synthetic lead count, how many (misspelled) queries to time, and how many of those to also time with a full scan (which is slow)
+defaultHlApiLeadCount = 100000
+defaultHlApiQueryCount = 200
+hlApiScanQueryCount = 3
+hlApiGeneratorSeed = 1948
+# for leadcache benchmark: how many geojson files the synthetic leads are split over
+hlApiLeadFileCount = 4
+
+
+
+
+
+def loadAndParse(sourceFilePath):
+    # parse a source file, return [jrinterp, env] ready for convertParseTreeToAst
+    # we are not in debug mode, and we swallow the interpreter's own output
+    context = JrAstContext(False, True)
+    env = JrAstEnvironment(context, None)
+    jrinterp = JrInterpreterCasebook()
+    with contextlib.redirect_stdout(io.StringIO()):
+        jrinterp.loadGrammarParseSourceFile(env, grammarFilePath, sourceFilePath, startSymbol, encoding)
+    return [jrinterp, env]
+
+
+
+def calcObjectAttributeValues(obj):
+    # values of all attributes of an object, whether stored in __slots__ or a __dict__
+    values = []
+    for cls in type(obj).__mro__:
+        for slotName in cls.__dict__.get("__slots__", ()):
+            if (hasattr(obj, slotName)):
+                values.append(getattr(obj, slotName))
+    if (hasattr(obj, "__dict__")):
+        values += list(obj.__dict__.values())
+    return values
+
+
+def collectAstNodes(root):
+    # walk the ast (through node attributes, lists and dicts) and return a list of all unique JrAst nodes
+    nodes = []
+    seenIds = set()
+    stack = [root]
+    while (len(stack) > 0):
+        obj = stack.pop()
+        if (isinstance(obj, JrAst)):
+            if (id(obj) in seenIds):
+                continue
+            seenIds.add(id(obj))
+            nodes.append(obj)
+            stack += calcObjectAttributeValues(obj)
+        elif (isinstance(obj, (list, tuple))):
+            stack += obj
+        elif (isinstance(obj, dict)):
+            stack += list(obj.values())
+    return nodes
+
+
+def calcNodeShallowSize(node, seenSlocIds):
+    # bytes used by the node itself, its __dict__ (if any), and its source location (and its __dict__, if any) unless another node shares it
+    # we don't count child nodes (they are counted separately) or values shared with the parse tree
+    size = sys.getsizeof(node)
+    if (hasattr(node, "__dict__")):
+        size += sys.getsizeof(node.__dict__)
+    sloc = node.sloc
+    if (isinstance(sloc, JrSourceLocation)) and (id(sloc) not in seenSlocIds):
+        seenSlocIds.add(id(sloc))
+        size += sys.getsizeof(sloc)
+        if (hasattr(sloc, "__dict__")):
+            size += sys.getsizeof(sloc.__dict__)
+    return size
+
+
+
+def benchmarkMemory(sourceFilePath):
+    jrprint("Memory benchmark on {}..".format(os.path.basename(sourceFilePath)))
+    [jrinterp, env] = loadAndParse(sourceFilePath)
+
+    # measure memory allocated (and still held) by converting the parse tree to our ast
+    tracemalloc.start()
+    startSize = tracemalloc.get_traced_memory()[0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        jrinterp.convertParseTreeToAst(env)
+    endSize = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    convertBytes = endSize - startSize
+
+    # count nodes and their shallow sizes
+    nodes = collectAstNodes(jrinterp.ast)
+    nodeCount = len(nodes)
+    shallowBytes = 0
+    countsByType = {}
+    seenSlocIds = set()
+    for node in nodes:
+        shallowBytes += calcNodeShallowSize(node, seenSlocIds)
+        typeStr = node.getTypeStr()
+        countsByType[typeStr] = countsByType.get(typeStr, 0) + 1
+    nodesWithDict = len([node for node in nodes if hasattr(node, "__dict__")])
+
+    jrprint("AST nodes: {} ({} with a __dict__).".format(nodeCount, nodesWithDict))
+    for typeStr in sorted(countsByType, key=lambda typeStr: -countsByType[typeStr]):
+        jrprint("  {}: {}".format(typeStr, countsByType[typeStr]))
+    jrprint("Node + source location size: {} bytes total, {:.1f} bytes per node.".format(shallowBytes, shallowBytes / max(nodeCount, 1)))
+    jrprint("Memory held after convertParseTreeToAst (tracemalloc): {} bytes total, {:.1f} bytes per node.".format(convertBytes, convertBytes / max(nodeCount, 1)))
+    return 0
+
+
+
+
+
+def benchmarkExpressions(evalCount):
+    jrprint("Expression benchmark ({} evaluations of each $if condition)..".format(evalCount))
+
+    # build a small casebook with one $if per condition
+    sourceText = "# LEADS\n\n## Lead1\n"
+    for condition in expressionBenchmarkConditions:
+        sourceText += "$if({}): {{yes}}\n".format(condition)
+    with tempfile.NamedTemporaryFile("w", suffix="." + baseName, encoding=encoding, delete=False) as sourceFile:
+        sourceFile.write(sourceText)
+    try:
+        [jrinterp, env] = loadAndParse(sourceFile.name)
+        with contextlib.redirect_stdout(io.StringIO()):
+            jrinterp.convertParseTreeToAst(env)
+            jrinterp.setupCasebookStuff(env)
+            env.declareEnvVar(None, "flag", "benchmark flag", True, False)
+    finally:
+        os.remove(sourceFile.name)
+
+    ifNodes = [node for node in collectAstNodes(jrinterp.ast) if isinstance(node, JrAstControlStatementIf)]
+    ifNodes.sort(key=lambda node: node.getSourceStartPos())
+    if (len(ifNodes) != len(expressionBenchmarkConditions)):
+        jrprint("Error: expected {} $if statements but found {}.".format(len(expressionBenchmarkConditions), len(ifNodes)), severity=jrfuncs.DefLogSeverityError)
+        return 1
+
+    totalSecs = 0
+    for [condition, ifNode] in zip(expressionBenchmarkConditions, ifNodes):
+        expression = ifNode.ifExpression
+        folded = (expression.getConstantValueOrNone() is not None)
+        startTime = time.perf_counter()
+        for i in range(evalCount):
+            expression.resolve(env, True)
+        secs = time.perf_counter() - startTime
+        totalSecs += secs
+        resultStr = expression.resolve(env, True).asDebugStr()
+        jrprint("  {:<32} = {:<6} {:>8.3f}s {:>8.3f}us/eval{}".format(condition, resultStr, secs, 1000000 * secs / evalCount, " (folded)" if folded else ""))
+    jrprint("Total: {:.3f}s.".format(totalSecs))
+    return 0
+
+
+
+
+
+def calcLegacyProseGrammarText(grammarText):
+    # return grammar text with the original versions of the prose terminals
+    for [currentRegex, legacyRegex] in legacyProseTerminalRegexes:
+        grammarText = grammarText.replace(currentRegex, legacyRegex)
+    return grammarText
+
+
+def timeParse(parser, sourceText, repeatCount):
+    # return [bestSecs, tree]
+    bestSecs = None
+    for i in range(repeatCount):
+        startTime = time.perf_counter()
+        tree = parser.parse(sourceText)
+        secs = time.perf_counter() - startTime
+        if (bestSecs is None) or (secs < bestSecs):
+            bestSecs = secs
+    return [bestSecs, tree]
+
+
+def benchmarkLexer(sourceFilePaths):
+    jrprint("Lexer benchmark (best of {} parses, original prose terminals vs current)..".format(defaultLexerRepeatCount))
+    jrparser = jrlark.JrParserEngineLark()
+    jrparser.loadGrammarFileFromPath(None, grammarFilePath, encoding)
+    jrparser.options["start"] = startSymbol
+
+    # build all 4 parsers up front so we don't time building them; [label, currentParser, legacyParser]
+    parserSets = [["earley", jrparser.grammarText, jrparser.calcLarkOptions()]]
+    if (jrparser.grammarTextLalr is not None):
+        parserSets.append(["lalr", jrparser.grammarTextLalr, jrparser.calcLarkOptionsLalr()])
+    parserTriples = []
+    for [label, grammarText, larkOptions] in parserSets:
+        legacyGrammarText = calcLegacyProseGrammarText(grammarText)
+        if (legacyGrammarText == grammarText):
+            jrprint("Error: could not find the current prose terminals in the {} grammar; has it changed?".format(label), severity=jrfuncs.DefLogSeverityError)
+            return 1
+        parserTriples.append([label, jrparser.buildParser(grammarText, larkOptions), jrparser.buildParser(legacyGrammarText, larkOptions)])
+
+    retv = 0
+    for sourceFilePath in sourceFilePaths:
+        sourceText = jrfuncs.loadTxtFromFile(sourceFilePath, True, encoding=encoding)
+        fileName = os.path.basename(sourceFilePath)
+        for [label, currentParser, legacyParser] in parserTriples:
+            [legacySecs, legacyTree] = timeParse(legacyParser, sourceText, defaultLexerRepeatCount)
+            [currentSecs, currentTree] = timeParse(currentParser, sourceText, defaultLexerRepeatCount)
+            differences = jrlark.compareParseTrees(legacyTree, currentTree, True)
+            if (len(differences) > 0):
+                jrprint("  {} ({}): MISMATCH between original (first) and current (second) trees: {}".format(fileName, label, differences[0]))
+                retv = 1
+            jrprint("  {:<24} {:<7} original {:>7.3f}s  current {:>7.3f}s  ({:.2f}x){}".format(fileName, label, legacySecs, currentSecs, legacySecs / max(currentSecs, 0.000001), "" if (len(differences) == 0) else " MISMATCH"))
+    return retv
+
+
+
+
+
+def runBuild(sourceFilePath, flagProfile):
+    # full build of a source file (parse, convert, setup, latex render), swallowing the interpreter's own output; returns [elapsedSecs, profiler]
+    context = JrAstContext(False, True)
+    context.getProfiler().setEnabled(flagProfile)
+    env = JrAstEnvironment(context, None)
+    jrinterp = JrInterpreterCasebook()
+    startTime = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        jrinterp.loadGrammarParseSourceFile(env, grammarFilePath, sourceFilePath, startSymbol, encoding)
+        jrinterp.convertParseTreeToAst(env)
+        jrinterp.setupCasebookStuff(env)
+        jrinterp.taskRenderRun(env, AstTaskLatex())
+    return [time.perf_counter() - startTime, context.getProfiler()]
+
+
+def benchmarkPhases(sourceFilePath, traceFilePath):
+    jrprint("Phase timing for {}..".format(os.path.basename(sourceFilePath)))
+    # warm up (parser build and disk cache) so the runs we compare are alike, then take best of a few of each
+    runBuild(sourceFilePath, False)
+    untimedSecs = min([runBuild(sourceFilePath, False)[0] for index in range(0, defaultPhasesRepeatCount)])
+    timedSecs = None
+    for index in range(0, defaultPhasesRepeatCount):
+        [secs, profiler] = runBuild(sourceFilePath, True)
+        timedSecs = secs if (timedSecs is None) else min(timedSecs, secs)
+    jrprint("Build took {:.3f}s with profiling, {:.3f}s without ({} spans).".format(timedSecs, untimedSecs, len(profiler.spans)))
+    jrprint("")
+    profiler.printSummary()
+    profiler.exportChromeTrace(traceFilePath)
+    jrprint("")
+    jrprint("Wrote chrome trace to {}.".format(traceFilePath))
+    return 0
+
+
+
+
+
+class CasebookGenerator:
+    # emits a valid (seeded, so repeatable) casebook with sectionCount level 1 sections of leadsPerSection leads each
+    # leads are prose paragraphs with function calls sprinkled in (callDensity), and sometimes nested $if/$for blocks and raw <<<>>> blocks
+    words = ["the", "detective", "walked", "into", "a", "smoky", "bar", "and", "asked", "bartender", "about", "missing", "book", "nobody", "had", "seen", "anything", "strange", "that", "night", "rain", "was", "falling", "on", "street", "outside", "old", "man", "smiled", "said", "nothing"]
+    leadFunctionCalls = ['$gaintag("cond.tag{tag}")', '$reflead("{lead}")', '$golead("{lead}")', '$hastag("cond.tag{tag}", time=2)', '$missingtag("cond.tag{tag}")', '$symbol("clock")']
+    tagCount = 20
+
+    def __init__(self, options):
+        self.options = options
+        self.rand = random.Random(options["seed"])
+
+    def generate(self, sectionCount):
+        parts = []
+        parts.append("Casebook v2: Generated Benchmark Book\n\n\nPreliminary text.\n\n")
+        parts.append("# OPTIONS $(special=true)\n$set(info.name, \"generated\")\n$set(game.clocked, true)\n\n")
+        parts.append("# SETUP $(special=true)\n")
+        for tagIndex in range(0, self.tagCount):
+            parts.append('$defineTag("cond.tag{}")\n'.format(tagIndex))
+        parts.append("\n")
+        for sectionIndex in range(0, sectionCount):
+            parts.append('# SECTION{} "Section {}"\n$(childSort= "alpha", layoutStyle= "oneColumn")\n\n'.format(sectionIndex, sectionIndex))
+            for leadIndex in range(0, self.options["leadsPerSection"]):
+                parts.append(self.generateLead())
+        return "".join(parts)
+
+    def generateLead(self):
+        rand = self.rand
+        parts = ['## {} "{}"\n'.format(self.randomLeadId(), self.randomWords(3).title())]
+        for paragraphIndex in range(0, self.options["paragraphsPerLead"]):
+            parts.append(self.randomParagraph())
+        if (rand.random() < self.options["controlDensity"]):
+            parts.append(self.randomControlBlock())
+        if (rand.random() < self.options["rawDensity"]):
+            parts.append("<<<\n{}\n>>>\n".format(self.randomParagraph()))
+        parts.append("\n")
+        return "".join(parts)
+
+    def randomControlBlock(self):
+        # an $if/$elif/$else with a nested $for, or a $for with a nested $if
+        if (self.rand.random() < 0.5):
+            return "$if (game.clocked): {{\n{}$for(index in $range(0,3)): {{ {} }}\n}} $elif (!game.clocked): {{\n{}}} $else: {{\n{}}}\n".format(self.randomParagraph(), self.randomSentence(), self.randomParagraph(), self.randomParagraph())
+        return "$for(index in $range(0,5)): {{\n{}$if (game.clocked): {{ {} }}\n}}\n".format(self.randomParagraph(), self.randomSentence())
+
+    def randomParagraph(self):
+        return " ".join([self.randomSentence() for sentenceIndex in range(0, self.rand.randint(2, 5))]) + "\n"
+
+    def randomSentence(self):
+        sentence = self.randomWords(self.rand.randint(6, 16)).capitalize() + "."
+        if (self.rand.random() < self.options["callDensity"]):
+            sentence += " " + self.rand.choice(self.leadFunctionCalls).format(tag=self.rand.randrange(0, self.tagCount), lead=self.randomLeadId())
+        return sentence
+
+    def randomWords(self, count):
+        return " ".join([self.rand.choice(self.words) for index in range(0, count)])
+
+    def randomLeadId(self):
+        return "{}-{:04}".format(self.rand.randint(1, 9), self.rand.randrange(0, 10000))
+
+
+
+
+def generateScaledCasebook(scale, targetCharacterCount):
+    # generate a casebook scale times the given size (we measure a one section book to work out how many sections that takes)
+    sectionChars = len(CasebookGenerator(scalingGeneratorOptions).generate(1))
+    sectionCount = max(1, int(math.ceil(scale * targetCharacterCount / sectionChars)))
+    return CasebookGenerator(scalingGeneratorOptions).generate(sectionCount)
+
+
+def timeBuildPhases(sourceFilePath):
+    # full build of a source file, returning dict of phase -> secs (the interpreter's own output is swallowed)
+    context = JrAstContext(False, True)
+    env = JrAstEnvironment(context, None)
+    jrinterp = JrInterpreterCasebook()
+    phaseSecs = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        startTime = time.perf_counter()
+        jrinterp.loadGrammarParseSourceFile(env, grammarFilePath, sourceFilePath, startSymbol, encoding)
+        phaseSecs["parse"] = time.perf_counter() - startTime
+        startTime = time.perf_counter()
+        jrinterp.convertParseTreeToAst(env)
+        phaseSecs["convert"] = time.perf_counter() - startTime
+        startTime = time.perf_counter()
+        jrinterp.setupCasebookStuff(env)
+        phaseSecs["setup"] = time.perf_counter() - startTime
+        startTime = time.perf_counter()
+        jrinterp.taskRenderRun(env, AstTaskLatex())
+        phaseSecs["render"] = time.perf_counter() - startTime
+    phaseSecs["parser"] = jrinterp.jrparser.parserUsed
+    return phaseSecs
+
+
+def measureBuildPeakMemory(sourceFilePath):
+    # peak traced memory (bytes) over a whole build; done as a separate build since tracemalloc slows everything down
+    # ATTN: done in a fresh (spawned, not forked) process that loads the parser from the disk cache; a process that has built the parser from the grammar keeps noticeably bigger parse trees for the rest of its life (7.5MB vs 5.0MB at 1x), so measuring in this one would depend on whether the disk cache was empty when we started
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(measureBuildPeakMemoryHere, sourceFilePath).result()
+
+
+def measureBuildPeakMemoryHere(sourceFilePath):
+    # one untraced build first, so one-time work (loading the parser, lexer scanners, imports) isn't charged to the build
+    timeBuildPhases(sourceFilePath)
+    tracemalloc.start()
+    timeBuildPhases(sourceFilePath)
+    peakBytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peakBytes
+
+
+def timeCalibrationWorkload():
+    # fastest of a few runs of a fixed pure python workload (string building, regex scanning, dicts and sorting, roughly what a build spends its time on) that uses no casebook code, so our own changes can't speed it up or slow it down
+    bestSecs = None
+    for runIndex in range(0, scalingCalibrationRunCount):
+        startTime = time.perf_counter()
+        rand = random.Random(scalingGeneratorOptions["seed"])
+        text = " ".join(["w{}".format(rand.randint(0, 5000)) for wordIndex in range(0, 200000)])
+        counts = {}
+        for word in re.findall(r"\w+", text):
+            counts[word] = counts.get(word, 0) + 1
+        sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        secs = time.perf_counter() - startTime
+        bestSecs = secs if (bestSecs is None) else min(bestSecs, secs)
+    return bestSecs
+
+
+def benchmarkScaling(command, scales):
+    targetCharacterCount = len(jrfuncs.loadTxtFromFile(defaultSourceFilePath, True, encoding=encoding))
+    calibrationSecs = timeCalibrationWorkload()
+    jrprint("Calibration workload took {:.3f}s.".format(calibrationSecs))
+    jrprint("Scaling benchmark: generated casebooks at {} times the size of {} ({} characters)..".format(scales, os.path.basename(defaultSourceFilePath), targetCharacterCount))
+    jrprint("  {:>5} {:>10} {:>9} {:>9} {:>9} {:>9} {:>9} {:>10}".format("scale", "chars", "parse", "convert", "setup", "render", "total", "peakMB"))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tempDir:
+        # warm up (parser build and disk cache) so the first scale isn't charged for it, and so the peak memory processes can load the parser from the disk cache
+        warmupFilePath = tempDir + "/warmup.casebook"
+        jrfuncs.saveTxtToFile(warmupFilePath, CasebookGenerator(scalingGeneratorOptions).generate(1), encoding)
+        timeBuildPhases(warmupFilePath)
+        for scale in scales:
+            text = generateScaledCasebook(scale, targetCharacterCount)
+            sourceFilePath = tempDir + "/generated_{}x.casebook".format(scale)
+            jrfuncs.saveTxtToFile(sourceFilePath, text, encoding)
+            phaseSecs = timeBuildPhases(sourceFilePath)
+            if (phaseSecs["parser"] != "lalr"):
+                # a generator bug (something the lalr grammar refuses) would otherwise make us time the earley parser, which is hopeless at these sizes
+                jrprint("Error: generated {}x casebook was parsed with the {} parser, not lalr.".format(scale, phaseSecs["parser"]), severity=jrfuncs.DefLogSeverityError)
+                return 1
+            peakBytes = measureBuildPeakMemory(sourceFilePath)
+            result = {"characters": len(text), "peakBytes": peakBytes}
+            for phase in scalingPhases:
+                result[phase] = phaseSecs[phase]
+            results[str(scale)] = result
+            jrprint("  {:>4}x {:>10} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>10.1f}".format(scale, len(text), result["parse"], result["convert"], result["setup"], result["render"], sum([result[phase] for phase in scalingPhases]), peakBytes / (1024*1024)))
+
+    if (command == "save"):
+        with open(scalingBaselineFilePath, "w", encoding=encoding) as outFile:
+            json.dump({"generatorOptions": scalingGeneratorOptions, "calibrationSecs": calibrationSecs, "results": results}, outFile, indent=2)
+        jrprint("Saved baseline to {}.".format(scalingBaselineFilePath))
+        return 0
+
+    # compare against baseline
+    if (not jrfuncs.pathExists(scalingBaselineFilePath)):
+        jrprint("No baseline at {} to compare against (run with 'save' to make one).".format(scalingBaselineFilePath))
+        return 0
+    baseline = jrfuncs.loadJsonFromFile(scalingBaselineFilePath, True, encoding)
+    if (baseline["generatorOptions"] != scalingGeneratorOptions):
+        jrprint("Error: generator options have changed since the baseline was saved; re-save it.", severity=jrfuncs.DefLogSeverityError)
+        return 1
+    if ("calibrationSecs" not in baseline):
+        jrprint("Error: baseline has no calibration time (it was saved by an older version of this benchmark); re-save it.", severity=jrfuncs.DefLogSeverityError)
+        return 1
+    # baseline times are scaled by how much faster or slower this machine (and run) is than the one the baseline was saved on
+    machineRatio = calibrationSecs / baseline["calibrationSecs"]
+    jrprint("  (baseline times scaled by {:.2f} to this machine, from its calibration time of {:.3f}s)".format(machineRatio, baseline["calibrationSecs"]))
+    regressions = []
+    for scaleKey, result in results.items():
+        baselineResult = baseline["results"].get(scaleKey)
+        if (baselineResult is None):
+            continue
+        for phase in scalingPhases:
+            if (result[phase] > (baselineResult[phase] * scalingTimeTolerance + scalingTimeSlackSecs) * machineRatio):
+                regressions.append("{}x {}: {:.3f}s vs baseline {:.3f}s (scaled to this machine)".format(scaleKey, phase, result[phase], baselineResult[phase] * machineRatio))
+        if (result["peakBytes"] > baselineResult["peakBytes"] * scalingMemoryTolerance):
+            regressions.append("{}x peak memory: {:.1f}MB vs baseline {:.1f}MB".format(scaleKey, result["peakBytes"] / (1024*1024), baselineResult["peakBytes"] / (1024*1024)))
+    if (len(regressions) > 0):
+        for regression in regressions:
+            jrprint("REGRESSION: " + regression, severity=jrfuncs.DefLogSeverityError)
+        return 1
+    jrprint("No regressions against baseline.")
+    return 0
+
+
+
+
+
+def timeRenderWithCache(sourceFilePath, renderCacheDir):
+    # build with the render cache on (cache files in renderCacheDir); return [renderSecs, renderCache]
+    context = JrAstContext(False, True)
+    env = JrAstEnvironment(context, None)
+    jrinterp = JrInterpreterCasebook()
+    jrinterp.options["renderCache"] = True
+    jrinterp.options["renderCacheDir"] = renderCacheDir
+    with contextlib.redirect_stdout(io.StringIO()):
+        jrinterp.loadGrammarParseSourceFile(env, grammarFilePath, sourceFilePath, startSymbol, encoding)
+        jrinterp.convertParseTreeToAst(env)
+        jrinterp.setupCasebookStuff(env)
+        startTime = time.perf_counter()
+        jrinterp.taskRenderRun(env, AstTaskLatex())
+        renderSecs = time.perf_counter() - startTime
+    return [renderSecs, jrinterp.getRenderCache()]
+
+
+def benchmarkRenderCache(sourceFilePath):
+    jrprint("Render cache for {}..".format(os.path.basename(sourceFilePath)))
+    with tempfile.TemporaryDirectory() as renderCacheDir:
+        for label in ["cold", "warm"]:
+            [renderSecs, renderCache] = timeRenderWithCache(sourceFilePath, renderCacheDir)
+            jrprint("  {}: render took {:.4f}s. {}".format(label, renderSecs, renderCache.getStatsString()))
+    return 0
+
+
+
+
+
+
+
+
+def timeRender(sourceFilePath, flagParallel, workerCount):
+    # build, rendering serially or in parallel; return [renderSecs, renderOutput]
+    context = JrAstContext(False, True)
+    env = JrAstEnvironment(context, None)
+    jrinterp = JrInterpreterCasebook()
+    jrinterp.options["parallelRenderWorkers"] = workerCount
+    with contextlib.redirect_stdout(io.StringIO()):
+        jrinterp.loadGrammarParseSourceFile(env, grammarFilePath, sourceFilePath, startSymbol, encoding)
+        jrinterp.convertParseTreeToAst(env)
+        jrinterp.setupCasebookStuff(env)
+    renderOutput = io.StringIO()
+    with contextlib.redirect_stdout(renderOutput):
+        startTime = time.perf_counter()
+        jrinterp.taskRenderRun(env, AstTaskLatex(), flagParallel)
+        renderSecs = time.perf_counter() - startTime
+    return [renderSecs, stripLogBannerLines(renderOutput.getvalue())]
+
+
+def stripLogBannerLines(text):
+    # the log file banner (and log directory notice) is printed by whichever run happens to open the log first, so it is not part of what the render printed
+    return "".join([line for line in text.splitlines(True) if (not line.startswith(">LOGGING TO:")) and (not line.startswith("creating directory:"))])
+
+
+def benchmarkParallelRender(sourceFilePath, workerCount):
+    jrprint("Parallel render for {} ({} workers)..".format(os.path.basename(sourceFilePath), os.cpu_count() if (workerCount is None) else workerCount))
+    [serialSecs, serialOutput] = timeRender(sourceFilePath, False, workerCount)
+    [parallelSecs, parallelOutput] = timeRender(sourceFilePath, True, workerCount)
+    jrprint("  serial render took {:.3f}s, parallel {:.3f}s ({:.2f}x).".format(serialSecs, parallelSecs, serialSecs / parallelSecs))
+    if (serialOutput != parallelOutput):
+        jrprint("  ERROR: parallel render printed something different from serial render.", severity=jrfuncs.DefLogSeverityError)
+        return 1
+    return 0
+
+
+
+
+
+
+
+
+class LeadGenerator:
+    # emits (seeded) synthetic lead rows shaped like the geojson features HlApi loads, and misspelled queries for them
+    nameWords = ["acme", "bedding", "bros.", "cafe", "central", "deli", "diner", "empire", "fireproof", "garage", "grand", "hotel", "imperial", "laundry", "liberty", "lunch", "market", "metropolitan", "novelty", "park", "pharmacy", "royal", "shoe", "star", "supply", "tailor", "theater", "union", "warehouses", "works"]
+    lastNames = ["Abbott", "Baker", "Castillo", "Deverell", "Esposito", "Fischer", "Goldberg", "Hahn", "Ivanova", "Jackson", "Kowalski", "Lombardi", "Murphy", "Novak", "O'Brien", "Papadopoulos", "Quinn", "Rosen", "Schultz", "Tanaka"]
+    streets = ["Amsterdam Ave", "Broadway", "Central Park W.", "Columbus Ave", "Lexington Ave", "Madison Ave", "Park Ave", "Riverside Dr.", "W. 42nd St", "E. 23rd St", "W. 57th St", "Bowery", "Canal St", "Delancey St"]
+
+    def __init__(self, seed):
+        self.rand = random.Random(seed)
+
+    def generateRows(self, leadCount):
+        rand = self.rand
+        rows = []
+        for leadIndex in range(0, leadCount):
+            if (rand.random() < 0.3):
+                dName = "{}, {}".format(rand.choice(self.lastNames), rand.choice(self.lastNames))
+            else:
+                dName = " ".join([rand.choice(self.nameWords).title() for wordIndex in range(0, rand.randint(2, 4))])
+            address = "{} {}".format(rand.randint(1, 2999), rand.choice(self.streets))
+            properties = {"lead": "{}-{}".format(rand.randint(1, 9), leadIndex), "dName": dName, "address": address}
+            rows.append({"type": "Feature", "properties": properties, "geometry": {"type": "Point", "coordinates": [rand.uniform(980000, 1000000), rand.uniform(190000, 240000)]}})
+        return rows
+
+    def generateQueries(self, rows, queryCount):
+        # names and addresses of random rows, with a couple of typos each
+        queries = []
+        for queryIndex in range(0, queryCount):
+            properties = self.rand.choice(rows)["properties"]
+            queries.append(self.misspell(properties["dName"] if (self.rand.random() < 0.7) else properties["address"]))
+        return queries
+
+    def misspell(self, text):
+        rand = self.rand
+        chars = list(text)
+        for typoIndex in range(0, 2):
+            index = rand.randrange(0, len(chars))
+            if (rand.random() < 0.5):
+                del chars[index]
+            else:
+                chars[index] = rand.choice("abcdefghijklmnopqrstuvwxyz")
+        return "".join(chars)
+
+
+def benchmarkHlApiSimilar(leadCount, queryCount):
+    # imported here since hlapi is not needed by the other benchmarks
+    from lib.hlapi.hlapi import HlApi, HlLeadTable, makeLeadSegment
+    generator = LeadGenerator(hlApiGeneratorSeed)
+    rows = generator.generateRows(leadCount)
+    queries = generator.generateQueries(rows, queryCount)
+    hlapi = HlApi(None)
+    hlapi.leadTable = HlLeadTable({"synthetic": makeLeadSegment(rows)})
+    startTime = time.perf_counter()
+    hlapi.resetLeadIndexes()
+    for indexName in ["leadId", "leadIdNormalized", "nameOrAddress", "nameOrAddressNormalized"]:
+        hlapi.getLeadIndex(indexName)
+    hlapi.getSimilarIndex()
+    jrprint("Built lead indexes for {} synthetic leads in {:.3f}s.".format(leadCount, time.perf_counter() - startTime))
+
+    indexedResults = []
+    startTime = time.perf_counter()
+    for query in queries:
+        indexedResults.append(hlapi.findLeadRowSimilarByNameOrAddress(query))
+    indexedSecs = (time.perf_counter() - startTime) / len(queries)
+    jrprint("  trigram index: {:.2f}ms per query ({} queries).".format(indexedSecs * 1000.0, len(queries)))
+
+    # (a batch only looks up each distinct query once, so we time one of distinct queries)
+    startTime = time.perf_counter()
+    batchResults = hlapi.findLeadRowsSimilarByNameOrAddress(queries)
+    batchSecs = (time.perf_counter() - startTime) / len(queries)
+    agreeCount = sum([1 for [batchResult, indexedResult] in zip(batchResults, indexedResults) if (batchResult == indexedResult)])
+    jrprint("  batch: {:.2f}ms per query ({} queries, {} distinct); same result as one at a time for {} of them.".format(batchSecs * 1000.0, len(queries), len(set(queries)), agreeCount))
+
+    scanCount = min(hlApiScanQueryCount, len(queries))
+    agreeCount = 0
+    startTime = time.perf_counter()
+    for queryIndex in range(0, scanCount):
+        scanResult = hlapi.findLeadRowSimilarByNameOrAddressScan(queries[queryIndex])
+        if (scanResult[0] == indexedResults[queryIndex][0]):
+            agreeCount += 1
+    if (scanCount > 0):
+        scanSecs = (time.perf_counter() - startTime) / scanCount
+        jrprint("  full scan: {:.2f}ms per query ({} queries); same best row as the index for {} of them.".format(scanSecs * 1000.0, scanCount, agreeCount))
+    return 0
+
+
+def timeLoadLeads(dataDir, options, hlapiClass=None):
+    # return [loadSecs, hlapi]
+    from lib.hlapi.hlapi import HlApi
+    hlapi = (HlApi if (hlapiClass is None) else hlapiClass)(dataDir, options)
+    with contextlib.redirect_stdout(io.StringIO()):
+        startTime = time.perf_counter()
+        hlapi.loadLeads()
+        loadSecs = time.perf_counter() - startTime
+    return [loadSecs, hlapi]
+
+
+def writeSyntheticLeadDataDir(dataDir, rows):
+    # write rows as hlApiLeadFileCount geojson lead files in dataDir, along with an unusedLeads.csv of their lead ids; return the lead file paths
+    # real lead files have a couple dozen properties per row, most of which we don't use
+    for row in rows:
+        row["properties"].update({"ptype": "place", "pcat": "", "ocat": None, "jregion": "LW", "blockid": 20234, "locid": 416, "label": None, "bldid": -1, "offmap": 0, "comment": None, "apt": "", "timestamp": 1718342012.517933, "auto": "0", "hint": "", "jhidden": 0})
+    os.makedirs(dataDir + "/leads")
+    leadFilePaths = []
+    for fileIndex in range(0, hlApiLeadFileCount):
+        leadFilePath = dataDir + "/leads/places_{}.json".format(fileIndex)
+        with open(leadFilePath, "w", encoding="utf-8") as leadFile:
+            json.dump({"type": "FeatureCollection", "features": rows[fileIndex::hlApiLeadFileCount]}, leadFile)
+        leadFilePaths.append(leadFilePath)
+    with open(dataDir + "/unusedLeads.csv", "w", encoding="utf-8") as csvFile:
+        csvFile.write(",lead\n" + "".join(["{},{}\n".format(rowIndex, row["properties"]["lead"]) for rowIndex, row in enumerate(rows)]))
+    return leadFilePaths
+
+
+def benchmarkHlApiLeadCache(leadCount):
+    from lib.hlapi.hlapi import HlLeadTable, makeLeadSegment
+    generator = LeadGenerator(hlApiGeneratorSeed)
+    rows = generator.generateRows(leadCount)
+    jrprint("Lead cache for {} synthetic leads in {} lead files..".format(leadCount, hlApiLeadFileCount))
+    with tempfile.TemporaryDirectory() as dataDir:
+        leadFilePaths = writeSyntheticLeadDataDir(dataDir, rows)
+        options = {"leadCacheFilePath": dataDir + "/leadCache.pickle"}
+
+        [jsonSecs, hlapi] = timeLoadLeads(dataDir, {"disableLeadCache": True})
+        jrprint("  without lead cache: {:.3f}s.".format(jsonSecs))
+        [coldSecs, hlapi] = timeLoadLeads(dataDir, options)
+        jrprint("  cold lead cache: {:.3f}s (cache file is {} bytes).".format(coldSecs, os.path.getsize(options["leadCacheFilePath"])))
+        [warmSecs, hlapi] = timeLoadLeads(dataDir, options)
+        jrprint("  warm lead cache: {:.3f}s ({:.1f}x faster than without).".format(warmSecs, jsonSecs / warmSecs))
+        # a new modification time is enough to recompile a file
+        os.utime(leadFilePaths[0], ns=(time.time_ns(), time.time_ns()))
+        [changedSecs, hlapi] = timeLoadLeads(dataDir, options)
+        jrprint("  after changing 1 lead file: {:.3f}s.".format(changedSecs))
+        # (lookup indexes are built on first use, so time the first lookup too)
+        startTime = time.perf_counter()
+        hlapi.findLeadRowByLeadId(rows[-1]["properties"]["lead"])
+        jrprint("  first lookup by lead id (builds its index): {:.3f}s.".format(time.perf_counter() - startTime))
+
+        # memory held by what we used to keep (the parsed features) vs the lead table
+        tracemalloc.start()
+        startSize = tracemalloc.get_traced_memory()[0]
+        features = []
+        for leadFilePath in leadFilePaths:
+            with open(leadFilePath, "r", encoding="utf-8") as leadFile:
+                features.extend(json.load(leadFile)["features"])
+        featureBytes = tracemalloc.get_traced_memory()[0] - startSize
+        segment = makeLeadSegment(features)
+        features = None
+        startSize = tracemalloc.get_traced_memory()[0]
+        leadTable = HlLeadTable({"synthetic": segment})
+        tableBytes = tracemalloc.get_traced_memory()[0] - startSize
+        tracemalloc.stop()
+        jrprint("  memory: geojson features {:.1f}MB, lead table {:.1f}MB.".format(featureBytes / 1000000.0, tableBytes / 1000000.0))
+    return 0
+
+
+def benchmarkHlApiSqlite(leadCount, queryCount):
+    from lib.hlapi.hlapi import HlApi
+    from lib.hlapi.hlapisqlite import HlApiSqlite
+    generator = LeadGenerator(hlApiGeneratorSeed)
+    rows = generator.generateRows(leadCount)
+    queries = generator.generateQueries(rows, queryCount)
+    leadIds = [generator.rand.choice(rows)["properties"]["lead"] for queryIndex in range(0, queryCount)]
+    jrprint("Lead database for {} synthetic leads..".format(leadCount))
+    with tempfile.TemporaryDirectory() as dataDir:
+        writeSyntheticLeadDataDir(dataDir, rows)
+        options = {"leadCacheFilePath": dataDir + "/leadCache.pickle", "leadDatabaseFilePath": dataDir + "/leads.sqlite"}
+        [buildSecs, hlapiSqlite] = timeLoadLeads(dataDir, options, HlApiSqlite)
+        jrprint("  building the database took {:.3f}s ({} bytes).".format(buildSecs, os.path.getsize(options["leadDatabaseFilePath"])))
+        [openSecs, hlapiSqlite] = timeLoadLeads(dataDir, options, HlApiSqlite)
+        [loadSecs, hlapi] = timeLoadLeads(dataDir, options, HlApi)
+        jrprint("  opening it took {:.4f}s (loading leads into memory, from a warm lead cache, {:.4f}s).".format(openSecs, loadSecs))
+
+        for [label, sqliteFunction, memoryFunction, keys] in [["lookup by lead id", hlapiSqlite.findLeadRowByLeadId, hlapi.findLeadRowByLeadId, leadIds], ["similar name or address", hlapiSqlite.findLeadRowSimilarByNameOrAddress, hlapi.findLeadRowSimilarByNameOrAddress, queries]]:
+            timings = []
+            results = []
+            for function in [sqliteFunction, memoryFunction]:
+                startTime = time.perf_counter()
+                results.append([function(key) for key in keys])
+                timings.append((time.perf_counter() - startTime) / len(keys))
+            agreeCount = sum([1 for [sqliteResult, memoryResult] in zip(results[0], results[1]) if (sqliteResult == memoryResult)])
+            jrprint("  {}: sqlite {:.2f}ms, in memory {:.2f}ms per query ({} queries, including building in memory indexes); same row for {} of them.".format(label, timings[0] * 1000.0, timings[1] * 1000.0, len(keys), agreeCount))
+        # and the similar name lookups again, as one batch
+        timings = []
+        agreeCounts = []
+        for [hlapiBackend, backendResults] in [[hlapiSqlite, results[0]], [hlapi, results[1]]]:
+            startTime = time.perf_counter()
+            batchResults = hlapiBackend.findLeadRowsSimilarByNameOrAddress(queries)
+            timings.append((time.perf_counter() - startTime) / len(queries))
+            agreeCounts.append(sum([1 for [batchResult, result] in zip(batchResults, backendResults) if (batchResult == result)]))
+        jrprint("  similar name or address in one batch: sqlite {:.2f}ms, in memory {:.2f}ms per query; same row as one at a time for {} and {} of them.".format(timings[0] * 1000.0, timings[1] * 1000.0, agreeCounts[0], agreeCounts[1]))
+    return 0
+
+
+
+
+
+
+
+
+def main():
+    if (len(sys.argv) < 2) or (sys.argv[1] not in ["memory", "expressions", "lexer", "phases", "scaling", "rendercache", "parallel", "hlapi", "leadcache", "leaddb"]):
+        jrprint("usage: python benchmark.py memory [sourceFilePath]")
+        jrprint("       python benchmark.py expressions [evalCount]")
+        jrprint("       python benchmark.py lexer [sourceFilePath ...]")
+        jrprint("       python benchmark.py phases [sourceFilePath] [traceJsonFilePath]")
+        jrprint("       python benchmark.py scaling [check|save] [scale ...]")
+        jrprint("       python benchmark.py rendercache [sourceFilePath]")
+        jrprint("       python benchmark.py parallel [sourceFilePath] [workerCount]")
+        jrprint("       python benchmark.py hlapi [leadCount] [queryCount]")
+        jrprint("       python benchmark.py leadcache [leadCount]")
+        jrprint("       python benchmark.py leaddb [leadCount] [queryCount]")
+        return 2
+    command = sys.argv[1]
+
+    if (command == "memory"):
+        sourceFilePath = sys.argv[2] if (len(sys.argv) > 2) else defaultSourceFilePath
+        return benchmarkMemory(sourceFilePath)
+    if (command == "expressions"):
+        evalCount = int(sys.argv[2]) if (len(sys.argv) > 2) else defaultExpressionEvalCount
+        return benchmarkExpressions(evalCount)
+    if (command == "lexer"):
+        sourceFilePaths = sys.argv[2:] if (len(sys.argv) > 2) else sampleSourceFilePaths
+        return benchmarkLexer(sourceFilePaths)
+    if (command == "phases"):
+        sourceFilePath = sys.argv[2] if (len(sys.argv) > 2) else defaultSourceFilePath
+        traceFilePath = sys.argv[3] if (len(sys.argv) > 3) else "logs/" + os.path.splitext(os.path.basename(sourceFilePath))[0] + "_trace.json"
+        return benchmarkPhases(sourceFilePath, traceFilePath)
+    if (command == "scaling"):
+        scalingCommand = sys.argv[2] if (len(sys.argv) > 2) else "check"
+        scales = [int(scale) for scale in sys.argv[3:]] if (len(sys.argv) > 3) else defaultScalingScales
+        return benchmarkScaling(scalingCommand, scales)
+    if (command == "rendercache"):
+        sourceFilePath = sys.argv[2] if (len(sys.argv) > 2) else defaultSourceFilePath
+        return benchmarkRenderCache(sourceFilePath)
+    if (command == "parallel"):
+        sourceFilePath = sys.argv[2] if (len(sys.argv) > 2) else defaultSourceFilePath
+        workerCount = int(sys.argv[3]) if (len(sys.argv) > 3) else None
+        return benchmarkParallelRender(sourceFilePath, workerCount)
+    if (command == "hlapi"):
+        leadCount = int(sys.argv[2]) if (len(sys.argv) > 2) else defaultHlApiLeadCount
+        queryCount = int(sys.argv[3]) if (len(sys.argv) > 3) else defaultHlApiQueryCount
+        return benchmarkHlApiSimilar(leadCount, queryCount)
+    if (command == "leadcache"):
+        leadCount = int(sys.argv[2]) if (len(sys.argv) > 2) else defaultHlApiLeadCount
+        return benchmarkHlApiLeadCache(leadCount)
+    if (command == "leaddb"):
+        leadCount = int(sys.argv[2]) if (len(sys.argv) > 2) else defaultHlApiLeadCount
+        queryCount = int(sys.argv[3]) if (len(sys.argv) > 3) else defaultHlApiQueryCount
+        return benchmarkHlApiSqlite(leadCount, queryCount)
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
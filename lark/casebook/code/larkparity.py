@@ -0,0 +1,142 @@
+# parity checker for the LALR variant of our grammar (grammar/casebook_grammar_lalr.lark)
+# parses every source file in the grammar directory with both the earley grammar and the lalr variant, and compares the trees (rules, tokens and source positions)
+# a file that the lalr grammar refuses to parse is not a failure (the engine will fall back to earley for it), but a file that it parses DIFFERENTLY is
+#
+# (tests/test_larkparity.py runs the same comparison on small sources and on random edits of them, see makeMutatedSources)
+#
+# usage: python larkparity.py [grammarFilePath] [sourceFilePath ...]
+
+
+# parser engine
+from lib.jrlark import jrlark
+from lark import UnexpectedInput
+
+# python modules
+import sys
+import os
+import time
+import random
+
+# my libs
+from lib.jr import jrfuncs
+from lib.jr.jrfuncs import jrprint
+
+
+
+
+
+# default grammar file and sources
+baseName = "casebook"
+rootDirectory = os.path.dirname(os.path.realpath(__file__))
+grammarDirectory = rootDirectory + "/grammar"
+grammarFilePath = grammarDirectory + "/" + baseName + "_grammar.lark"
+
+# options
+encoding = "utf-8"
+startSymbol = "start"
+flagCompareMeta = True
+
+# what makeMutatedSources inserts; mostly the places where the earley grammar is ambiguous (whitespace, newlines, comments, braces, headers)
+mutationSnippets = ["$", "$f()", "$ g()", "//c\n", "/*c*/", " ", "\t", "\n", "\n\n", "\r\n", "{", "}", "{ }", "#", "## ", "### x\n", ":", ",", "(", ")", "$(a=1)", "\"s\"", "“q”", "<<<r>>>", "$if (a): b\n", "$if (x): {y}", "$else: {c}", "x", "=", " // t\n"]
+
+
+
+
+
+def findSourceFilePaths(directoryPath):
+    # every file in the grammar directory that isn't a grammar
+    filePaths = []
+    for fileName in sorted(os.listdir(directoryPath)):
+        filePath = directoryPath + "/" + fileName
+        if (os.path.isfile(filePath)) and (not fileName.endswith(".lark")):
+            filePaths.append(filePath)
+    return filePaths
+
+
+
+def calcParityDifferences(jrparser, sourceText):
+    # return the differences between the earley and lalr trees for sourceText (empty if they match), or None if the lalr grammar refuses it
+    try:
+        treeLalr = jrparser.parseTextWithParser(sourceText, startSymbol, "lalr")
+    except UnexpectedInput:
+        return None
+    treeEarley = jrparser.parseTextWithParser(sourceText, startSymbol, "earley")
+    return jrlark.compareParseTrees(treeEarley, treeLalr, flagCompareMeta)
+
+
+
+def makeMutatedSources(sourceTexts, count, randomSeed):
+    # deterministic small random edits (inserting bits of casebook syntax, or deleting a few characters) of sourceTexts, for finding inputs the two grammars parse differently
+    rng = random.Random(randomSeed)
+    mutatedTexts = []
+    for index in range(count):
+        text = rng.choice(sourceTexts)
+        for editIndex in range(rng.randint(1, 3)):
+            pos = rng.randint(0, len(text))
+            if (rng.random() < 0.75):
+                text = text[:pos] + rng.choice(mutationSnippets) + text[pos:]
+            else:
+                text = text[:pos] + text[pos+rng.randint(1, 4):]
+        mutatedTexts.append(text)
+    return mutatedTexts
+
+
+
+def checkParity(jrparser, sourceFilePath):
+    # return True if the file parses the same (or is refused by the lalr grammar)
+    sourceText = jrfuncs.loadTxtFromFile(sourceFilePath, True, encoding=encoding)
+    fileName = os.path.basename(sourceFilePath)
+
+    start_time = time.perf_counter()
+    try:
+        treeLalr = jrparser.parseTextWithParser(sourceText, startSymbol, "lalr")
+    except UnexpectedInput as u:
+        jrprint("{}: REFUSED by lalr grammar at line {} column {} (engine will fall back to earley).".format(fileName, u.line, u.column), severity=jrfuncs.DefLogSeverityWarning)
+        return True
+    lalrTime = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    treeEarley = jrparser.parseTextWithParser(sourceText, startSymbol, "earley")
+    earleyTime = time.perf_counter() - start_time
+
+    differences = jrlark.compareParseTrees(treeEarley, treeLalr, flagCompareMeta)
+    if (len(differences) > 0):
+        jrprint("{}: MISMATCH between earley (first) and lalr (second) trees:".format(fileName), severity=jrfuncs.DefLogSeverityError)
+        for difference in differences:
+            jrprint("  {}".format(difference))
+        return False
+
+    jrprint("{}: ok (earley {}, lalr {}).".format(fileName, jrfuncs.niceElapsedTimeStr(earleyTime), jrfuncs.niceElapsedTimeStr(lalrTime)))
+    return True
+
+
+
+
+def main():
+    global grammarFilePath
+    sourceFilePaths = None
+    if (len(sys.argv) > 1):
+        grammarFilePath = sys.argv[1]
+    if (len(sys.argv) > 2):
+        sourceFilePaths = sys.argv[2:]
+    else:
+        sourceFilePaths = findSourceFilePaths(os.path.dirname(grammarFilePath))
+
+    jrparser = jrlark.JrParserEngineLark()
+    jrparser.loadGrammarFileFromPath(None, grammarFilePath, encoding)
+    if (jrparser.grammarTextLalr is None):
+        jrprint("ERROR: no lalr variant of grammar found at '{}'.".format(jrparser.calcLalrGrammarFilePath(grammarFilePath)), severity=jrfuncs.DefLogSeverityError)
+        return 2
+
+    failCount = 0
+    for sourceFilePath in sourceFilePaths:
+        if (not checkParity(jrparser, sourceFilePath)):
+            failCount += 1
+
+    jrprint("Parity check finished: {} of {} files mismatched.".format(failCount, len(sourceFilePaths)))
+    return 1 if (failCount > 0) else 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
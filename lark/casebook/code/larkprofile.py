@@ -0,0 +1,94 @@
+# ambiguity and hot rule profiler for the earley grammar (grammar/casebook_grammar.lark)
+# parses a source file asking lark for the full parse forest (rather than letting it silently resolve ambiguities), and reports, per grammar rule:
+#   chart items (earley items created for the rule), estimated time, forest nodes, and ambiguous forest nodes (and the source lines where they happen)
+# along with the source lines where the parser spends the most time
+# prints ranked tables and writes the full profile as json
+#
+# usage: python larkprofile.py [sourceFilePath] [jsonOutputFilePath]
+#   json output defaults to logs/<sourceName>_grammarprofile.json
+
+
+# parser engine
+from lib.jrlark import jrlark
+
+# python modules
+import sys
+import os
+import json
+
+# my libs
+from lib.jr import jrfuncs
+from lib.jr.jrfuncs import jrprint
+
+
+
+
+
+# default grammar file and source
+baseName = "casebook"
+rootDirectory = os.path.dirname(os.path.realpath(__file__))
+grammarDirectory = rootDirectory + "/grammar"
+grammarFilePath = grammarDirectory + "/" + baseName + "_grammar.lark"
+defaultSourceFilePath = grammarDirectory + "/wrongbook_partial." + baseName
+defaultJsonDirectory = rootDirectory + "/logs"
+
+# options
+encoding = "utf-8"
+startSymbol = "start"
+topRuleCount = 25
+topLineCount = 15
+
+
+
+
+
+def printProfile(profile):
+    jrprint("Earley parse: {:.2f}s, {} characters, {} chart items, {} forest nodes, {} ambiguous.".format(profile["parseSecs"], profile["characters"], profile["chartItems"], profile["forestNodes"], profile["ambiguousNodes"]))
+
+    jrprint("")
+    jrprint("Top {} rules by chart items:".format(topRuleCount))
+    jrprint("  {:<40} {:>10} {:>9} {:>10} {:>9} {:>9}  {}".format("rule", "items", "estSecs", "nodes", "ambig", "extra", "hot lines (ambiguous, else items)"))
+    for rule in profile["rules"][0:topRuleCount]:
+        hotLines = rule["topAmbiguousLines"] if (len(rule["topAmbiguousLines"]) > 0) else rule["topChartLines"]
+        jrprint("  {:<40} {:>10} {:>9.3f} {:>10} {:>9} {:>9}  {}".format(rule["rule"][0:40], rule["chartItems"], rule["estSecs"], rule["forestNodes"], rule["ambiguousNodes"], rule["extraDerivations"], ", ".join([str(line) for line in hotLines])))
+
+    ambiguousRules = [rule for rule in profile["rules"] if (rule["ambiguousNodes"] > 0)]
+    ambiguousRules.sort(key=lambda rule: -rule["ambiguousNodes"])
+    jrprint("")
+    jrprint("Ambiguous rules ({}):".format(len(ambiguousRules)))
+    for rule in ambiguousRules[0:topRuleCount]:
+        jrprint("  {:<40} {:>9} ambiguous nodes ({} extra derivations) at lines {}".format(rule["rule"][0:40], rule["ambiguousNodes"], rule["extraDerivations"], ", ".join([str(line) for line in rule["topAmbiguousLines"]])))
+
+    jrprint("")
+    jrprint("Top {} source lines by time:".format(topLineCount))
+    jrprint("  {:>6} {:>9} {:>10} {:>7}  {}".format("line", "secs", "items", "ambig", "text"))
+    for line in profile["lines"][0:topLineCount]:
+        jrprint("  {:>6} {:>9.3f} {:>10} {:>7}  {}".format(line["line"], line["secs"], line["chartItems"], line["ambiguousNodes"], line["text"].strip()[0:60]))
+
+
+
+def main():
+    sourceFilePath = sys.argv[1] if (len(sys.argv) > 1) else defaultSourceFilePath
+    jsonFilePath = sys.argv[2] if (len(sys.argv) > 2) else defaultJsonDirectory + "/" + os.path.splitext(os.path.basename(sourceFilePath))[0] + "_grammarprofile.json"
+
+    jrparser = jrlark.JrParserEngineLark()
+    jrparser.loadGrammarFileFromPath(None, grammarFilePath, encoding)
+    sourceText = jrfuncs.loadTxtFromFile(sourceFilePath, True, encoding=encoding)
+
+    jrprint("Profiling earley parse of {}..".format(os.path.basename(sourceFilePath)))
+    profile = jrparser.profileText(None, sourceText, startSymbol)
+    profile["source"] = sourceFilePath
+    profile["grammar"] = grammarFilePath
+    printProfile(profile)
+
+    jrfuncs.createDirForFullFilePathIfMissing(jsonFilePath)
+    with open(jsonFilePath, "w", encoding=encoding) as f:
+        json.dump(profile, f, indent=1)
+    jrprint("")
+    jrprint("Wrote full profile to {}.".format(jsonFilePath))
+    return 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -452,11 +452,13 @@ def funcDeclareConst(rmode, env, astloc, args, targets):
 
 
 def funcSet(rmode, env, astloc, args, targets):
-    varName = args["var"].getWrappedExpect(AstValIdentifier)
+    # we pass the identifier itself (rather than its name) so it can remember where its variable lives
+    var = args["var"]
+    var.verifyType(AstValIdentifier)
     value = args["val"]
     #
     if (rmode == DefRmodeRun):
-        env.setEnvValue(astloc, varName, value, True)
+        env.setEnvValueForIdentifier(astloc, var, value, True)
     else:
         raise makeJriException("In function funcSet but in rmode!= run; do not know what to do.", astloc)
 
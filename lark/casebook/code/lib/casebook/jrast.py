@@ -8,10 +8,16 @@ from .jrastutilclasses import *
 from .jrastfuncs import *
 from .jrastvals import *
 from .jriexception import *
+from .jrrendercache import JrRenderCacheTracker
+from .jrparallelrender import JrParallelRenderWriteTracker, iterateParallelLeadRenders, reportParallelRenderWrites
 
 # my libs
 from lib.jr import jrfuncs
 from lib.jr.jrfuncs import jrprint
+from lib.jr.jrprofiler import DefProfileCategoryEntry
+
+# python modules
+import operator
 
 
 # other defines
@@ -77,6 +83,8 @@ DefSpecialEntryIdsAlwaysRun = [DefEntryIdOptions, DefEntryIdSetup, DefEntryIdCov
 
 # root
 class JrAstRoot (JrAst):
+    __slots__ = ("prelimaryMatter", "endMatter", "rawSourceDict", "rawSourceLineIndex", "entries", "entryReuseTracker")
+
     def __init__(self):
         super().__init__(None, None)
         #
@@ -84,8 +92,11 @@ class JrAstRoot (JrAst):
         self.endMatter = None
         #
         self.rawSourceDict = None
+        self.rawSourceLineIndex = None
         #
         self.entries = JrAstEntryChildHelper(None, self)
+        # remembers which entries came from which parse tree nodes, so that we can reuse them when re-converting after an incremental parse
+        self.entryReuseTracker = None
 
 
 
@@ -102,16 +113,45 @@ class JrAstRoot (JrAst):
         env.loadFuncsFromModule(None, cbfuncs_core)
 
 
+    def __getstate__(self):
+        # for ast snapshots (see JrInterpreterCasebook.saveAstSnapshot) we leave out the raw source (the loader already has it and calls setRawSourceDict) and the incremental parse bookkeeping
+        slotState = {"sloc": self.sloc, "parentp": self.parentp, "entries": self.entries, "prelimaryMatter": self.prelimaryMatter, "endMatter": self.endMatter}
+        slotState["rawSourceDict"] = None
+        slotState["rawSourceLineIndex"] = None
+        slotState["entryReuseTracker"] = None
+        return (None, slotState)
+
+
     def setRawSourceDict(self, rawSourceDict):
         # store raw source for reporting errors
         self.rawSourceDict = rawSourceDict
+        # and index its lines once now, so that each error we report can find its source line quickly
+        self.rawSourceLineIndex = JrSourceLineIndex(rawSourceDict["text"])
+
+    def getRawSourceDict(self):
+        return self.rawSourceDict
+
+    def calcRawSourceHighlightedLineDict(self, startPos, endPos):
+        if (self.rawSourceLineIndex is None):
+            return {}
+        locDict = self.rawSourceLineIndex.extractHighlightedSourceLineAtPos(startPos, endPos)
+        if (locDict is None):
+            return None
+        # add path to return
+        locDict["path"] = self.rawSourceDict["path"]
+        return locDict
+
+
+    def releaseParseTreeReferences(self):
+        # once converted we hold nothing from the parse tree except the incremental parse bookkeeping (which maps parse nodes to entries); dropping it lets the parse tree be freed
+        self.entryReuseTracker = None
 
 
     def convertParseTreeToAst(self, env, parseTree):
         # given a LARK parse tree, convert it into OUR AST format
 
         # we go through a process of restructuring the parse tree to build a kind of AST (syntax tree) using standard python dictionaries
-        # ATTN: can we use visitor/transform helper utilities from lark to do this all in a nicer way?
+        # the header and body of each entry are converted by a lark Transformer (see jrasttransformer.py); here we just organize the entries
 
         # walk the parse tree and build out our itree hierarchy which organizes the parse tree by section -> child -> subchild
         # but all the BODY's of entries (and options) remained in parse tree form, just reorganized into our dictionary hierarchy
@@ -119,13 +159,22 @@ class JrAstRoot (JrAst):
 
         # Note we need env here so that we can pass to convertTopLevelItemStoreAsChild for error handling
 
+        # we may be called again after an incremental re-parse, so we always start with a fresh collection of entries
+        # but any entry whose parse tree node is the very same one we converted last time (the incremental parser hands back unchanged entry nodes) is reused instead of re-converted
+        self.prelimaryMatter = None
+        self.endMatter = None
+        self.entries = JrAstEntryChildHelper(None, self)
+        entryReuseTracker = JrAstEntryReuseTracker(self.entryReuseTracker)
+
         # walk the children at root, which should be entries
         pchildren = parseTree.children
         for pchild in pchildren:
-            self.convertTopLevelItemStoreAsChild(env, pchild)
+            self.convertTopLevelItemStoreAsChild(env, pchild, entryReuseTracker)
+
+        self.entryReuseTracker = entryReuseTracker
 
 
-    def convertTopLevelItemStoreAsChild(self, env, pnode):
+    def convertTopLevelItemStoreAsChild(self, env, pnode, entryReuseTracker):
         # top level can only be preliminary_matter, end_matter, or an entry
         # Note we need env here so that we can pass to convertEntryAddMergeChildAst
         rule = getParseNodeRuleNameSmart(pnode)
@@ -134,7 +183,7 @@ class JrAstRoot (JrAst):
         elif (rule == JrCbLarkRule_end_matter):
             self.endMatter = self.convertGenericPnodeContents(pnode)
         elif (rule in [JrCbLarkRule_level1_entry, JrCbLarkRule_overview_level1_entry]):
-            self.entries.convertEntryAddMergeChildAst(env, pnode, 1)
+            self.entries.convertEntryAddMergeChildAst(env, pnode, 1, entryReuseTracker)
         else:
             # this shouldn't happen as parser should catch it
             raise makeJriException("Uncaught syntax error; expected top level item to be from {}.".format([JrCbLarkRule_preliminary_matter, JrCbLarkRule_end_matter, JrCbLarkRule_level1_entry, JrCbLarkRule_overview_level1_entry]), pnode)
@@ -143,17 +192,29 @@ class JrAstRoot (JrAst):
 
 
 
-    def taskRenderRun(self, env, task):
+    def bindFunctionCalls(self, env):
+        # bind all function call sites to the functions they call (see JrAstFunctionCall.bindFunction); do this after functions are loaded into env
+        for child in self.entries.childList:
+            child.bindFunctionCalls(env)
+
+
+
+    def taskRenderRun(self, env, task, flagParallel=False, workerCount=None):
         # when "run" (interpretting) casebook code, functions may behave differently based on the TARGET OUTPUT
         # that is, we may be targetting latex, html, etc; and the FUNCTIONS may need to know that
         # we accomplish this with the use of some global variables/constants
+        # flagParallel renders level 2 entries in workerCount worker processes (None means one per cpu); see renderRunParallel
 
-        jrprint("Running task {}..".format(task.getTaskId()))
+        if (env.isTracing(DefTraceCategoryRun)):
+            jrprint("Running task {}..".format(task.getTaskId()))
         #
         env.setTask(task)
         #
         # then call default run
-        self.renderRun(task.getRmode(), env)
+        if (flagParallel):
+            self.renderRunParallel(task.getRmode(), env, workerCount)
+        else:
+            self.renderRun(task.getRmode(), env)
 
 
     def renderRun(self, rmode, env):
@@ -170,6 +231,49 @@ class JrAstRoot (JrAst):
                 child.renderRun(rmode, env)
 
 
+    def renderRunParallel(self, rmode, env, workerCount):
+        # like renderRun, but level 2 entries (leads) are rendered in a pool of worker processes (see jrparallelrender.py)
+        # the special always-run entries are run first (here), to set up global state; each worker then gets a frozen snapshot of the env, so leads never see each other's changes to it
+        # level 1 entries (sections) render their own bodies here while the workers run, and each section's leads are merged back in childList order: their output is replayed, and what rendering changed on them is applied to our copies
+        # declarations and assignments made by anything after the snapshot are reported as warnings, since entries rendered in parallel can't see them
+        sections = []
+        for child in self.entries.childList:
+            if (child.calcIsSpecialEntryAlwaysRun()):
+                child.renderRun(DefRmodeRun, env)
+            else:
+                sections.append(child)
+
+        leadPaths = []
+        for [sectionIndex, child] in enumerate(self.entries.childList):
+            if (not child.calcIsSpecialEntryAlwaysRun()):
+                leadPaths += [[sectionIndex, leadIndex] for leadIndex in range(len(child.entries.childList))]
+        if (len(leadPaths) < 2):
+            # not worth starting up processes
+            for section in sections:
+                section.renderRun(rmode, env)
+            return
+
+        leadResults = iterateParallelLeadRenders(self, env, rmode, leadPaths, workerCount)
+        context = env.getContext()
+        for section in sections:
+            tracker = JrParallelRenderWriteTracker()
+            previousTracker = context.getEnvTracker()
+            context.setEnvTracker(tracker)
+            try:
+                section.renderRunOwn(rmode, env)
+            finally:
+                context.setEnvTracker(previousTracker)
+            reportParallelRenderWrites(section, tracker.writes)
+
+            for lead in section.entries.childList:
+                leadResult = next(leadResults)
+                jrfuncs.replayLogCapture(leadResult["logRecords"])
+                lead.applyRenderResults(iter(leadResult["renderResults"]))
+                reportParallelRenderWrites(lead, leadResult["writes"])
+                if (leadResult["exception"] is not None):
+                    raise makeJriException("Runtime error rendering entry {} in parallel worker process: {}".format(lead.getDisplayIdLabel(), leadResult["exception"]), lead)
+
+
 
 
 
@@ -192,6 +296,8 @@ class JrAstRoot (JrAst):
 
 # entries (our main things)
 class JrAstEntry(JrAst):
+    __slots__ = ("level", "id", "label", "options", "bodyBlockSeqs", "autoId", "entries", "flagMerged")
+
     def __init__(self, sloc, parentp, level):
         super().__init__(sloc, parentp)
         self.level = level
@@ -205,6 +311,8 @@ class JrAstEntry(JrAst):
         self.autoId = None
         #
         self.entries = JrAstEntryChildHelper(self, self)
+        # set when another entry with the same id gets merged into us (which means we can't be reused as-is on re-conversion)
+        self.flagMerged = False
 
 
     def printDebug(self, depth):
@@ -249,8 +357,8 @@ class JrAstEntry(JrAst):
     def getLabel(self):
         return self.label
 
-    def setOptions(self, pnode):
-        self.options = JrAstArgumentList(pnode, self)
+    def setOptions(self, optionsArgList):
+        self.options = self.adoptChild(optionsArgList)
 
     def setAutoId(self, val):
         self.autoId = val
@@ -277,66 +385,10 @@ class JrAstEntry(JrAst):
         return defaultVal
 
 
-    def convertCoreFromPnode(self, pnode):
-        # Convery core from pnode to ast node, but NOT children (yet)
-        # make sure we got what we expected
-        verifyPNodeType(pnode, "adding entry children", [JrCbLarkRule_level1_entry, JrCbLarkRule_level2_entry, JrCbLarkRule_level3_entry, JrCbLarkRule_overview_level1_entry])
-
-        # first two children of node are head and body
-        pchildCount = len(pnode.children)
-        if (pchildCount<2):
-            raise makeJriException("Uncaught syntax error; expected first two children of parent entry to be header and body, but didn't find even these 2.", pnode)
-
-        # head
-        thisHeadPnode = pnode.children[0]
-        verifyPNodeType(thisHeadPnode, "processing entry head", [JrCbLarkRule_entry_header])
-        self.convertStoreHeaderInfo(thisHeadPnode)
-
-        # body (may be None)
-        thisBodyPnode = pnode.children[1]
-        verifyPNodeType(thisBodyPnode, "processing entry body", [JrCbLarkRule_entry_body])
-        self.convertAddBodyBlockSeq(thisBodyPnode)
-
-
-
-
-
-    def convertStoreHeaderInfo(self, pnode):
-        # process an entry header; this uses a parse tree grammar for specifying id, label, options
-        for pchild in pnode.children:
-            pchildValue = pchild.data.value
-            if (pchildValue in [JrCbLarkRule_entry_id_opt_label, JrCbLarkRule_overview_level1_id]):
-                for achild in pchild.children:
-                    achildValue = achild.data.value
-                    if (achildValue in [JrCbLarkRule_entry_id, JrCbLarkRule_overview_entry_id]):
-                        self.setId(getParseTreeChildLiteralToken(achild))
-                    elif (achildValue == JrCbLarkRule_entry_label):
-                        self.setLabel(getParseTreeChildString(achild))
-                    else:
-                       raise makeJriException("Uncaught syntax error; expected to find {}.".format([JrCbLarkRule_entry_id, JrCbLarkRule_overview_entry_id, JrCbLarkRule_entry_label]), pchild)
-            elif (pchildValue == JrCbLarkRule_entry_options):
-                # options come as an argument list which is child 0 of options; nothing else
-                optionsArgumentListNode = pchild.children[0]
-                self.setOptions(optionsArgumentListNode)
-            else:
-                # this shouldnt happen because parser should flag it
-                raise makeJriException("Uncaught syntax error; expected to find entry header element from {}.".format([JrCbLarkRule_entry_id_opt_label, JrCbLarkRule_overview_level1_id, JrCbLarkRule_entry_options]), pchild)
-
-
-    def convertAddBodyBlockSeq(self, node):
-        # just add the entire node as the body
-        bodyContent = node.children[0]
-        # find the block seq (may be None)
-        if (bodyContent is not None):
-            blockSeq = JrAstBlockSeq(bodyContent, self)
-            self.addAstBodyBlockSeq(blockSeq)
-
-
-
     def applyOptions(self, env, optionsArgList):
         if (self.options is None):
             # no options to set -- but we would like to call on empty args for default
-            optionsArgList = JrAstArgumentList(None, self)
+            optionsArgList = JrAstArgumentList(None, self, [], {})
         else:
             optionsArgList = self.options
 
@@ -360,6 +412,30 @@ class JrAstEntry(JrAst):
 
 
 
+    def collectRenderResults(self, resultList):
+        # append what rendering changes on us and our children entries (in preorder) to resultList, so that a render done in a worker process can be applied to the copy of us in the main process (see applyRenderResults)
+        resultList.append(self.autoId)
+        for child in self.entries.childList:
+            child.collectRenderResults(resultList)
+        return resultList
+
+    def applyRenderResults(self, resultIterator):
+        self.autoId = next(resultIterator)
+        for child in self.entries.childList:
+            child.applyRenderResults(resultIterator)
+
+
+
+    def bindFunctionCalls(self, env):
+        if (self.options is not None):
+            self.options.bindFunctionCalls(env)
+        for blockSeq in self.bodyBlockSeqs:
+            blockSeq.bindFunctionCalls(env)
+        for child in self.entries.childList:
+            child.bindFunctionCalls(env)
+
+
+
     def renderRun(self, rmode, env):
         # Entry run
         # Entries are where we collect and store output -- their children blocks do not need to store output long term
@@ -370,7 +446,22 @@ class JrAstEntry(JrAst):
         #
         # ATTN: TODO we need to pass a self pointer into a local environment/context so that functions invoked from us can reference us
 
-        jrprint("RenderRun ({}): {}".format(rmode, self.getRuntimeDebugDisplay(env)))
+        # our own options and body
+        self.renderRunOwn(rmode, env)
+
+        # CHILDREN ENTRIES (RECURSIVE CALL)
+        for child in self.entries.childList:
+            child.renderRun(rmode, env)
+
+
+    def renderRunOwn(self, rmode, env):
+        # render our options and body but not our children entries (see JrAstRoot.renderRunParallel, which renders children elsewhere)
+        if (env.isTracing(DefTraceCategoryRun)):
+            jrprint("RenderRun ({}): {}".format(rmode, self.getRuntimeDebugDisplay(env)))
+
+        # time our own body (children entries get their own spans)
+        profiler = env.getProfiler()
+        span = profiler.begin(self.id or self.label or self.autoId, DefProfileCategoryEntry)
 
         # we wrap this childs renderrunning in a try catch exception in case we want to catch exceptions as warnings
         try:
@@ -378,8 +469,7 @@ class JrAstEntry(JrAst):
             self.applyOptions(env, self.options)
 
             # BODY of this entry
-            for blockSeq in self.bodyBlockSeqs:
-                blockSeq.renderRun(rmode, env)
+            self.renderRunBody(rmode, env)
 
         except Exception as e:
             context = env.getContext()
@@ -387,15 +477,42 @@ class JrAstEntry(JrAst):
                 context.displayException(e)
             else:
                 raise e
+        finally:
+            profiler.end(span)
+
+
+    def renderRunBody(self, rmode, env):
+        # return the fragment rendered from our body blocks (one item per block seq); nothing uses it yet, since blocks don't return their output
+        # if the render cache is on, we skip running the body (returning the fragment recorded last time) when a previous render of the same source had no side effects and everything it read from the env is unchanged (see JrRenderCache)
+        context = env.getContext()
+        renderCache = context.getRenderCache()
+        # (we don't cache if something else is already tracking env access, e.g. a parallel render watching for writes)
+        if (renderCache is None) or (self.calcIsSpecialEntryAlwaysRun()) or (not renderCache.calcIsUsable(context)) or (context.getEnvTracker() is not None):
+            return [blockSeq.renderRun(rmode, env) for blockSeq in self.bodyBlockSeqs]
+
+        key = renderCache.calcEntryKey(self, env.getTask())
+        if (key is None):
+            return [blockSeq.renderRun(rmode, env) for blockSeq in self.bodyBlockSeqs]
+        [flagHit, fragment] = renderCache.lookup(key, env)
+        if (flagHit):
+            return fragment
+
+        # render, tracking what we read; if we raise, nothing is stored
+        tracker = JrRenderCacheTracker()
+        previousTracker = context.getEnvTracker()
+        context.setEnvTracker(tracker)
+        try:
+            fragment = [blockSeq.renderRun(rmode, env) for blockSeq in self.bodyBlockSeqs]
+        except Exception as e:
+            renderCache.noteUncacheable()
+            raise e
+        finally:
+            context.setEnvTracker(previousTracker)
+        renderCache.store(key, tracker, fragment)
+        return fragment
 
 
 
-        # CHILDREN ENTRIES (RECURSIVE CALL)
-        for child in self.entries.childList:
-            child.renderRun(rmode, env)
-        
-
-
 
 
 
@@ -425,12 +542,14 @@ class JrAstEntry(JrAst):
 
 
 class JrAstBlockSeq(JrAst):
-    def __init__(self, blockSeqPnode, parentp):
-        super().__init__(blockSeqPnode, parentp)
+    __slots__ = ("blocks",)
+
+    def __init__(self, sloc, parentp, blocks):
+        super().__init__(sloc, parentp)
         #
         self.blocks = []
-        #
-        self.addBlocksFromBlockSeqPnode(blockSeqPnode)
+        for block in blocks:
+            self.blocks.append(self.adoptChild(block))
     
     def printDebug(self, depth):
         # nice hierarchical tabbed pretty print
@@ -441,45 +560,9 @@ class JrAstBlockSeq(JrAst):
 
 
 
-    def addBlocksFromBlockSeqPnode(self, blockSeqPnode):
-        verifyPNodeType(blockSeqPnode, "block sequence", JrCbLarkRuleList_BlockSeqs)
-        for pchild in blockSeqPnode.children:
-            pchildData = pchild.data
-            if (pchildData == JrCbLarkRule_Block_Newline):
-                block = JrAstNewline(pchild, self)
-            else:
-                block = self.makeConvertDerivedBlock(pchild)
-            self.blocks.append(block)
-
-
-    
-    def makeConvertDerivedBlock(self, blockpnode):
-        # must be child
-        blockpnode = blockpnode.children[0]
-        rule = getParseNodeRuleNameSmart(blockpnode)
-        if (rule == JrCbLarkRule_Block_Text):
-            return JrAstBlockText(blockpnode, self)    
-        elif (rule == JrCbLarkRule_Block_FunctionCall):
-            return JrAstFunctionCall(blockpnode, self)
-        elif (rule == JrCbLarkRule_Block_ControlStatement):
-            return self.makeConvertControlStatement(blockpnode)
-        elif (rule == JrCbLarkRule_Block_Expression):
-            return JrAstExpression(blockpnode, self)  
-        # not understood
-        raise makeJriException("Internal rrror: Expected to process a block of type {} but got '{}'.".format([JrCbLarkRule_Block_FunctionCall, JrCbLarkRule_Block_Text, JrCbLarkRule_Block_ControlStatement, JrCbLarkRule_Block_Expression], rule), blockpnode)
-
-
-
-    def makeConvertControlStatement(self, pnodeControlStatement):
-        # make derived control statement
-        pnode = pnodeControlStatement.children[0]
-        rule = getParseNodeRuleNameSmart(pnode)
-        if (rule == JrCbLarkRule_if_statement):
-            return JrAstControlStatementIf(pnode, self)  
-        elif (rule == JrCbLarkRule_for_statement):
-            return JrAstControlStatementFor(pnode, self)  
-        raise makeJriException("Internal error: Uknown control statement expected {} got '{}'.".format([JrCbLarkRule_if_statement,JrCbLarkRule_for_statement], rule), pnode)
-
+    def bindFunctionCalls(self, env):
+        for block in self.blocks:
+            block.bindFunctionCalls(env)
 
 
     def renderRun(self, rmode, env):
@@ -542,14 +625,25 @@ class JrAstBlockSeq(JrAst):
 # fundamental building blocks
 
 class JrAstBlockText(JrAst):
-    def __init__(self, pnode, parentp):
-        super().__init__(pnode, parentp)
-        # ATTN: for now just store it
-        self.blockPnode = pnode
+    # we don't keep a copy of our text, just where it is in the raw source held by the root (see getText)
+    __slots__ = ("textStart", "textEnd")
+
+    def __init__(self, sloc, parentp, textStart, textEnd):
+        super().__init__(sloc, parentp)
+        self.textStart = textStart
+        self.textEnd = textEnd
+
+    def getText(self):
+        # materialize our text from the raw source (None if we aren't attached to a tree with source)
+        sourceText = self.getRootRawSourceDict().get("text")
+        if (sourceText is None):
+            return None
+        return sourceText[self.textStart:self.textEnd]
 
 
     def renderRun(self, rmode, env):
-        jrprint("Running ({}) BLOCKTEXT statement at {}".format(rmode, self.sloc.debugString()))
+        if (env.isTracing(DefTraceCategoryRun, DefTraceLevelDetail)):
+            jrprint("Running ({}) BLOCKTEXT statement at {}".format(rmode, self.sloc.debugString()))
 
 
 
@@ -583,27 +677,18 @@ class JrAstBlockText(JrAst):
 
 
 class JrAstFunctionCall(JrAst):
-    def __init__(self, pnode, parentp):
-        super().__init__(pnode, parentp)
-        #
-        childCount = len(pnode.children)
-        functionNameNode = pnode.children[0]
-        argumentListNode = pnode.children[1]
-        # now target brace groups
-        if (childCount>3):
-            raise makeJriException("Internal error: Expected 2 or 3 children for function call parse.", pnode)
-        if (childCount==3):
-            multiBraceGroupNode = pnode.children[2]
-        else:
-            multiBraceGroupNode = None
+    __slots__ = ("functionName", "argumentList", "targetGroups", "binding")
+
+    def __init__(self, sloc, parentp, functionName, argumentList, targetGroups):
+        super().__init__(sloc, parentp)
         #
-        functionNameStr = functionNameNode.value
-        self.functionName = functionNameStr
-        self.argumentList = JrAstArgumentList(argumentListNode, self)
-        if (multiBraceGroupNode is None):
-            self.targetGroups = []
-        else:
-            self.targetGroups = convertParseMultiBraceGroupOrBlockSeq(multiBraceGroupNode, self)
+        self.functionName = functionName
+        self.argumentList = self.adoptChild(argumentList)
+        self.targetGroups = []
+        for targetGroup in targetGroups:
+            self.targetGroups.append(self.adoptChild(targetGroup))
+        # function and arg plan this call site is bound to (see bindFunction)
+        self.binding = None
         
         # ATTN:
         # note that at this point we have NOT evaluated/resolved the arguments or blocks -- they are simply stored as AST nodes -- uncomputed/unevaluated expressions that have no types, and could result in runtime errors, etc.,
@@ -629,12 +714,12 @@ class JrAstFunctionCall(JrAst):
         # to aid in debugging
 
         # get function pointer
-        funcp = self.resolveFuncp(env)
+        [bindingEnv, bindingGeneration, funcp, argPlanInfo] = self.getBinding(env)
         functionName = self.getFunctionName()
 
         # ask for the arg list
         compileTimeArgListString = self.argumentList.asDebugStr()
-        annotatedArgListString = funcp.calcAnnotatedArgListStringForDebug(env, self, self.argumentList, self.targetGroups)
+        annotatedArgListString = funcp.calcAnnotatedArgListStringForDebug(env, self, self.argumentList, self.targetGroups, argPlanInfo)
         return "{}({}) --> {}({})".format(functionName, compileTimeArgListString, functionName, annotatedArgListString)
 
 
@@ -648,12 +733,42 @@ class JrAstFunctionCall(JrAst):
         return funcp
 
 
+    def bindFunction(self, env):
+        # resolve the function we call and build our arg plan for it (see CbFunc.buildArgPlan), so that we don't have to on every execute
+        # a binding is good only for the env it was made in, and only until some function name is redeclared, shadowed or assigned (see JrAstContext.invalidateFunctionBindings)
+        self.binding = None
+        funcp = self.resolveFuncp(env)
+        argPlanInfo = funcp.buildArgPlan(self, self.argumentList)
+        self.binding = [env, env.getContext().getFunctionBindingGeneration(), funcp, argPlanInfo]
+        return self.binding
+
+    def getBinding(self, env):
+        # return [env, generation, funcp, [argPlan, defaultArgList]], rebinding if our binding is missing or stale
+        binding = self.binding
+        if (binding is not None) and (binding[0] is env) and (binding[1] == env.getContext().getFunctionBindingGeneration()):
+            return binding
+        return self.bindFunction(env)
+
+    def bindFunctionCalls(self, env):
+        # bind now if we can; if we can't (e.g. undefined function or bad args), executing will report the problem at run time like always
+        try:
+            self.bindFunction(env)
+        except Exception as e:
+            self.binding = None
+        # our args and targets can have function calls too
+        self.argumentList.bindFunctionCalls(env)
+        for targetGroup in self.targetGroups:
+            targetGroup.bindFunctionCalls(env)
+
+
     def renderRun(self, rmode, env):
         #invoke the function
         try:
             funcRetVal = self.execute(rmode, env)
-            funcRetAsString = funcRetVal.asNiceString(True)
-            jrprint("run ({}) Functioncall {} returned {}".format(rmode, self.getRuntimeDebugDisplay(env), funcRetAsString))
+            # note that the debug display re-resolves our args, so we only build it if we are tracing function calls
+            if (env.isTracing(DefTraceCategoryFunction)):
+                funcRetAsString = funcRetVal.asNiceString(True)
+                jrprint("run ({}) Functioncall {} returned {}".format(rmode, self.getRuntimeDebugDisplay(env), funcRetAsString))
         except Exception as e:
             context = env.getContext()
             if (context.getFlagContinueOnException()):
@@ -666,11 +781,11 @@ class JrAstFunctionCall(JrAst):
     def execute(self, rmode, env):
         # execute the function, return an AstVal
 
-        # get function pointer
-        funcp = self.resolveFuncp(env)
+        # get function pointer and arg plan
+        [bindingEnv, bindingGeneration, funcp, [argPlan, defaultArgList]] = self.getBinding(env)
 
         # invoke it
-        retv = funcp.invoke(rmode, env, self, self.argumentList, self.targetGroups)
+        retv = funcp.invokeArgPlan(rmode, env, self, argPlan, self.targetGroups)
 
         # wrap return value
         funcRetVal = wrapValIfNotAlreadyWrapped(self, self, retv)
@@ -716,40 +831,30 @@ class JrAstFunctionCall(JrAst):
 
 
 class JrAstControlStatementIf(JrAst):
-    def __init__(self, pnode, parentp):
-        super().__init__(pnode, parentp)
-        #
-        expressionNode = pnode.children[0]
-        self.ifExpression = JrAstExpression(expressionNode, self)
-        self.consequenceTrue = None
-        self.elseIf = None
-        self.consequenceElse = None
-        consequenceNode = pnode.children[1]
-        self.convertConsequenceSet(consequenceNode)
-        pass
+    __slots__ = ("ifExpression", "consequenceTrue", "elseIf", "consequenceElse")
 
-    def convertConsequenceSet(self, consequenceSetNode):
-        # set other parts of if
-        verifyPNodeType(consequenceSetNode, "if_consequence", [JrCbLarkRule_if_consequence])
-        consequenceChildNode = consequenceSetNode.children[0]
-        self.consequenceTrue = convertParseBraceGroupOrBlockSeq(consequenceChildNode, self)
-        # now if there is ANOTHER child it is EITHER an elif or an else
-        childCount = len(consequenceSetNode.children)
-        if (childCount>1):
-            elseChildNode = consequenceSetNode.children[1]
-            rule = getParseNodeRuleNameSmart(elseChildNode)
-            if (rule == JrCbLarkRule_elif_statement):
-                elseIfChildNode = elseChildNode.children[0]
-                self.elseIf = JrAstControlStatementIf(elseIfChildNode, self)
-            elif (rule == JrCbLarkRule_else_statement):
-                elseConsquenceNode = elseChildNode.children[0]
-                self.consequenceElse = convertParseBraceGroupOrBlockSeq(elseConsquenceNode, self)
-            else:
-                raise makeAstExceptionPNodeType("if consequence set", elseChildNode, [JrCbLarkRule_elif_statement, JrCbLarkRule_else_statement])
+    def __init__(self, sloc, parentp, ifExpression, consequenceTrue, elseIf, consequenceElse):
+        super().__init__(sloc, parentp)
+        #
+        self.ifExpression = self.adoptChild(ifExpression)
+        self.consequenceTrue = self.adoptChild(consequenceTrue)
+        # at most one of these will be set (an elif OR an else)
+        self.elseIf = self.adoptChild(elseIf)
+        self.consequenceElse = self.adoptChild(consequenceElse)
         
 
+    def bindFunctionCalls(self, env):
+        self.ifExpression.bindFunctionCalls(env)
+        self.consequenceTrue.bindFunctionCalls(env)
+        if (self.elseIf is not None):
+            self.elseIf.bindFunctionCalls(env)
+        if (self.consequenceElse is not None):
+            self.consequenceElse.bindFunctionCalls(env)
+
+
     def renderRun(self, rmode, env):
-        jrprint("run IF statement")
+        if (env.isTracing(DefTraceCategoryRun)):
+            jrprint("run IF statement")
 
         consequenceResult = None
 
@@ -794,24 +899,27 @@ class JrAstControlStatementIf(JrAst):
 
 
 class JrAstControlStatementFor(JrAst):
-    def __init__(self, pnode, parentp):
-        super().__init__(pnode, parentp)
+    __slots__ = ("identifierName", "inExpression", "loopConsequence")
+
+    def __init__(self, sloc, parentp, identifierName, inExpression, loopConsequence):
+        super().__init__(sloc, parentp)
         #
-        forExpressionNode = pnode.children[0]
-        verifyPNodeType(forExpressionNode, "for expression", [JrCbLarkRule_for_expression_in])
         # identifier that will loop through list
-        identifierNameNode = forExpressionNode.children[0]
-        self.identifierName = getParseNodeTokenValue(identifierNameNode)
+        self.identifierName = identifierName
         # expression which will HAVE to evaluate at runtime into a list
-        expressionNode = forExpressionNode.children[1]
-        self.inExpression = JrAstExpression(expressionNode, self)
+        self.inExpression = self.adoptChild(inExpression)
         # consequence loop
-        consequenceNode = pnode.children[1]
-        self.loopConsequence = convertParseBraceGroupOrBlockSeq(consequenceNode, self)
+        self.loopConsequence = self.adoptChild(loopConsequence)
+
+
+    def bindFunctionCalls(self, env):
+        self.inExpression.bindFunctionCalls(env)
+        self.loopConsequence.bindFunctionCalls(env)
 
 
     def renderRun(self, rmode, env):
-        jrprint("RenderRun ({}) FOR statement - ATTN: UNFINISHED".format(rmode))
+        if (env.isTracing(DefTraceCategoryRun)):
+            jrprint("RenderRun ({}) FOR statement - ATTN: UNFINISHED".format(rmode))
 
 
 
@@ -860,22 +968,18 @@ class JrAstControlStatementFor(JrAst):
 # JrAstArgumentList represents two lists of arguments being passed to a function, a positional and named list
 # note that this is a JrAst derived class, meaning that it is not a general utility class but rather a node created from parse tree (ie an argument list found in the source parse)
 class JrAstArgumentList(JrAst):
-    def __init__(self, pnode, parentp):
-        super().__init__(pnode, parentp)
+    __slots__ = ("positionalArgs", "namedArgs")
+
+    def __init__(self, sloc, parentp, positionalArgs, namedArgs):
+        super().__init__(sloc, parentp)
         #
         self.positionalArgs = []
         self.namedArgs = {}
         #
-        if (pnode is not None):
-            verifyPNodeType(pnode, "parsing argument list", [JrCbLarkRule_argument_list])
-            # walk children
-            for childpnode in pnode.children:
-                verifyPNodeType(childpnode, "parsing argument child list", [JrCbLarkRule_positional_argument_list, JrCbLarkRule_named_argument_list])
-                childData = childpnode.data
-                if (childData == JrCbLarkRule_positional_argument_list):
-                    self.positionalArgs = convertPositionalArgList(childpnode, self)
-                elif (childData == JrCbLarkRule_named_argument_list):
-                    self.namedArgs = convertNamedArgList(childpnode, self)
+        for arg in positionalArgs:
+            self.positionalArgs.append(self.adoptChild(arg))
+        for key, arg in namedArgs.items():
+            self.namedArgs[key] = self.adoptChild(arg)
 
 
     def asDebugStr(self):
@@ -890,6 +994,13 @@ class JrAstArgumentList(JrAst):
         return niceString
 
 
+    def bindFunctionCalls(self, env):
+        for arg in self.positionalArgs:
+            arg.bindFunctionCalls(env)
+        for arg in self.namedArgs.values():
+            arg.bindFunctionCalls(env)
+
+
     def getPositionArgs(self):
         return self.positionalArgs
     def getNamedArgs(self):
@@ -925,13 +1036,16 @@ class JrAstArgumentList(JrAst):
 
 
 class JrAstNewline(JrAst):
-    def __init__(self, pnode, parentp):
-        super().__init__(pnode, parentp)
+    __slots__ = ()
+
+    def __init__(self, sloc, parentp):
+        super().__init__(sloc, parentp)
         # nothing else to do here, it's just a newline that may be significant for text production
 
 
     def renderRun(self, rmode, env):
-        jrprint("RenderRun ({}) NEWLINE statement".format(rmode))
+        if (env.isTracing(DefTraceCategoryRun)):
+            jrprint("RenderRun ({}) NEWLINE statement".format(rmode))
 
 
 
@@ -954,8 +1068,10 @@ class JrAstNewline(JrAst):
 # brace group is just like a block sequence
 # currently we just handle the functionality in base blockSeq class
 class JrAstBraceGroup(JrAstBlockSeq):
-    def __init__(self, pnode, parentp):
-        super().__init__(pnode, parentp)
+    __slots__ = ()
+
+    def __init__(self, sloc, parentp, blocks):
+        super().__init__(sloc, parentp, blocks)
 
 
 
@@ -1004,10 +1120,12 @@ class JrAstBraceGroup(JrAstBlockSeq):
 # ATTN: unfinished
 # JrAstExpression currently just wraps a specific operation/atom
 class JrAstExpression(JrAst):
-    def __init__(self, pnode, parentp):
-        super().__init__(pnode, parentp)
+    __slots__ = ("element",)
+
+    def __init__(self, sloc, parentp, element):
+        super().__init__(sloc, parentp)
         #
-        self.element = convertExpression(pnode, self)
+        self.element = self.adoptChild(element)
 
 
     def asDebugStr(self):
@@ -1034,9 +1152,16 @@ class JrAstExpression(JrAst):
         # resolve the expression (recursively using ast)
         return self.element.resolve(env, flagResolveIdentifiers)
 
+    def getConstantValueOrNone(self):
+        return self.element.getConstantValueOrNone()
+
+    def bindFunctionCalls(self, env):
+        self.element.bindFunctionCalls(env)
+
 
     def renderRun(self, rmode, env):
-        jrprint("RenderRun ({}) EXPRESSION".format(rmode))
+        if (env.isTracing(DefTraceCategoryRun)):
+            jrprint("RenderRun ({}) EXPRESSION".format(rmode))
 
 
 
@@ -1044,81 +1169,93 @@ class JrAstExpression(JrAst):
 
 
 
+# binary operation dispatch table: rule -> {operand value type: python operation}
+# both operands must be of the same type, and the result is wrapped in that same type; a type missing from the dict is not supported for that operation
+# (rule "in" is special and handled separately, see operateBinaryInCollection)
+DefBinaryOperationTable = {
+    JrCbLarkRule_Operation_Binary_add: {AstValNumber: operator.add, AstValString: operator.add},
+    JrCbLarkRule_Operation_Binary_sub: {AstValNumber: operator.sub},
+    JrCbLarkRule_Operation_Binary_or: {AstValBool: (lambda a,b: (a or b))},
+    JrCbLarkRule_Operation_Binary_and: {AstValBool: (lambda a,b: (a and b))},
+    JrCbLarkRule_Operation_Binary_mul: {AstValNumber: operator.mul, AstValString: operator.mul},
+    JrCbLarkRule_Operation_Binary_div: {AstValNumber: operator.truediv},
+    JrCbLarkRule_Operation_Binary_lessthan: {AstValBool: operator.lt},
+    JrCbLarkRule_Operation_Binary_lessthanequal: {AstValBool: operator.le},
+    JrCbLarkRule_Operation_Binary_greaterthan: {AstValBool: operator.gt},
+    JrCbLarkRule_Operation_Binary_greaterthanequal: {AstValBool: operator.ge},
+    JrCbLarkRule_Operation_Binary_equal: {AstValNumber: operator.eq, AstValString: operator.eq, AstValBool: operator.eq},
+    JrCbLarkRule_Operation_Binary_notequal: {AstValNumber: operator.ne, AstValString: operator.ne, AstValBool: operator.ne},
+}
+
+
+
 class JrAstExpressionBinary(JrAst):
-    def __init__(self, rule, pnode, parentp):
-        super().__init__(pnode, parentp)
+    # typeOps is our entry from DefBinaryOperationTable, looked up once
+    # constantValue is our (folded) result when both operands are constants (see foldConstant)
+    __slots__ = ("rule", "leftOperand", "rightOperand", "typeOps", "constantValue")
+
+    def __init__(self, rule, sloc, parentp, leftOperand, rightOperand):
+        super().__init__(sloc, parentp)
         #
         self.rule = rule
-        self.leftOperand = convertExpressionOperand(pnode.children[0], self)
-        self.rightOperand = convertExpressionOperand(pnode.children[1], self)
+        self.leftOperand = self.adoptChild(leftOperand)
+        self.rightOperand = self.adoptChild(rightOperand)
+        self.typeOps = DefBinaryOperationTable.get(rule)
+        self.constantValue = self.foldConstant()
+
+    def bindFunctionCalls(self, env):
+        self.leftOperand.bindFunctionCalls(env)
+        self.rightOperand.bindFunctionCalls(env)
+
+    def foldConstant(self):
+        # if both operands are constants we can compute our value once now, instead of every time we are resolved
+        # if the operation fails, we don't fold, and leave it to report the error when it is resolved at runtime like always
+        leftConstant = self.leftOperand.getConstantValueOrNone()
+        if (leftConstant is None):
+            return None
+        rightConstant = self.rightOperand.getConstantValueOrNone()
+        if (rightConstant is None):
+            return None
+        try:
+            return self.operate(leftConstant, rightConstant)
+        except Exception as e:
+            return None
+
+    def getConstantValueOrNone(self):
+        return self.constantValue
 
     def resolve(self, env, flagResolveIdentifiers):
         # resolve the expression (recursively using ast)
-        # run the operation on the resolved operand
-        # resolve operand
+        if (self.constantValue is not None):
+            return self.constantValue
+        # resolve operands and run the operation on them
         leftOperandResolved = self.leftOperand.resolve(env, flagResolveIdentifiers)
         rightOperandResolved = self.rightOperand.resolve(env, flagResolveIdentifiers)
-        rule = self.rule
-        #
-        if (rule == JrCbLarkRule_Operation_Binary_add):
-            [success, operationResult] = self.operateBinary(rule, leftOperandResolved, rightOperandResolved, (lambda a,b: a+b), (lambda a,b: a+b), None)
-        elif (rule == JrCbLarkRule_Operation_Binary_sub):
-            [success, operationResult] = self.operateBinary(rule, leftOperandResolved, rightOperandResolved, (lambda a,b: a-b), None, None)
-        elif (rule == JrCbLarkRule_Operation_Binary_or):
-            [success, operationResult] = self.operateBinary(rule, leftOperandResolved, rightOperandResolved, None, None, (lambda a,b: (a or b)))
-        elif (rule == JrCbLarkRule_Operation_Binary_and):
-            [success, operationResult] = self.operateBinary(rule, leftOperandResolved, rightOperandResolved, None, None, (lambda a,b: (a and b)))
-        elif (rule == JrCbLarkRule_Operation_Binary_mul):
-            [success, operationResult] = self.operateBinary(rule, leftOperandResolved, rightOperandResolved, (lambda a,b: a*b), (lambda a,b: a*b), None)
-        elif (rule == JrCbLarkRule_Operation_Binary_div):
-            [success, operationResult] = self.operateBinary(rule, leftOperandResolved, rightOperandResolved, (lambda a,b: a/b), None, None)
-        elif (rule == JrCbLarkRule_Operation_Binary_lessthan):
-            [success, operationResult] = self.operateBinary(rule, leftOperandResolved, rightOperandResolved, None, None, (lambda a,b: (a < b)))
-        elif (rule == JrCbLarkRule_Operation_Binary_lessthanequal):
-            [success, operationResult] = self.operateBinary(rule, leftOperandResolved, rightOperandResolved, None, None, (lambda a,b: (a <= b)))
-        elif (rule == JrCbLarkRule_Operation_Binary_greaterthan):
-            [success, operationResult] = self.operateBinary(rule, leftOperandResolved, rightOperandResolved, None, None, (lambda a,b: (a > b)))
-        elif (rule == JrCbLarkRule_Operation_Binary_greaterthanequal):
-            [success, operationResult] = self.operateBinary(rule, leftOperandResolved, rightOperandResolved, None, None, (lambda a,b: (a >= b)))
-        elif (rule == JrCbLarkRule_Operation_Binary_equal):
-            [success, operationResult] = self.operateBinary(rule, leftOperandResolved, rightOperandResolved, (lambda a,b: (a == b)), (lambda a,b: (a == b)), (lambda a,b: (a == b)))
-        elif (rule == JrCbLarkRule_Operation_Binary_notequal):
-            [success, operationResult] = self.operateBinary(rule, leftOperandResolved, rightOperandResolved, (lambda a,b: (a != b)), (lambda a,b: (a != b)), (lambda a,b: (a != b)))
-        elif (rule == JrCbLarkRule_Operation_Binary_in):
-            [success, operationResult] = self.operateBinaryInCollection(rule, leftOperandResolved, rightOperandResolved)
-        else:
-            raise makeJriException("Internal error: unknown binary expression operator ().".format(rule), self)
-        if (not success):
-            raise self.makeExpExceptionUnsupportedOperands(self, rule, leftOperandResolved, rightOperandResolved)
-        return operationResult
+        return self.operate(leftOperandResolved, rightOperandResolved)
 
 
-    # helper function for running numeric/string/bool lambda binary operations based on the value types with generic errors for mismatched operands, etc.
-    def operateBinary(self, opLabel, leftOperand, rightOperand, numericOp, stringOp, boolOp):
-        leftType = leftOperand.getType()
-        rightType = rightOperand.getType()
-        leftOperandValue = leftOperand.getWrapped()
-        rightOperandValue = rightOperand.getWrapped()
-        #
-        success = False
-        operationResult = None
-        #
-        if (leftType != rightType):
+    def operate(self, leftOperand, rightOperand):
+        typeOps = self.typeOps
+        if (typeOps is not None):
+            return self.operateBinary(self.rule, leftOperand, rightOperand, typeOps)
+        if (self.rule == JrCbLarkRule_Operation_Binary_in):
+            [success, operationResult] = self.operateBinaryInCollection(self.rule, leftOperand, rightOperand)
+            if (not success):
+                raise self.makeExpExceptionUnsupportedOperands(self, self.rule, leftOperand, rightOperand)
+            return operationResult
+        raise makeJriException("Internal error: unknown binary expression operator ().".format(self.rule), self)
+
+
+    # helper function for running numeric/string/bool binary operations based on the value types with generic errors for mismatched operands, etc.
+    def operateBinary(self, opLabel, leftOperand, rightOperand, typeOps):
+        leftType = type(leftOperand)
+        if (leftType is not type(rightOperand)):
             raise self.makeExpExceptionOperandMismatch(self, opLabel, leftOperand, rightOperand)
-        #
-        if (leftType == AstValNumber) and (numericOp is not None):
-            resultVal = numericOp(leftOperandValue, rightOperandValue)
-            operationResult = AstValNumber(self, self, resultVal)
-            success = True
-        if (leftType == AstValString) and (stringOp is not None):
-            resultVal = stringOp(leftOperandValue, rightOperandValue)
-            operationResult = AstValString(self, self, resultVal)
-            success = True
-        if (leftType == AstValBool) and (boolOp is not None):
-            resultVal = boolOp(leftOperandValue, rightOperandValue)
-            operationResult = AstValBool(self, self, resultVal)
-            success = True
-        return [success, operationResult]
+        op = typeOps.get(leftType)
+        if (op is None):
+            raise self.makeExpExceptionUnsupportedOperands(self, opLabel, leftOperand, rightOperand)
+        # result is same type as operands
+        return leftType(self, self, op(leftOperand.value, rightOperand.value))
 
 
 
@@ -1182,17 +1319,40 @@ class JrAstExpressionBinary(JrAst):
 
 
 class JrAstExpressionUnary(JrAst):
-    def __init__(self, rule, pnode, parentp):
-        super().__init__(pnode, parentp)
+    # constantValue is our (folded) result when our operand is a constant (see JrAstExpressionBinary.foldConstant)
+    __slots__ = ("rule", "operand", "constantValue")
+
+    def __init__(self, rule, sloc, parentp, operand):
+        super().__init__(sloc, parentp)
         #
         self.rule = rule
-        self.operand = convertExpressionOperand(pnode.children[0], self)
+        self.operand = self.adoptChild(operand)
+        self.constantValue = self.foldConstant()
+
+    def bindFunctionCalls(self, env):
+        self.operand.bindFunctionCalls(env)
+
+    def foldConstant(self):
+        operandConstant = self.operand.getConstantValueOrNone()
+        if (operandConstant is None):
+            return None
+        try:
+            return self.operate(operandConstant)
+        except Exception as e:
+            return None
+
+    def getConstantValueOrNone(self):
+        return self.constantValue
 
     def resolve(self, env, flagResolveIdentifiers):
         # resolve the expression (recursively using ast)
+        if (self.constantValue is not None):
+            return self.constantValue
         # run the operation on the resolved operand
-        # resolve operand
         operandResolved = self.operand.resolve(env, flagResolveIdentifiers)
+        return self.operate(operandResolved)
+
+    def operate(self, operandResolved):
         # run operation
         if (self.rule == JrCbLarkRule_Operation_Unary_neg):
             operationResult = self.operateNeg(operandResolved)
@@ -1222,23 +1382,13 @@ class JrAstExpressionUnary(JrAst):
 
 
 class JrAstExpressionAtom(JrAst):
-    def __init__(self, rule, pnode, parentp):
-        super().__init__(pnode, parentp)
+    __slots__ = ("rule", "operand")
+
+    def __init__(self, rule, sloc, parentp, operand):
+        super().__init__(sloc, parentp)
         #
         self.rule = rule
-        operandNode = pnode.children[0]
-        if (rule == JrCbLarkRule_Atom_string):
-            self.operand = AstValString(pnode, self, getParseTreeString(pnode))
-        elif (rule == JrCbLarkRule_Atom_number):
-            self.operand = AstValNumber(pnode, self, getParseNodeTokenValue(operandNode))
-        elif (rule == JrCbLarkRule_Atom_boolean):
-            self.operand = AstValBool(pnode, self, getParseNodeBool(operandNode))
-        elif (rule == JrCbLarkRule_Atom_identifier):
-            self.operand = AstValIdentifier(pnode, self, getParseNodeTokenValue(operandNode))
-        elif (rule == JrCbLarkRule_Atom_null):
-            self.operand = AstValNull(pnode, self)
-        else:
-            raise makeJriException("Internal error; unexpected token in atom expression ({}).".format(rule), pnode)
+        self.operand = self.adoptChild(operand)
 
     def resolve(self, env, flagResolveIdentifiers):
         # resolve the expression (recursively using ast)
@@ -1246,6 +1396,13 @@ class JrAstExpressionAtom(JrAst):
         operandResolved = self.operand.resolve(env, flagResolveIdentifiers)
         return operandResolved
 
+    def getConstantValueOrNone(self):
+        # literal values are constants, identifiers are not
+        operand = self.operand
+        if (isinstance(operand, AstValIdentifier)):
+            return None
+        return operand
+
     def getOperand(self):
         return self.operand
 
@@ -1254,16 +1411,18 @@ class JrAstExpressionAtom(JrAst):
 
 
 class JrAstExpressionCollectionList(JrAst):
-    def __init__(self, pnode, parentp):
-        super().__init__(pnode, parentp)
-        #
-        collectionNode = pnode.children[0]
-        if (collectionNode is None):
-            itemList = []
-        else:
-            itemList = convertPositionalArgList(collectionNode, self)
+    __slots__ = ("itemList",)
+
+    def __init__(self, sloc, parentp, itemList):
+        super().__init__(sloc, parentp)
         #
-        self.itemList = itemList
+        self.itemList = []
+        for item in itemList:
+            self.itemList.append(self.adoptChild(item))
+
+    def bindFunctionCalls(self, env):
+        for item in self.itemList:
+            item.bindFunctionCalls(env)
 
 
     def resolve(self, env, flagResolveIdentifiers):
@@ -1280,16 +1439,18 @@ class JrAstExpressionCollectionList(JrAst):
 
 
 class JrAstExpressionCollectionDict(JrAst):
-    def __init__(self, pnode, parentp):
-        super().__init__(pnode, parentp)
-        #
-        collectionNode = pnode.children[0]
-        if (collectionNode is None):
-            itemDict = {}
-        else:
-            itemDict = convertDictionary(collectionNode, self)
+    __slots__ = ("itemDict",)
+
+    def __init__(self, sloc, parentp, itemDict):
+        super().__init__(sloc, parentp)
         #
-        self.itemDict = itemDict
+        self.itemDict = {}
+        for key, item in itemDict.items():
+            self.itemDict[key] = self.adoptChild(item)
+
+    def bindFunctionCalls(self, env):
+        for item in self.itemDict.values():
+            item.bindFunctionCalls(env)
 
 
 
@@ -1353,6 +1514,8 @@ class JrAstExpressionCollectionDict(JrAst):
 
 # entry child helper manages the children of an entry
 class JrAstEntryChildHelper(JrAst):
+    __slots__ = ("childList", "childIdHash")
+
     def __init__(self, sloc, parentp):
         super().__init__(sloc, parentp)
         # ordered list of children
@@ -1417,12 +1580,12 @@ class JrAstEntryChildHelper(JrAst):
 
 
 
-    def convertEntryAddMergeChildAst(self, env, pnode, expectedLevel):
+    def convertEntryAddMergeChildAst(self, env, pnode, expectedLevel, entryReuseTracker):
         # start by creating a NEW JrAstEntry node (we may dispose it if we choose to merge but it's more straighforward to do this)
         # NOTE: we pass env here so that we can catch exceptions at this level and continue if we want for better error reporting
 
         try:
-            return self.convertEntryAddMergeChildAstDoWork(env, pnode, expectedLevel)
+            return self.convertEntryAddMergeChildAstDoWork(env, pnode, expectedLevel, entryReuseTracker)
         except Exception as e:
             context = env.getContext()
             if (context.getFlagContinueOnException()):
@@ -1431,10 +1594,21 @@ class JrAstEntryChildHelper(JrAst):
                 raise e
 
 
-    def convertEntryAddMergeChildAstDoWork(self, env, pnode, expectedLevel):
-        newEntryAst = JrAstEntry(pnode, self.getOwnerParentp(), expectedLevel)
-        # convert core but not children
-        newEntryAst.convertCoreFromPnode(pnode)
+    def convertEntryAddMergeChildAstDoWork(self, env, pnode, expectedLevel, entryReuseTracker):
+        # can we just reuse the entry we converted from this same parse node last time? (only if there is nothing to merge it with)
+        reusedEntryAst = entryReuseTracker.findReusableEntry(pnode)
+        if (reusedEntryAst is not None) and (self.findExistingEntryChild(reusedEntryAst) is None):
+            reusedEntryAst.parentp = self.getOwnerParentp()
+            self.addChild(env, reusedEntryAst, pnode)
+            entryReuseTracker.recordReusedEntry(pnode, reusedEntryAst)
+            return
+
+        # convert core (header and body) but not children
+        from .jrasttransformer import JrAstTransformer, JrAstTransformError
+        newEntryAst = JrAstTransformer().transformEntryCore(pnode, expectedLevel)
+        if (isinstance(newEntryAst, JrAstTransformError)):
+            raise newEntryAst.exception
+        newEntryAst.parentp = self.getOwnerParentp()
 
         # now see if this exists already as a child and should be merged
         existingChild = self.findExistingEntryChild(newEntryAst)
@@ -1443,9 +1617,11 @@ class JrAstEntryChildHelper(JrAst):
             # no existing child, so we will add this child, and add its children recursively to it
             self.addChild(env, newEntryAst, pnode)
             recurseEntryAst = newEntryAst
+            entryReuseTracker.recordConvertedEntry(pnode, newEntryAst)
         else:
             # we have an existing child with this id, so we will merge children into it, AFTER we check for conflicts
             recurseEntryAst = existingChild
+            existingChild.flagMerged = True
             # check for conflict
             if (jrfuncs.isNonEmptyString(newEntryAst.getLabel())):
                 # want to use new label
@@ -1474,9 +1650,47 @@ class JrAstEntryChildHelper(JrAst):
         if (pchildCount>2):
             for i in range(2, pchildCount):
                 pchild = pnode.children[i]
-                recurseEntryAst.entries.convertEntryAddMergeChildAst(env, pchild, expectedLevel+1)
+                recurseEntryAst.entries.convertEntryAddMergeChildAst(env, pchild, expectedLevel+1, entryReuseTracker)
+
 
 
 
 
 
+
+# entry reuse tracker remembers which entry ast node we converted from which parse tree node
+# after an incremental re-parse, unchanged entries come back as the very same parse tree node, and so we can reuse the entry ast node instead of converting it again
+# (entries that have moved come back as new nodes, since the ast holds their source positions, so they are converted again)
+class JrAstEntryReuseTracker:
+    def __init__(self, previousTracker):
+        # previous conversion (pnode id -> [pnode, entryAst]); we hold on to pnode so its id can't be recycled
+        self.previousEntryDict = {} if (previousTracker is None) else previousTracker.entryDict
+        self.entryDict = {}
+        #
+        self.reusedCount = 0
+        self.convertedCount = 0
+
+    def findReusableEntry(self, pnode):
+        item = self.previousEntryDict.get(id(pnode))
+        if (item is None) or (item[0] is not pnode):
+            return None
+        entryAst = item[1]
+        if (entryAst.flagMerged):
+            # it has had other entries merged into it so is not a faithful conversion of this pnode alone
+            return None
+        return entryAst
+
+    def recordConvertedEntry(self, pnode, entryAst):
+        self.entryDict[id(pnode)] = [pnode, entryAst]
+        self.convertedCount += 1
+
+    def recordReusedEntry(self, pnode, entryAst):
+        # carry over the records for this entry and all of its child entries (so those can still be reused later even if this one changes)
+        pnodeStack = [pnode]
+        while (len(pnodeStack) > 0):
+            pnode = pnodeStack.pop()
+            item = self.previousEntryDict.get(id(pnode))
+            if (item is not None) and (item[0] is pnode):
+                self.entryDict[id(pnode)] = item
+            pnodeStack += pnode.children[2:]
+        self.reusedCount += 1
@@ -11,6 +11,8 @@ from lib.jr.jrfuncs import jrprint
 # derived class that adds output rendering
 
 class JrAstRootCbr(jrast.JrAstRoot):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
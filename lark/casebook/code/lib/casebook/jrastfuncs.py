@@ -48,7 +48,7 @@ def wrapValIfNotAlreadyWrapped(sloc, parentp, value):
 
 def wrapValSmart(sloc, parentp, value):
     # for creating wrapped value classes
-    from .jrastvals import AstVal, AstValNull, AstValString, AstValBool, AstValNumber, AstValList, AstValDict, AstValLarkNode, AstValObject
+    from .jrastvals import AstVal, AstValNull, AstValString, AstValBool, AstValNumber, AstValList, AstValDict, AstValObject
 
     valType = type(value)
     if (value is None):
@@ -65,7 +65,8 @@ def wrapValSmart(sloc, parentp, value):
     elif (valType is list):
         wrappedVal = AstValList(sloc, parentp, value)
     elif (isinstance(value, lark.Token)):
-        wrappedVal = AstValLarkNode(sloc, parentp, value)
+        # we never hold on to lark tokens in the AST; a token is just its text (sloc has its position)
+        wrappedVal = AstValString(sloc, parentp, str(value))
     elif (valType is dict):
         flagReadOnly = False
         flagCreateKeyOnSet = True
@@ -95,53 +96,6 @@ def astPrintDebugLine(depth, str):
     jrprint(spaceStr + str)
 
 
-# helper function to return value of parse tree node with a single child literal token
-def getParseTreeChildLiteralToken(pnode, flagTrimWhitespace = True):
-    literalChild = pnode.children[0]
-    literalValue = literalChild.value
-    if (flagTrimWhitespace):
-        literalValue = literalValue.strip()
-    return literalValue
-
-
-# helper function to return value of parse tree node that is a string of some sort
-def getParseTreeChildString(pnode):
-    # we expect one child, which is a STRING type
-    pchildStringNode = pnode.children[0]
-    return getParseTreeString(pchildStringNode)
-
-def getParseTreeString(pnode):
-    stringConst = pnode.data.value
-    if (stringConst != JrCbLarkRule_string):
-        raise makeJriException("Uncaught syntax error; expected string composite token '{}'.".format(JrCbLarkRule_string),  pnode)
-    pchildSubStringNode = pnode.children[0]
-    stringType = pchildSubStringNode.type
-    stringValue = pchildSubStringNode.value
-    if (stringType in [JrCbLarkRule_STRING_DOUBLE_QUOTE, JrCbLarkRule_STRING_SINGLE_QUOTE, JrCbLarkRule_UNICODE_STRING]):
-        # remove outer double quotes
-        literalValue = stringValue[1:len(stringValue)-1]
-    elif (stringType == JrCbLarkRule_STRING_TRIPLE_SINGLE_QUOTE):
-        # remove outer triple quotes
-        literalValue = stringValue[3:len(stringValue)-3]
-    else:
-        raise makeJriException("Uncaught syntax error; expected string token of type {}.".format([JrCbLarkRule_STRING_DOUBLE_QUOTE, JrCbLarkRule_STRING_SINGLE_QUOTE, JrCbLarkRule_UNICODE_STRING]),  pchildSubStringNode)
-    return literalValue
-
-# just return the simple value of the pnode
-def getParseNodeTokenValue(pnode):
-    return pnode.value
-
-def getParseNodeBool(pnode):
-    rule = pnode.data
-    if (rule == JrCbLarkRule_boolean_true):
-        return True
-    elif (rule == JrCbLarkRule_boolean_false):
-        return False
-    raise makeJriException("Internal error; expected boolean_true or boolean_false but got rule: {}.".format(rule), pnode)
-
-
-
-
 def getParseNodeRuleName(pnode):
     rule = pnode.data
     if (type(rule) is str):
@@ -165,6 +119,17 @@ def getParseNodeRuleNameSmart(pnode):
 
 
 
+def splitIdentifierParts(identifierName):
+    # return [baseName, propertyParts] for a possibly dotted identifier; propertyParts is None if not dotted
+    if (identifierName is None):
+        return [None, None]
+    parts = identifierName.split(".")
+    if (len(parts)==1):
+        return [parts[0], None]
+    return [ parts[0], parts[1:] ]
+
+
+
 def convertToSourceLocationObject(sloc):
     from .jrastutilclasses import JrSourceLocation
 
@@ -183,119 +148,6 @@ def convertToSourceLocationObject(sloc):
 
 
 
-def convertParseBraceGroupOrBlockSeq(pnode, parentp):
-    # this is tricky because we send a bunch of different rules here
-    # the only thing that doesnt go here is MULTI brace groups (used in function calls); so here we have EITHER a brace group, OR a block sequence (with possible newlines)
-    from .jrast import JrAstBraceGroup, JrAstBlockSeq
-
-    rule = getParseNodeRuleNameSmart(pnode)
-    if (rule == JrCbLarkRule_brace_group):
-        # brace group
-        return JrAstBraceGroup(pnode.children[0], parentp)
-    elif (rule in [JrCbLarkRule_BlockSeq1, JrCbLarkRule_BlockSeq2]):
-        # block seq
-        return JrAstBlockSeq(pnode, parentp)
-    else:
-        raise makeAstExceptionPNodeType("if consequence", pnode, [JrCbLarkRule_BlockSeq1, JrCbLarkRule_BlockSeq2, JrCbLarkRule_brace_group])
-
-
-def convertParseMultiBraceGroupOrBlockSeq(pnode, parentp):
-    # multiple brace groups or one block seq
-    groups = []
-    for childpnode in pnode.children:
-        group = convertParseBraceGroupOrBlockSeq(childpnode, parentp)
-        groups.append(group)
-    return groups
-
-
-
-def convertPositionalArgList(pnode, parentp):
-    from .jrast import JrAstExpression
-
-    argList = []
-    # each child will be an expression
-    for childpnode in pnode.children:
-        expression = JrAstExpression(childpnode, parentp)
-        argList.append(expression)
-    return argList
-
-def convertNamedArgList(pnode, parentp):
-    from .jrast import JrAstExpression
-
-    argDict = {}
-    # each child will be an assignment expression
-    for childpnode in pnode.children:
-        keyNode = childpnode.children[0]
-        expressionNode = childpnode.children[1]
-        keyName = getParseNodeTokenValue(keyNode)
-        if (keyName in argDict):
-            raise makeJriException("Duplicate key in arg list ({}).".format(keyName), keyNode)
-        argDict[keyName] = JrAstExpression(expressionNode, parentp)
-    return argDict
-
-
-def convertDictionary(pnode, parentp):
-    from .jrast import JrAstExpression
-
-    argDict = {}
-    # each child will be an assignment expression
-    for childpnode in pnode.children:
-        keyNode = childpnode.children[0]
-        expressionNode = childpnode.children[1]
-        keyRule = getParseNodeRuleNameSmart(keyNode)
-        if (keyRule == JrCbLarkRule_Atom_string):
-            # string as dictionary left identifier
-            keyName = getParseTreeString(keyNode)
-            if (keyName in argDict):
-                raise makeJriException("Duplicate key in dictionary ({}).".format(keyName), keyNode)
-            argDict[keyName] = JrAstExpression(expressionNode, parentp)
-        else:
-            raise makeJriException("Expected string value for key name in dictionary.", keyNode)
-    return argDict
-
-
-
-def convertExpression(pnode, parentp):
-    # the child is the rule (either an operation or an atom)
-    childCount = len(pnode.children)
-    if (childCount != 1):
-        raise makeJriException("Expression parsing", pnode)
-    child = pnode.children[0]
-    return convertExpressionOperand(child, parentp)
-
-
-def convertExpressionOperand(child, parentp):
-    from .jrast import JrAstExpressionAtom, JrAstExpressionBinary, JrAstExpressionUnary, JrAstExpressionCollectionList, JrAstExpressionCollectionDict, JrAstFunctionCall
-
-    rule = getParseNodeRuleNameSmart(child)
-    if (rule in JrCbLarkRule_Operation_Binary_AllList):
-        # binary node
-        return JrAstExpressionBinary(rule, child, parentp)
-    elif (rule in JrCbLarkRule_Operation_Unary_AllList):
-        # binary node
-        return JrAstExpressionUnary(rule, child, parentp)
-    elif (rule in JrCbLarkRule_Atom_AllList):
-        # atom node
-        return JrAstExpressionAtom(rule, child, parentp)
-    elif (rule == JrCbLarkRule_Collection_list):
-        # collection node
-        return JrAstExpressionCollectionList(child, parentp)
-    elif (rule == JrCbLarkRule_Collection_dict):
-        # collection node
-        return JrAstExpressionCollectionDict(child, parentp)
-    elif (rule == JrCbLarkRule_Block_FunctionCall):
-        # function call
-        return JrAstFunctionCall(child, parentp)
-    elif (rule == JrCbLarkRule_Block_Expression):
-        # nested expression recurse
-        return convertExpression(child, parentp)
-    else:
-        raise makeJriException("Expression rule parsing", child)
-
-
-
-
-
 def verifyPNodeType(pnode, errorHint, pnodeTypeList):
     nodeRule = getParseNodeRuleNameSmart(pnode)
     if (not nodeRule in pnodeTypeList):
@@ -421,24 +273,6 @@ def setObjectDictHierarchicalProperty(sloc, identifier, objdict, partList, val,
 
 
 
-def extractHighlightedSourceLineAtPos(text, startPos, endPos):
-    retDict = {}
-    # start from pos and get the newlines to left and right
-    leftPos = text.rfind("\n", 0, startPos)
-    rightPos = text.find("\n", startPos)
-    if (rightPos==-1):
-        rightPos = len(text)
-    lineText = text[leftPos+1:rightPos]
-    retDict["highlightedSourceLineText"] = lineText
-    startHighlightPos = (startPos - leftPos)-1
-    endHighlightPos = (endPos - leftPos)-1
-    if (startHighlightPos<0):
-        startHighlightPos = 0
-    if (endHighlightPos>len(lineText)):
-        endHighlightPos = startHighlightPos+1
-    retDict["highlightedSourceLinePos"] = startHighlightPos
-    retDict["highlightedSourceLineEndPos"] = endHighlightPos
-    return retDict
 
 
 
@@ -0,0 +1,406 @@
+# lark
+import lark
+from lark import Transformer, v_args
+
+# ast
+from .cblarkdefs import *
+from .jrast import *
+from .jrastfuncs import *
+from .jrastvals import *
+from .jrastutilclasses import JrSourceLocation
+from .jriexception import *
+
+
+
+
+
+
+# converting a parse tree into our AST
+# the lark Transformer walks the parse tree bottom up, and calls the method named after each rule with the children already converted
+# so each method below just assembles our JrAst node from its (already converted) parts, and lark does the walking and dispatching for us
+#
+# ATTN: lark can also run a transformer DURING an lalr parse (Lark(transformer=...)), which would skip building the parse tree at all
+# but it does not give the transformer any source positions when doing so (it raises NotImplementedError for v_args(meta=True)), and our JrAst nodes need exact source locations for error reporting
+# so we run it on the parse tree after the parse instead
+#
+# Entries (and their merging by id) are not handled here; see JrAstEntryChildHelper, which calls us on each entry's header and body (transformEntryCore)
+#
+# Errors: the old hand-written walk raised exceptions as it went, and JrAstEntryChildHelper catches them per entry (so we can continue on exception and report ALL bad entries)
+# lark would wrap any exception we raise in a VisitError and abort the whole transform, so instead we catch the exception and hand back a JrAstTransformError in place of the node,
+# which gets passed up the tree until it reaches the entry, where JrAstEntryChildHelper raises it, just like before
+
+
+
+class JrAstTransformError:
+    # placeholder node for an exception that happened while converting a subtree
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def deferTransformErrors(func):
+    # decorator for transformer methods: pass on any error from children, and catch our own
+    def wrapper(self, meta, children, *args):
+        for child in children:
+            if isinstance(child, JrAstTransformError):
+                return child
+        try:
+            return func(self, meta, children, *args)
+        except Exception as e:
+            return JrAstTransformError(e)
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def unwrapNestedExpression(node):
+    # a parenthesized expression inside an expression is just its contents (our AST has no node for the parentheses)
+    if isinstance(node, JrAstExpression):
+        return node.element
+    return node
+
+
+
+
+
+
+
+@v_args(meta=True)
+class JrAstTransformer(Transformer):
+    def __init__(self):
+        # we never need to visit tokens on their own; rules deal with their own tokens
+        super().__init__(visit_tokens=False)
+
+
+    def transformEntryCore(self, pnode, level):
+        # convert just the header and body of an entry pnode, returning a JrAstEntry (without children) or a JrAstTransformError
+        # child entries (pnode children after head and body) are left to the caller, since they may need to be merged with existing entries
+        coreTree = lark.Tree(pnode.data, pnode.children[0:2], pnode.meta)
+        entryAst = self.transform(coreTree)
+        if (not isinstance(entryAst, JrAstTransformError)):
+            entryAst.level = level
+        return entryAst
+
+
+
+    # entries
+
+    @deferTransformErrors
+    def level1_entry(self, meta, children):
+        return self.makeEntry(meta, children, 1)
+
+    @deferTransformErrors
+    def level2_entry(self, meta, children):
+        return self.makeEntry(meta, children, 2)
+
+    @deferTransformErrors
+    def level3_entry(self, meta, children):
+        return self.makeEntry(meta, children, 3)
+
+    @deferTransformErrors
+    def overview_level1_entry(self, meta, children):
+        return self.makeEntry(meta, children, 1)
+
+    def makeEntry(self, meta, children, level):
+        # first two children of node are head and body
+        if (len(children) != 2):
+            raise makeJriException("Uncaught syntax error; expected children of entry to be header and body (children entries are converted separately).", JrSourceLocation(meta))
+        [headerItems, bodyBlockSeq] = children
+        entryAst = JrAstEntry(meta, None, level)
+        for headerItem in headerItems:
+            if (isinstance(headerItem, JrAstArgumentList)):
+                entryAst.setOptions(headerItem)
+            else:
+                if (headerItem["id"] is not None):
+                    entryAst.setId(headerItem["id"])
+                if (headerItem["label"] is not None):
+                    entryAst.setLabel(headerItem["label"])
+        # body (may be None)
+        if (bodyBlockSeq is not None):
+            entryAst.addAstBodyBlockSeq(entryAst.adoptChild(bodyBlockSeq))
+        return entryAst
+
+
+    @deferTransformErrors
+    def entry_header(self, meta, children):
+        # list of id/label dicts and options argument lists
+        return children
+
+    @deferTransformErrors
+    def entry_id_opt_label(self, meta, children):
+        headerItem = {"id": None, "label": None}
+        for child in children:
+            headerItem.update(child)
+        return headerItem
+
+    @deferTransformErrors
+    def overview_level1_id(self, meta, children):
+        return self.entry_id_opt_label(meta, children)
+
+    @deferTransformErrors
+    def entry_id(self, meta, children):
+        idNode = children[0]
+        if (isinstance(idNode, JrAstExpressionAtom)):
+            # quoted string id
+            return {"id": idNode.getOperand().getWrapped()}
+        return {"id": idNode.value.strip()}
+
+    @deferTransformErrors
+    def overview_entry_id(self, meta, children):
+        return self.entry_id(meta, children)
+
+    @deferTransformErrors
+    def entry_label(self, meta, children):
+        return {"label": children[0].getOperand().getWrapped()}
+
+    @deferTransformErrors
+    def entry_options(self, meta, children):
+        # options come as an argument list which is child 0 of options; nothing else
+        argumentList = children[0]
+        if (argumentList is None):
+            argumentList = JrAstArgumentList(None, None, [], {})
+        return argumentList
+
+    @deferTransformErrors
+    def entry_body(self, meta, children):
+        # the block seq (may be None)
+        return children[0]
+
+
+
+    # blocks
+
+    @deferTransformErrors
+    def blockseq_with_newlines(self, meta, children):
+        return JrAstBlockSeq(meta, None, children)
+
+    @deferTransformErrors
+    def blockseq_req_newline(self, meta, children):
+        return JrAstBlockSeq(meta, None, children)
+
+    @deferTransformErrors
+    def block(self, meta, children):
+        return children[0]
+
+    @deferTransformErrors
+    def newline(self, meta, children):
+        return JrAstNewline(meta, None)
+
+    @deferTransformErrors
+    def text_block(self, meta, children):
+        # we just record where the text is in the source (for a raw <<<>>> block the token excludes the delimiters)
+        return JrAstBlockText(meta, None, children[0].start_pos, children[-1].end_pos)
+
+    @deferTransformErrors
+    def brace_group(self, meta, children):
+        # a brace group takes its location from the block seq inside it
+        blockSeq = children[0]
+        if (blockSeq is None):
+            return JrAstBraceGroup(None, None, [])
+        return JrAstBraceGroup(blockSeq.getSourceLoc(), None, blockSeq.blocks)
+
+    @deferTransformErrors
+    def multi_brace_group(self, meta, children):
+        return children
+
+    @deferTransformErrors
+    def function_call(self, meta, children):
+        childCount = len(children)
+        if (childCount>3):
+            raise makeJriException("Internal error: Expected 2 or 3 children for function call parse.", JrSourceLocation(meta))
+        functionNameNode = children[0]
+        argumentList = children[1]
+        if (argumentList is None):
+            argumentList = JrAstArgumentList(None, None, [], {})
+        # now target brace groups
+        if (childCount==3):
+            targetGroups = children[2]
+        else:
+            targetGroups = []
+        return JrAstFunctionCall(meta, None, functionNameNode.value, argumentList, targetGroups)
+
+
+
+    # control statements
+
+    @deferTransformErrors
+    def control_statement(self, meta, children):
+        return children[0]
+
+    @deferTransformErrors
+    def if_statement(self, meta, children):
+        [ifExpression, [consequenceTrue, elseNode]] = children
+        elseIf = None
+        consequenceElse = None
+        if (isinstance(elseNode, JrAstControlStatementIf)):
+            elseIf = elseNode
+        elif (elseNode is not None):
+            consequenceElse = elseNode
+        return JrAstControlStatementIf(meta, None, ifExpression, consequenceTrue, elseIf, consequenceElse)
+
+    @deferTransformErrors
+    def if_consequence(self, meta, children):
+        # consequence group, and then EITHER an elif or an else (or neither)
+        if (len(children) > 1):
+            return [children[0], children[1]]
+        return [children[0], None]
+
+    @deferTransformErrors
+    def elif_statement(self, meta, children):
+        return children[0]
+
+    @deferTransformErrors
+    def else_statement(self, meta, children):
+        return children[0]
+
+    @deferTransformErrors
+    def for_statement(self, meta, children):
+        [[identifierName, inExpression], loopConsequence] = children
+        return JrAstControlStatementFor(meta, None, identifierName, inExpression, loopConsequence)
+
+    @deferTransformErrors
+    def for_expression_in(self, meta, children):
+        # identifier that will loop through list, and expression which will HAVE to evaluate at runtime into a list
+        return [children[0].value, children[1]]
+
+
+
+    # arguments
+
+    @deferTransformErrors
+    def argument_list(self, meta, children):
+        positionalArgs = []
+        namedArgs = {}
+        for child in children:
+            if (isinstance(child, list)):
+                positionalArgs = child
+            else:
+                namedArgs = child
+        return JrAstArgumentList(meta, None, positionalArgs, namedArgs)
+
+    @deferTransformErrors
+    def positional_argument_list(self, meta, children):
+        # each child will be an expression
+        return children
+
+    @deferTransformErrors
+    def named_argument_list(self, meta, children):
+        # each child will be an assignment (keyToken, expression)
+        argDict = {}
+        for [keyNode, expression] in children:
+            keyName = keyNode.value
+            if (keyName in argDict):
+                raise makeJriException("Duplicate key in arg list ({}).".format(keyName), JrSourceLocation(keyNode))
+            argDict[keyName] = expression
+        return argDict
+
+    @deferTransformErrors
+    def argument_assignment(self, meta, children):
+        return tuple(children)
+
+
+
+    # expressions
+
+    @deferTransformErrors
+    def expression(self, meta, children):
+        # the child is the rule (either an operation or an atom)
+        if (len(children) != 1):
+            raise makeJriException("Expression parsing", JrSourceLocation(meta))
+        return JrAstExpression(meta, None, unwrapNestedExpression(children[0]))
+
+    def __default__(self, data, children, meta):
+        # binary and unary operators are named after reserved python words (and, or, in, not) so we can't have methods for them; we catch them here
+        rule = str(data)
+        if (rule in JrCbLarkRule_Operation_Binary_AllList):
+            return self.binaryOperation(meta, children, rule)
+        if (rule in JrCbLarkRule_Operation_Unary_AllList):
+            return self.unaryOperation(meta, children, rule)
+        return super().__default__(data, children, meta)
+
+    @deferTransformErrors
+    def binaryOperation(self, meta, children, rule):
+        return JrAstExpressionBinary(rule, meta, None, unwrapNestedExpression(children[0]), unwrapNestedExpression(children[1]))
+
+    @deferTransformErrors
+    def unaryOperation(self, meta, children, rule):
+        return JrAstExpressionUnary(rule, meta, None, unwrapNestedExpression(children[0]))
+
+
+
+    # atoms
+
+    @deferTransformErrors
+    def string(self, meta, children):
+        stringToken = children[0]
+        stringType = stringToken.type
+        stringValue = stringToken.value
+        if (stringType in [JrCbLarkRule_STRING_DOUBLE_QUOTE, JrCbLarkRule_STRING_SINGLE_QUOTE, JrCbLarkRule_UNICODE_STRING]):
+            # remove outer double quotes
+            literalValue = stringValue[1:len(stringValue)-1]
+        elif (stringType == JrCbLarkRule_STRING_TRIPLE_SINGLE_QUOTE):
+            # remove outer triple quotes
+            literalValue = stringValue[3:len(stringValue)-3]
+        else:
+            raise makeJriException("Uncaught syntax error; expected string token of type {}.".format([JrCbLarkRule_STRING_DOUBLE_QUOTE, JrCbLarkRule_STRING_SINGLE_QUOTE, JrCbLarkRule_UNICODE_STRING]), JrSourceLocation(stringToken))
+        return JrAstExpressionAtom(JrCbLarkRule_Atom_string, meta, None, AstValString(meta, None, literalValue))
+
+    @deferTransformErrors
+    def number(self, meta, children):
+        return JrAstExpressionAtom(JrCbLarkRule_Atom_number, meta, None, AstValNumber(meta, None, children[0].value))
+
+    @deferTransformErrors
+    def boolean(self, meta, children):
+        return JrAstExpressionAtom(JrCbLarkRule_Atom_boolean, meta, None, AstValBool(meta, None, children[0]))
+
+    @deferTransformErrors
+    def boolean_true(self, meta, children):
+        return True
+
+    @deferTransformErrors
+    def boolean_false(self, meta, children):
+        return False
+
+    @deferTransformErrors
+    def identifier(self, meta, children):
+        return JrAstExpressionAtom(JrCbLarkRule_Atom_identifier, meta, None, AstValIdentifier(meta, None, children[0].value))
+
+    @deferTransformErrors
+    def null(self, meta, children):
+        return JrAstExpressionAtom(JrCbLarkRule_Atom_null, meta, None, AstValNull(meta, None))
+
+
+
+    # collections
+
+    @deferTransformErrors
+    def collection_list(self, meta, children):
+        itemList = children[0]
+        if (itemList is None):
+            itemList = []
+        return JrAstExpressionCollectionList(meta, None, itemList)
+
+    @deferTransformErrors
+    def collection_dict(self, meta, children):
+        contents = children[0]
+        if (contents is None):
+            assignments = []
+        elif (isinstance(contents, tuple)):
+            # a single assignment is not wrapped in a collection_dict_contents
+            assignments = [contents]
+        else:
+            assignments = contents
+        itemDict = {}
+        for [keyAtom, expression] in assignments:
+            keyName = keyAtom.getOperand().getWrapped()
+            if (keyName in itemDict):
+                raise makeJriException("Duplicate key in dictionary ({}).".format(keyName), keyAtom)
+            itemDict[keyName] = expression
+        return JrAstExpressionCollectionDict(meta, None, itemDict)
+
+    @deferTransformErrors
+    def collection_dict_contents(self, meta, children):
+        return children
+
+    @deferTransformErrors
+    def collection_dict_assignment(self, meta, children):
+        return tuple(children)
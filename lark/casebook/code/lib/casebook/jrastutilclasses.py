@@ -2,18 +2,20 @@
 import lark
 
 # jrast
-from .jrastfuncs import wrapValIfNotAlreadyWrapped
-from .jrastvals import AstValObject
+from .jrastfuncs import wrapValIfNotAlreadyWrapped, splitIdentifierParts
+from .jrastvals import AstValObject, AstValFunction
 from .jriexception import *
 
 
 # my libs
 from lib.jr import jrfuncs
 from lib.jr.jrfuncs import jrprint
+from lib.jr.jrprofiler import JrProfiler
 
 
 # python modules
 import traceback
+import bisect
 
 
 # defines
@@ -24,87 +26,157 @@ DefAlwaysStoreContextInEveryEnvironment = True
 DefRmodeRun = "run"
 DefRmodeRender = "render"
 
+# trace (debug output) categories and levels; see JrAstContext.isTracing
+DefTraceCategoryParse = "parse"
+DefTraceCategoryAst = "ast"
+DefTraceCategoryRun = "run"
+DefTraceCategoryFunction = "function"
+DefTraceCategories = [DefTraceCategoryParse, DefTraceCategoryAst, DefTraceCategoryRun, DefTraceCategoryFunction]
+DefTraceLevelOff = 0
+DefTraceLevelInfo = 1
+DefTraceLevelDetail = 2
 
 
 
 
 
 
+
+# blank (unknown) location
+DefBlankSourceLocationTuple = (-1, -1, -1, -1, -1, -1)
+
+
 # for tracking source location of tokens
-class JrSourceLocation:
-    def __init__(self, sloc=None):
-        #
-        self.copyFrom(sloc)
-
-    def clearLocation(self):
-        self.start_pos = -1
-        self.end_pos = -1
-        self.line = -1
-        self.column = -1
-        self.end_line = -1
-        self.end_column = -1
-
-    def copyFrom(self, fromObj):
-        if (fromObj is None):
+class JrSourceLocation(tuple):
+    # every ast node has one of these, so to keep them small a location IS just a packed tuple of six ints (line, column, end_line, end_column, start_pos, end_pos)
+    # being an immutable tuple, a node whose location is copied from another node (or another location) can just share it
+    __slots__ = ()
+
+    def __new__(cls, sloc=None):
+        if (sloc is None):
             # blank
-            self.clearLocation()
-            return
-        
-        if (isinstance(fromObj, lark.Tree)):
-            # lark tree has token as data
-            sloc = fromObj.meta
-
-        if (not hasattr(fromObj,"start_pos") and (hasattr(fromObj,"meta"))):
-            fromObj = fromObj.meta
-
-        if (hasattr(fromObj,"start_pos")):
-            # already a JrSourceLocation; copy from it?
-            # or its a lark token type see https://lark-parser.readthedocs.io/en/latest/classes.html#token
-            self.line = fromObj.line
-            self.start_pos = fromObj.start_pos
-            self.end_pos = fromObj.end_pos
-            self.column = fromObj.column
-            self.end_line = fromObj.end_line
-            self.end_column = fromObj.end_column
-            return
-        if (hasattr(fromObj,"getSourceLine")):
-            # already a JrSourceLocation; copy from it?
-            # or its a lark token type see https://lark-parser.readthedocs.io/en/latest/classes.html#token
-            self.line = fromObj.getSourceLine()
-            self.start_pos = fromObj.getSourceStartPos()
-            self.end_pos = fromObj.getSourceEndPos()
-            self.column = fromObj.getSourceColumn()
-            self.end_line = fromObj.getSourceEndLine()
-            self.end_column = fromObj.getSourceEndColumn()
-            return
-
-        
-        if (isinstance(fromObj, lark.Token) or isinstance(fromObj, lark.tree.Meta)):
-            # no line number attribues for this particular token it seems
-            self.clearLocation()
-            return
-
-        # error and we don't know how to report where the problem is
-        msg = "Internal interpretter error; sloc info was not understood ({}).".format(fromObj)
-        raise makeJriException(msg, None)
+            return DefBlankSourceLocation
+        if (isinstance(sloc, JrSourceLocation)):
+            return sloc
+        if (hasattr(sloc,"getSourceLoc")):
+            # a JrAst node; share its location
+            return sloc.getSourceLoc()
+        return tuple.__new__(cls, calcSourceLocationTuple(sloc))
+
+    def __reduce__(self):
+        # our __new__ wants a lark node (or similar), so for pickling (see ast snapshots) we rebuild from the plain tuple instead
+        return (restoreSourceLocationFromTuple, (tuple(self),))
 
     def debugString(self):
-        str = "line {}:{}".format(self.line, self.column)
+        str = "line {}:{}".format(self[0], self[1])
         return str
 
     
     def getSourceLine(self):
-        return self.line
-    def getSourceStartPos(self):
-        return self.start_pos
-    def getSourceEndPos(self):
-        return self.end_pos
+        return self[0]
     def getSourceColumn(self):
-        return self.column
+        return self[1]
     def getSourceEndLine(self):
-        return self.end_line
+        return self[2]
     def getSourceEndColumn(self):
-        return self.end_column
+        return self[3]
+    def getSourceStartPos(self):
+        return self[4]
+    def getSourceEndPos(self):
+        return self[5]
+
+
+
+
+# shared blank (unknown) location
+DefBlankSourceLocation = tuple.__new__(JrSourceLocation, DefBlankSourceLocationTuple)
+
+
+def restoreSourceLocationFromTuple(slocTuple):
+    # unpickling helper for JrSourceLocation; blank locations go back to being the shared one
+    if (slocTuple == DefBlankSourceLocationTuple):
+        return DefBlankSourceLocation
+    return tuple.__new__(JrSourceLocation, slocTuple)
+
+
+
+def calcSourceLocationTuple(fromObj):
+    # return the (line, column, end_line, end_column, start_pos, end_pos) tuple for a lark tree/meta/token, or a plain tuple (from unpickling)
+    if (isinstance(fromObj, tuple)):
+        return fromObj
+
+    if (not hasattr(fromObj,"start_pos") and (hasattr(fromObj,"meta"))):
+        # lark tree has location in meta
+        fromObj = fromObj.meta
+
+    if (hasattr(fromObj,"start_pos")):
+        # its a lark token or meta type see https://lark-parser.readthedocs.io/en/latest/classes.html#token
+        return (fromObj.line, fromObj.column, fromObj.end_line, fromObj.end_column, fromObj.start_pos, fromObj.end_pos)
+    if (isinstance(fromObj, lark.Token) or isinstance(fromObj, lark.tree.Meta)):
+        # no line number attribues for this particular token it seems
+        return DefBlankSourceLocationTuple
+
+    # error and we don't know how to report where the problem is
+    msg = "Internal interpretter error; sloc info was not understood ({}).".format(fromObj)
+    raise makeJriException(msg, None)
+
+
+
+
+
+
+
+
+
+
+# index of where each line starts in a source text
+# lets us find the line (and column) of a source position with a binary search instead of scanning the text; built once per source (see JrAstRoot.setRawSourceDict)
+class JrSourceLineIndex:
+    __slots__ = ("text", "lineStartPositions")
+
+    def __init__(self, text):
+        self.text = text
+        lineStartPositions = [0]
+        pos = text.find("\n")
+        while (pos != -1):
+            lineStartPositions.append(pos+1)
+            pos = text.find("\n", pos+1)
+        self.lineStartPositions = lineStartPositions
+
+    def calcLineIndexAtPos(self, pos):
+        # 0-based line index of the line containing pos
+        return bisect.bisect_right(self.lineStartPositions, pos) - 1
+
+    def calcLineColumnAtPos(self, pos):
+        # 1-based [line, column] (like lark) of pos
+        lineIndex = self.calcLineIndexAtPos(pos)
+        return [lineIndex+1, pos - self.lineStartPositions[lineIndex] + 1]
+
+    def getLineStartEndPos(self, lineIndex):
+        # start and end pos (not including the newline) of a line
+        startPos = self.lineStartPositions[lineIndex]
+        if (lineIndex+1 < len(self.lineStartPositions)):
+            endPos = self.lineStartPositions[lineIndex+1] - 1
+        else:
+            endPos = len(self.text)
+        return [startPos, endPos]
+
+    def extractHighlightedSourceLineAtPos(self, startPos, endPos):
+        # return dict with the text of the line containing startPos, and the start and end pos to highlight (relative to the line)
+        if (startPos < 0) or (startPos > len(self.text)):
+            # unknown location
+            return None
+        retDict = {}
+        [lineStartPos, lineEndPos] = self.getLineStartEndPos(self.calcLineIndexAtPos(startPos))
+        lineText = self.text[lineStartPos:lineEndPos]
+        retDict["highlightedSourceLineText"] = lineText
+        startHighlightPos = startPos - lineStartPos
+        endHighlightPos = endPos - lineStartPos
+        if (endHighlightPos>len(lineText)):
+            endHighlightPos = startHighlightPos+1
+        retDict["highlightedSourceLinePos"] = startHighlightPos
+        retDict["highlightedSourceLineEndPos"] = endHighlightPos
+        return retDict
 
 
 
@@ -172,20 +244,72 @@ class JrSourceLocation:
 
 class JrAstContext:
     def __init__(self, debugMode, flagContinueOnException):
-        self.debugMode = debugMode
         self.flagContinueOnException = flagContinueOnException
         #
+        # trace level for each category (see isTracing); debug mode turns them all up to detail
+        self.traceLevels = {}
+        self.setDebugMode(debugMode)
+        #
         self.exceptionTracebackLimit = 1
+        #
+        # bumped whenever a function name is (re)declared, shadowed or assigned, which invalidates function call sites bound to a function (see JrAstFunctionCall.bindFunction)
+        self.functionBindingGeneration = 0
+        # bumped whenever a declaration shadows a variable in a parent scope, which invalidates env addresses cached on identifiers (see JrAstEnvironment.lookupJrEnvVarForIdentifier)
+        self.envAddressGeneration = 0
+        #
+        # timing spans for load/parse/convert/setup phases, each entry render and each function invoke (see JrProfiler)
+        self.profiler = JrProfiler()
+        #
+        # render cache (see JrRenderCache), if on
+        self.renderCache = None
+        # when set, the env reports reads and writes of variables to this (see JrRenderCacheTracker and JrParallelRenderWriteTracker)
+        self.envTracker = None
 
 
     def setDebugMode(self, debugMode):
         self.debugMode = debugMode
+        for category in DefTraceCategories:
+            self.setTraceLevel(category, DefTraceLevelDetail if (debugMode) else DefTraceLevelOff)
     def getDebugMode(self):
         return self.debugMode
+
+    def setTraceLevel(self, category, level):
+        self.traceLevels[category] = level
+    def getTraceLevel(self, category):
+        return self.traceLevels.get(category, DefTraceLevelOff)
+    def isTracing(self, category, level=DefTraceLevelInfo):
+        # callers check this BEFORE building any trace message, so that when tracing is off we don't pay for formatting (or for evaluating anything just to display it)
+        return (self.traceLevels.get(category, DefTraceLevelOff) >= level)
     def getFlagContinueOnException(self):
         return self.flagContinueOnException
+    def getProfiler(self):
+        return self.profiler
+    def setProfiler(self, profiler):
+        self.profiler = profiler
+    def getRenderCache(self):
+        return self.renderCache
+    def setRenderCache(self, renderCache):
+        self.renderCache = renderCache
+    def getEnvTracker(self):
+        return self.envTracker
+    def setEnvTracker(self, tracker):
+        self.envTracker = tracker
+    def noteRenderSideEffect(self, reason):
+        # anything other than an env read that a render does (writes, warnings, exceptions) means we can't reuse a cached copy of it
+        if (self.envTracker is not None):
+            self.envTracker.noteSideEffect(reason)
+
+    def getFunctionBindingGeneration(self):
+        return self.functionBindingGeneration
+    def invalidateFunctionBindings(self):
+        self.functionBindingGeneration += 1
+    def getEnvAddressGeneration(self):
+        return self.envAddressGeneration
+    def invalidateEnvAddresses(self):
+        self.envAddressGeneration += 1
 
     def displayException(self, e):
+        self.noteRenderSideEffect("exception")
         tracebackLimit = self.exceptionTracebackLimit
         if (tracebackLimit >= 0):
             tracebackLines = traceback.format_exception(e, limit = tracebackLimit)
@@ -193,7 +317,7 @@ class JrAstContext:
         else:
             tracebackText = "disabled"
         #
-        jrprint("CONTINUING AFTER EXCEPTION: {}.  Traceback: {}.".format(repr(e), tracebackText))
+        jrprint("CONTINUING AFTER EXCEPTION: {}.  Traceback: {}.".format(repr(e), tracebackText), severity=jrfuncs.DefLogSeverityError)
 
 
 
@@ -250,7 +374,10 @@ class JrAstEnvironment:
         if (DefAlwaysStoreContextInEveryEnvironment) or (parentEnv is None):
             self.context = context
         #
-        self.envDict = {}
+        # variables live in an array-backed frame; slotIndex maps a (base) variable name to its slot in slotVars
+        # slots are never removed or reordered, so the (depth, slot) address of a variable stays good until a new declaration shadows it
+        self.slotIndex = {}
+        self.slotVars = []
         #
         # create task
         self.declareEnvVar(None, "task", "", None, True)
@@ -258,13 +385,16 @@ class JrAstEnvironment:
 
     def getDebugMode(self):
         return self.getContext().getDebugMode()
+    def isTracing(self, category, level=DefTraceLevelInfo):
+        return self.getContext().isTracing(category, level)
+    def getProfiler(self):
+        return self.getContext().profiler
     def getFlagContinueOnException(self):
         return self.getContext().getFlagContinueOnException()
     
 
 
 
-
     # environmental variables (note that on set we just overwrite)
 
     # NOTE: identifier names can be DOTTED hierarchies inside objects; we need to handle that
@@ -274,55 +404,105 @@ class JrAstEnvironment:
         # return [envVar, baseName, partList]
 
         # split identifier into base and parts
-        [baseVarName, propertyParts] = self.splitIndentifierParts(identifierName)
+        [baseVarName, propertyParts] = splitIdentifierParts(identifierName)
+
+        address = self.lookupEnvVarAddress(baseVarName, flagGoUpHierarchy)
+        if (address is None):
+            # not found
+            return [None, None, None]
+        return [self.getEnvVarAtAddress(address), baseVarName, propertyParts]
 
-        if (baseVarName in self.envDict):
-            # its defined locally; return the triplet
-            return [self.envDict[baseVarName], baseVarName, propertyParts]
-        if (flagGoUpHierarchy) and (self.parentEnv is not None):
-            # search up hierarchy of environments
-            return self.parentEnv.lookupJrEnvVar(sloc, identifierName, True)
 
-        # not found
-        return [None, None, None]
+    def lookupJrEnvVarForIdentifier(self, identifierVal):
+        # same as lookupJrEnvVar(.., True) but for an AstValIdentifier, which keeps its identifier pre-split and caches the address its variable was found at
+        # the cached address is good as long as we are asked from the same env and no declaration has shadowed anything since (see JrAstContext.invalidateEnvAddresses)
+        generation = self.getContext().getEnvAddressGeneration()
+        addressCache = identifierVal.envAddressCache
+        if (addressCache is not None) and (addressCache[0] is self) and (addressCache[1] == generation):
+            address = addressCache[2]
+        else:
+            address = self.lookupEnvVarAddress(identifierVal.baseName, True)
+            if (address is None):
+                # not found (we don't cache this, since it may be declared later)
+                return [None, None, None]
+            identifierVal.envAddressCache = (self, generation, address)
+        return [self.getEnvVarAtAddress(address), identifierVal.baseName, identifierVal.propertyParts]
+
+
+    def lookupEnvVarAddress(self, baseVarName, flagGoUpHierarchy):
+        # return (depth, slot) of the nearest variable with this (undotted) name, where depth is how many envs up the hierarchy it lives; or None if not found
+        env = self
+        depth = 0
+        while (env is not None):
+            slot = env.slotIndex.get(baseVarName)
+            if (slot is not None):
+                return (depth, slot)
+            if (not flagGoUpHierarchy):
+                break
+            env = env.parentEnv
+            depth += 1
+        return None
 
 
-    def splitIndentifierParts(self, identifierName):
-        parts = identifierName.split(".")
-        if (len(parts)==0):
-            return [None, None]
-        if (len(parts)==1):
-            return [parts[0], None]
-        return [ parts[0], parts[1:] ]
+    def getEnvVarAtAddress(self, address):
+        [depth, slot] = address
+        env = self
+        for i in range(depth):
+            env = env.parentEnv
+        return env.slotVars[slot]
+
 
 
     # declare var in THIS env scope
     def declareEnvVar(self, sloc, identifierName, description, val, isConstant):
-        [envVar, baseName, partList] = self.lookupJrEnvVar(sloc, identifierName, False)
+        [baseName, partList] = splitIdentifierParts(identifierName)
         # first, complain if they try to DECLARE a dotted name
         if (partList is not None):
             raise self.makeEnvException("Error; dotted object identifiers ({}) cannot be declared".format(identifierName), sloc)
-        if (envVar is not None):
-            # error already exists
-            raise self.makeEnvExceptionWithPreviousValue("Runtime error; identifier '{}' already exists in current environment scope and so cannot be redeclared".format(identifierName), sloc, envVar)
-        # ATTN: note that we dont complain if we are shadowing a parent env variable, but we COULD add a warning for it if we wanted
-        if (True):
-            [envVar, baseName, partList] = self.lookupJrEnvVar(sloc, identifierName, True)
-            if (envVar is not None):
-                # warning
-                self.logEnvWarningWithPreviousValue("Runtime warning; declaring a variable '{}' which will shadow an existing variable in parent scope".format(identifierName), sloc, envVar)
+        # one walk up the hierarchy tells us both if it already exists here, and if we are shadowing a parent env variable
+        address = self.lookupEnvVarAddress(baseName, True)
+        envVar = None
+        if (address is not None):
+            envVar = self.getEnvVarAtAddress(address)
+            if (address[0] == 0):
+                # error already exists
+                raise self.makeEnvExceptionWithPreviousValue("Runtime error; identifier '{}' already exists in current environment scope and so cannot be redeclared".format(identifierName), sloc, envVar)
+            # ATTN: note that we dont complain if we are shadowing a parent env variable, but we COULD add a warning for it if we wanted
+            self.logEnvWarningWithPreviousValue(sloc, "Runtime warning; declaring a variable '{}' which will shadow an existing variable in parent scope".format(identifierName), envVar)
+            # addresses cached for this name may now skip past our new variable
+            self.getContext().invalidateEnvAddresses()
+        # declaring a function, or shadowing one, changes what function call sites with this name should call
+        if (isinstance(val, AstValFunction)) or ((envVar is not None) and (isinstance(envVar.getStoredValue(sloc, None), AstValFunction))):
+            self.getContext().invalidateFunctionBindings()
+        tracker = self.getContext().envTracker
+        if (tracker is not None):
+            tracker.noteWrite(sloc, identifierName, "declaration")
         # create it
-        self.envDict[identifierName] = JrEnvVar(sloc, identifierName, description, val, isConstant)
+        self.slotIndex[baseName] = len(self.slotVars)
+        self.slotVars.append(JrEnvVar(sloc, identifierName, description, val, isConstant))
 
 
     # set a value; NOTE we require all variables to be declared before use so this is an error if it cannot be found in scope -- it won't be creatded
     def setEnvValue(self, sloc, identifierName, val, flagCheckConst):
         [envVar, baseName, partList] = self.lookupJrEnvVar(sloc, identifierName, True)
+        self.setFoundEnvVarValue(sloc, identifierName, envVar, partList, val, flagCheckConst)
+
+    def setEnvValueForIdentifier(self, sloc, identifierVal, val, flagCheckConst):
+        [envVar, baseName, partList] = self.lookupJrEnvVarForIdentifier(identifierVal)
+        self.setFoundEnvVarValue(sloc, identifierVal.getWrapped(), envVar, partList, val, flagCheckConst)
+
+    def setFoundEnvVarValue(self, sloc, identifierName, envVar, partList, val, flagCheckConst):
         if (not envVar):
             # error does not exist
             raise self.makeEnvException("Runtime error; identifier '{}' has not been declared in this or any parent scope".format(identifierName), sloc)
         if (flagCheckConst and envVar.getIsConstant()):
             raise self.makeEnvExceptionWithPreviousValue("Runtime error; identifier {} has been declared constant and so cannot be reassigned".format(identifierName), sloc, envVar)
+        # assigning to (or from) a function changes what function call sites with this name should call
+        if (isinstance(val, AstValFunction)) or (isinstance(envVar.getStoredValue(sloc, None), AstValFunction)):
+            self.getContext().invalidateFunctionBindings()
+        tracker = self.getContext().envTracker
+        if (tracker is not None):
+            tracker.noteWrite(sloc, identifierName, "assignment")
         # set the non-const value
         envVar.setValue(sloc, partList, val, flagCheckConst)
 
@@ -330,11 +510,30 @@ class JrAstEnvironment:
 
     def getEnvValue(self, sloc, identifierName, defaultVal):
         [envVar, baseName, partList] = self.lookupJrEnvVar(sloc, identifierName, True)
+        tracker = self.getContext().envTracker
         if (envVar is None):
             # not found
+            if (tracker is not None):
+                tracker.noteRead(identifierName, None)
             return defaultVal
         # ask the envvar for its value
         retVal = envVar.getWrappedValue(sloc, partList)
+        if (tracker is not None):
+            tracker.noteRead(identifierName, retVal)
+        return retVal
+
+    def getEnvValueForIdentifier(self, sloc, identifierVal, defaultVal):
+        [envVar, baseName, partList] = self.lookupJrEnvVarForIdentifier(identifierVal)
+        tracker = self.getContext().envTracker
+        if (envVar is None):
+            # not found
+            if (tracker is not None):
+                tracker.noteRead(identifierVal.getWrapped(), None)
+            return defaultVal
+        # ask the envvar for its value
+        retVal = envVar.getWrappedValue(sloc, partList)
+        if (tracker is not None):
+            tracker.noteRead(identifierVal.getWrapped(), retVal)
         return retVal
 
 
@@ -384,7 +583,11 @@ class JrAstEnvironment:
 
 
     def getTask(self):
-        return self.getEnvValue(None, "task", None)
+        # the env hands back values wrapped; we want the AstTask itself
+        taskVal = self.getEnvValue(None, "task", None)
+        if (taskVal is None):
+            return None
+        return taskVal.getWrapped()
     def setTask(self, task):
         return self.setEnvValue(None, "task", task, False)
 
@@ -404,7 +607,10 @@ class JrEnvVar:
     # so memory use is much higher than strictly needed, in order to support robust error reporting; this is ok for Casebook language tradeoff
     #
     # ON THE OTHER HAND: it seems like a lot of duplicity here, in that an EnvVar wraps as AtstVal which ALSO has env, sloc info; some of this seems very duplicative
+    # we at least use __slots__ so each one doesn't carry its own __dict__
     #
+    __slots__ = ("sloc", "name", "description", "value", "isConstant")
+
     def __init__(self, sloc, name, description, initialValue, isConstant):
         self.sloc = sloc
         self.name = name
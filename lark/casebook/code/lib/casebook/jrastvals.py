@@ -1,7 +1,8 @@
 # jrast
 from .jrastfuncs import calcNiceShortTypeStr
-from .jrastfuncs import convertToSourceLocationObject, astPrintDebugLine, extractHighlightedSourceLineAtPos
+from .jrastfuncs import convertToSourceLocationObject, astPrintDebugLine
 from .jrastfuncs import getObjectDictHierarchicalProperty, setObjectDictHierarchicalProperty
+from .jrastfuncs import splitIdentifierParts
 from .jriexception import *
 
 
@@ -15,12 +16,20 @@ import re
 
 # JrAst is base class for our Abstract Syntax Tree nodes
 class JrAst:
+    # we create a LOT of these nodes (and AstVals at runtime), so we use __slots__ to keep them compact (no per-node __dict__)
+    # every derived class must declare __slots__ for its own attributes (an empty tuple if none), or it gets a __dict__ again
+    __slots__ = ("sloc", "parentp")
+
     def __init__(self, sloc, parentp):
         # each node stores a reference to an object that records source location (taken originally from the lark parser), which is used (only) for error reporting
         # it can be passed to use as a lark node or another sloc object, and stores it as sloc lightweight object
         # often sloc and parentp will be identical but the idea is that sloc is an object used to identify the source code location (it may be JrSourceLocation obj, pnode, or JrAst)
         # wheras parentp is ALWAYS a hierarchy parent JrAst in the AST tree
-        self.sloc = convertToSourceLocationObject(sloc)
+        if (isinstance(sloc, JrAst)):
+            # share the source location of the node we were given (the common case for values created at runtime)
+            self.sloc = sloc.sloc
+        else:
+            self.sloc = convertToSourceLocationObject(sloc)
         self.parentp = parentp
 
     def printDebug(self, depth, extraInfo = None):
@@ -43,35 +52,50 @@ class JrAst:
         # just last bit of type
         return self.__class__.__name__
 
+    def getRootp(self):
+        # climb hierarchy up to the root (the only node without a parent)
+        nodep = self
+        while (nodep.parentp is not None):
+            nodep = nodep.parentp
+        return nodep
+
     def getRootRawSourceDict(self):
-        # climb hierarchy up until we find it
-        if (hasattr(self, "rawSourceDict")):
-            return self.rawSourceDict
-        elif (self.parentp):
-            return self.parentp.getRootRawSourceDict()
-        else:
-            return ({})
+        return self.getRootp().getRawSourceDict()
 
     def getRootRawSourceHighlightedLineDict(self, startPos, endPos):
-        # climb hierarchy up until we find it
-        if (hasattr(self, "rawSourceDict")):
-            locDict = extractHighlightedSourceLineAtPos(self.rawSourceDict["text"], startPos, endPos)
-            if (locDict is None):
-                return None
-            # add path to return
-            locDict["path"] = self.rawSourceDict["path"]
-            return locDict
-        elif (self.parentp):
-            return self.parentp.getRootRawSourceHighlightedLineDict(startPos, endPos)
-        else:
-            return {}
+        return self.getRootp().calcRawSourceHighlightedLineDict(startPos, endPos)
+
+    def getRawSourceDict(self):
+        # only the root has raw source (see JrAstRoot); this is what we get for a node that is not attached to a tree
+        return {}
+
+    def calcRawSourceHighlightedLineDict(self, startPos, endPos):
+        # only the root has raw source (see JrAstRoot); this is what we get for a node that is not attached to a tree
+        return {}
 
 
 
     def convertGenericPnodeContents(self, pnode):
-        # helper function for just storing pnode contents in an ast node
-        # this is only a stopgap, eventually the AST should not hold any info from pnodes
-        return pnode
+        # helper function for storing pnode contents (e.g. preliminary matter) in an ast node
+        # the AST never holds on to parse nodes, so we keep just the source location (its text can be sliced from the raw source if ever needed)
+        return convertToSourceLocationObject(pnode)
+
+
+    def adoptChild(self, child):
+        # child nodes are built (by the transformer) before their parent, so the parent claims them when it is built
+        if (child is not None):
+            child.parentp = self
+        return child
+
+
+    def getConstantValueOrNone(self):
+        # expression nodes whose value is known without an env (e.g. literals) return it, so parents can fold constant subexpressions; everything else returns None
+        return None
+
+
+    def bindFunctionCalls(self, env):
+        # bind any function call sites in us or our children (see JrAstFunctionCall.bindFunction); nodes with children that could contain calls override this
+        pass
 
 
     # helpers for getting source loc
@@ -114,6 +138,8 @@ class JrAst:
 # Base AstVal class; all other primitive types derive from this
 # this is basically a wrapper around a string, number, identifier, etc.
 class AstVal(JrAst):
+    __slots__ = ("value",)
+
     def __init__(self, sloc, parentp, val):
         super().__init__(sloc, parentp)
         self.setWrapped(val)
@@ -132,8 +158,8 @@ class AstVal(JrAst):
         return self.getWrapped()
 
     def copyFrom(self, val):
-        self.value = val.value
-        self.sloc.copyFrom(val.sloc)
+        self.setWrapped(val.value)
+        self.sloc = val.sloc
 
     def verifyType(self, expectedType):
         if (self.getType() is not expectedType):
@@ -204,6 +230,8 @@ class AstVal(JrAst):
 
 
 class AstValString(AstVal):
+    __slots__ = ()
+
     def __init__(self, sloc, parentp, val):
         super().__init__(sloc, parentp, val)
     def getWrappedForDisplay(self):
@@ -213,22 +241,34 @@ class AstValString(AstVal):
 
 
 class AstValNumber(AstVal):
+    __slots__ = ()
+
     def __init__(self, sloc, parentp, val):
         super().__init__(sloc, parentp, val)
 
 class AstValBool(AstVal):
+    __slots__ = ()
+
     def __init__(self, sloc, parentp, val):
         super().__init__(sloc, parentp, val)
 
 class AstValIdentifier(AstVal):
+    # we split a dotted identifier once, rather than on every lookup, and cache where in the env its variable was found (see JrAstEnvironment.lookupJrEnvVarForIdentifier)
+    __slots__ = ("baseName", "propertyParts", "envAddressCache")
+
     def __init__(self, sloc, parentp, val):
         super().__init__(sloc, parentp, val)
 
+    def setWrapped(self, val):
+        self.value = val
+        [self.baseName, self.propertyParts] = splitIdentifierParts(val)
+        self.envAddressCache = None
+
     def resolve(self, env, flagResolveIdentifiers):
         # most value return themselves but identifiers can resolve
         if (flagResolveIdentifiers):
             identifierName = self.value
-            resolvedIdentifier = env.getEnvValue(self, identifierName, None)
+            resolvedIdentifier = env.getEnvValueForIdentifier(self, self, None)
             if (resolvedIdentifier is None):
                 msg = "Unknown identifier: {}.".format(identifierName)
                 raise self.makeAvalException(msg)
@@ -241,6 +281,8 @@ class AstValIdentifier(AstVal):
 
 
 class AstValFunction(AstVal):
+    __slots__ = ()
+
     def __init__(self, sloc, parentp, val):
         super().__init__(sloc, parentp, val)
 
@@ -249,6 +291,8 @@ class AstValFunction(AstVal):
 
 
 class AstValNull(AstVal):
+    __slots__ = ()
+
     def __init__(self, sloc, parentp):
         super().__init__(sloc, parentp, None)
 
@@ -259,17 +303,9 @@ class AstValNull(AstVal):
 
 
 
-class AstValLarkNode(AstVal):
-    def __init__(self, sloc, parentp, val):
-        super().__init__(sloc, parentp, val)
-
-
-
-
-
-
-
 class AstValObject(AstVal):
+    __slots__ = ("readOnly", "createKeyOnSet")
+
     def __init__(self, sloc, parentp, val, flagReadOnly, flagCreateKeyOnSet):
         super().__init__(sloc, parentp, val)
         self.readOnly = flagReadOnly
@@ -292,6 +328,8 @@ class AstValObject(AstVal):
 
 
 class AstValList(AstVal):
+    __slots__ = ()
+
     def __init__(self, sloc, parentp, val):
         super().__init__(sloc, parentp, val)
 
@@ -306,6 +344,8 @@ class AstValList(AstVal):
 
 
 class AstValDict(AstVal):
+    __slots__ = ("readOnly", "createKeyOnSet")
+
     def __init__(self, sloc, parentp, val, flagReadOnly, flagCreateKeyOnSet):
         super().__init__(sloc, parentp, val)
         self.readOnly = flagReadOnly
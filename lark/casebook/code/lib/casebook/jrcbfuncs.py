@@ -6,6 +6,7 @@ from .jrastutilclasses import DefRmodeRun, DefRmodeRender
 # my libs
 from lib.jr import jrfuncs
 from lib.jr.jrfuncs import jrprint
+from lib.jr.jrprofiler import DefProfileCategoryFunction
 
 
 
@@ -93,15 +94,22 @@ class CbFunc:
         return [args, defaultArgList]
     
 
-    def resolveArgs(self, rmode, env, astloc, args, targets):
+    def buildArgPlan(self, astloc, argList):
+        # an arg plan is what we pass for each parameter (in declared parameter order): a list of [paramName, param, arg, flagResolveIdentifiers]
+        # where arg is either an (unresolved) expression from the argList or a wrapped default value
+        # a function call site builds its plan once when it is bound (see JrAstFunctionCall.bindFunction), so that invoking just has to resolve the args and call
+        [args, defaultArgList] = self.buildFuncArgs(astloc, argList)
+        argPlan = []
+        for paramName, param in self.paramDict.items():
+            argPlan.append([paramName, param, args[paramName], param.getFlagResolveIdentifiers()])
+        return [argPlan, defaultArgList]
+
+
+    def resolveArgPlan(self, rmode, env, astloc, argPlan, targets):
         # this is done at runtime
         resolvedArgs = {}
-        # do in order of function params for nicer debug listing of args
-        for paramName, param in self.paramDict.items():
-            paramName = param.getName()
-            arg = args[paramName]
-            #
-            flagResolveIdentifiers = param.getFlagResolveIdentifiers()
+        # plan is in order of function params for nicer debug listing of args
+        for [paramName, param, arg, flagResolveIdentifiers] in argPlan:
             # ATTN: TODO maybe force flagResolveIdentifiers to False when rmode == "render"?
             #
             resolvedArg = arg.resolve(env, flagResolveIdentifiers)
@@ -113,17 +121,26 @@ class CbFunc:
 
 
     def invoke(self, rmode, env, astloc, argList, targets):
-        # invoke the function on the argDict
-        # build named arg dict
-        [args, defaultArgList] = self.buildFuncArgs(astloc, argList)
+        # invoke the function on the argList
+        [argPlan, defaultArgList] = self.buildArgPlan(astloc, argList)
+        return self.invokeArgPlan(rmode, env, astloc, argPlan, targets)
+
+
+    def invokeArgPlan(self, rmode, env, astloc, argPlan, targets):
+        # invoke the function with an arg plan already built by buildArgPlan
         # resolve args
-        resolvedArgs = self.resolveArgs(rmode, env, astloc, args, targets)
+        resolvedArgs = self.resolveArgPlan(rmode, env, astloc, argPlan, targets)
 
         # add hidden internal args
         resolvedArgs["_functionName"] = self.getName()
 
         # invoke through function pointer
-        return self.funcPointer(rmode, env, astloc, resolvedArgs, targets)
+        profiler = env.getProfiler()
+        span = profiler.begin(self.name, DefProfileCategoryFunction)
+        try:
+            return self.funcPointer(rmode, env, astloc, resolvedArgs, targets)
+        finally:
+            profiler.end(span)
 
 
     def makeFunctionException(self, msg, sloc):
@@ -163,15 +180,18 @@ class CbFunc:
 
 
 
-    def calcAnnotatedArgListStringForDebug(self, env, astloc, argList, targets):
+    def calcAnnotatedArgListStringForDebug(self, env, astloc, argList, targets, argPlanInfo=None):
         # helper function for debugging
+        # argPlanInfo is the [argPlan, defaultArgList] from buildArgPlan if caller has it already
 
         # catch any error and return it for display
         try:
             # convert positional args into named args, set defaults
-            [args, defaultArgList] = self.buildFuncArgs(astloc, argList)
+            if (argPlanInfo is None):
+                argPlanInfo = self.buildArgPlan(astloc, argList)
+            [argPlan, defaultArgList] = argPlanInfo
             rmode = DefRmodeRun
-            resolvedArgs = self.resolveArgs(rmode, env, astloc, args, targets)
+            resolvedArgs = self.resolveArgPlan(rmode, env, astloc, argPlan, targets)
         except Exception as e:
             return repr(e)
 
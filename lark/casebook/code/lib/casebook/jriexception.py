@@ -49,7 +49,10 @@ def logJriWarning(msg, sloc, env):
     # ATTN: we pass env because we want access to global context so that we can log warnings properly eventually, etc.
     # ATTN: TODO we would like to 
     jri = JriException(msg, sloc, 0)
-    jrprint("JRI WARNING:" + msg)
+    jrprint("JRI WARNING:" + msg, severity=jrfuncs.DefLogSeverityWarning)
+    # a render that warns can't be replayed from the render cache (since that would skip the warning)
+    if (env is not None):
+        env.getContext().noteRenderSideEffect("warning")
 
 
 
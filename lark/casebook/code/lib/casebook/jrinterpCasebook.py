@@ -1,19 +1,34 @@
 # my libs
 from lib.jr import jrfuncs
 from lib.jr.jrfuncs import jrprint
+from lib.jr.jrprofiler import DefProfileCategoryPhase
 
 # jesse lark parser
 from lib.jrlark import jrlark
+import lark
 
 # casebook stuff
 from .cbrender import CbRenderDoc
+from .jrrendercache import JrRenderCache, calcRenderCacheFilePath, DefRenderCacheMaxBytes
 
 # python
 import time
+import os
+import sys
+import glob
+import pickle
+import hashlib
 
 # ast modules
 from . import jrastcbr
-from .jrastutilclasses import AstTask, DefRmodeRun, DefRmodeRender
+from .jrastutilclasses import AstTask, DefRmodeRun, DefRmodeRender, DefTraceCategoryAst, DefTraceCategoryRun, DefTraceLevelDetail
+
+
+# bump this if we change the format of what we store in an ast snapshot; snapshots are also keyed on a hash of the interpreter source (see calcInterpreterSourceHash) so changes to ast classes invalidate them automatically
+DefAstSnapshotFormatVersion = 1
+
+# computed once per process
+moduleInterpreterSourceHash = None
 
 
 
@@ -27,28 +42,145 @@ class JrInterpreterCasebook:
         self.ast = jrastcbr.JrAstRootCbr()
         # parser
         self.jrparser = jrlark.JrParserEngineLark()
+        #
+        self.options = {
+            # on-disk snapshots of the converted ast, keyed on source, grammar and interpreter, so a run on an unchanged source skips parsing and conversion (see loadGrammarParseConvertSourceFile)
+            # None snapshotDir means use our per-user cache dir (see jrfuncs.calcUserCacheDir)
+            "astSnapshot": True,
+            "snapshotDir": None,
+            # on-disk skip cache of entry bodies that rendered without side effects; a body is not run again while its source and everything it read from the env are unchanged (see JrRenderCache)
+            # off by default: a reused entry skips its run trace output, and only entries with no side effects but env reads are ever cached
+            # None renderCacheDir means use our per-user cache dir (see jrfuncs.calcUserCacheDir)
+            "renderCache": False,
+            "renderCacheDir": None,
+            "renderCacheMaxBytes": DefRenderCacheMaxBytes,
+            # render level 2 entries (leads) in a pool of worker processes (see JrAstRoot.renderRunParallel); parallelRenderWorkers None means one per cpu
+            "parallelRender": False,
+            "parallelRenderWorkers": None,
+        }
+        # True if our ast came from a snapshot rather than a parse
+        self.astSnapshotUsed = False
+        # render cache used by the last taskRenderRun (if on), kept so callers can see its stats
+        self.renderCache = None
+
+
+
+
+    def loadGrammarParseSourceFile(self, env, grammarFilePath, sourceFilePath, startSymbol, encoding, flagParallel=None):
+        # flagParallel (if not None) overrides parser option to parse level 1 entries in parallel worker processes
+        if (flagParallel is not None):
+            self.jrparser.options["parallel"] = flagParallel
+        # PART 1: Load casebook grammar from .lark file
+        with env.getProfiler().span("loadGrammar", DefProfileCategoryPhase):
+            self.jrparser.loadGrammarFileFromPath(env, grammarFilePath, encoding)
+        # PART 2: parse source file
+        self.jrparser.parseSourceFromFilePath(env, sourceFilePath, startSymbol, encoding)
 
 
+    def loadGrammarParseConvertSourceFile(self, env, grammarFilePath, sourceFilePath, startSymbol, encoding):
+        # loadGrammarParseSourceFile + convertParseTreeToAst, except that if the source, grammar and interpreter are unchanged since a previous run, we load the converted ast from an on-disk snapshot instead of parsing
+        # any problem with a snapshot just falls back to a full parse (and a fresh snapshot)
+        with env.getProfiler().span("loadGrammar", DefProfileCategoryPhase):
+            self.jrparser.loadGrammarFileFromPath(env, grammarFilePath, encoding)
+        with env.getProfiler().span("load", DefProfileCategoryPhase):
+            self.jrparser.loadSourceFromFilePath(sourceFilePath, encoding)
+
+        self.astSnapshotUsed = False
+        snapshotFilePath = None
+        if (self.options["astSnapshot"]):
+            snapshotKey = self.calcAstSnapshotKey(startSymbol)
+            snapshotFilePath = self.calcAstSnapshotFilePath(snapshotKey)
+            with env.getProfiler().span("loadSnapshot", DefProfileCategoryPhase):
+                ast = self.loadAstSnapshot(snapshotFilePath, snapshotKey)
+            if (ast is not None):
+                self.ast = ast
+                self.ast.setRawSourceDict(self.jrparser.getRawSourceDict())
+                self.astSnapshotUsed = True
+                return self.ast
+
+        # a snapshot would silently drop any errors or warnings reported while parsing and converting, so we only save one for a clean conversion
+        problemCountBefore = jrfuncs.getJrPrintErrorCount() + jrfuncs.getJrPrintWarningCount()
+        self.jrparser.parseLoadedSource(env, startSymbol)
+        self.convertParseTreeToAst(env)
+        problemCount = jrfuncs.getJrPrintErrorCount() + jrfuncs.getJrPrintWarningCount() - problemCountBefore
+        if (snapshotFilePath is not None) and (problemCount == 0):
+            self.saveAstSnapshot(snapshotFilePath, snapshotKey)
+        return self.ast
 
 
-    def loadGrammarParseSourceFile(self, env, grammarFilePath, sourceFilePath, startSymbol, encoding):
-        # PART 1: Load casebook grammar from .lark file
-        self.jrparser.loadGrammarFileFromPath(env, grammarFilePath, encoding)
-        # PART 2: parse source file
-        self.jrparser.parseSourceFromFilePath(env, sourceFilePath, startSymbol, encoding)
+    def calcAstSnapshotKey(self, startSymbol):
+        # content hash of everything that goes into the converted ast
+        jrparser = self.jrparser
+        keyText = "\n".join([str(DefAstSnapshotFormatVersion), calcInterpreterSourceHash(), lark.__version__, str(sys.version_info[:2]), startSymbol, jrparser.grammarText, str(jrparser.grammarTextLalr), jrparser.sourceText])
+        return hashlib.sha256(keyText.encode("utf-8")).hexdigest()
+
+
+    def calcAstSnapshotFilePath(self, snapshotKey):
+        # one snapshot per source file path (a new one replaces the old), named so that different source files don't collide
+        snapshotDir = self.options["snapshotDir"]
+        if (snapshotDir is None):
+            snapshotDir = jrfuncs.calcUserCacheDir("astsnapshots")
+        sourcePathHash = hashlib.sha256(os.path.realpath(self.jrparser.sourceFilePath).encode("utf-8")).hexdigest()[0:16]
+        return snapshotDir + "/ast_" + os.path.splitext(os.path.basename(self.jrparser.sourceFilePath))[0] + "_" + sourcePathHash + ".pickle"
+
+
+    def loadAstSnapshot(self, snapshotFilePath, snapshotKey):
+        # return None on any problem (including a stale snapshot); the snapshot is only an optimization
+        if (not jrfuncs.pathExists(snapshotFilePath)):
+            return None
+        if (not jrfuncs.isPrivateCacheFile(snapshotFilePath)):
+            jrprint("Warning: ignoring ast snapshot '{}' because other users could have written it.".format(snapshotFilePath), severity=jrfuncs.DefLogSeverityWarning)
+            return None
+        try:
+            with open(snapshotFilePath, "rb") as f:
+                snapshot = pickle.load(f)
+            if (snapshot["formatVersion"] != DefAstSnapshotFormatVersion) or (snapshot["key"] != snapshotKey):
+                return None
+            return snapshot["ast"]
+        except Exception as e:
+            jrprint("Warning: failed to load ast snapshot from '{}'; parsing instead ({}).".format(snapshotFilePath, repr(e)), severity=jrfuncs.DefLogSeverityWarning)
+            return None
+
+
+    def saveAstSnapshot(self, snapshotFilePath, snapshotKey):
+        # note this must happen right after conversion, before setupCasebookStuff binds function calls to env functions
+        try:
+            jrfuncs.createPrivateDirForFullFilePathIfMissing(snapshotFilePath)
+            snapshot = {"formatVersion": DefAstSnapshotFormatVersion, "key": snapshotKey, "ast": self.ast}
+            # write to temp file and rename so a concurrent build never sees a partial file
+            tempFilePath = "{}.{}.tmp".format(snapshotFilePath, os.getpid())
+            with open(tempFilePath, "wb") as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tempFilePath, snapshotFilePath)
+        except Exception as e:
+            jrprint("Warning: failed to save ast snapshot to '{}' ({}).".format(snapshotFilePath, repr(e)), severity=jrfuncs.DefLogSeverityWarning)
+
+
+    def reloadSourceFileIncremental(self, env, startSymbol, encoding):
+        # for an edit-compile loop: re-read the (edited) source file, re-parse only the entries that changed since last time, and re-convert those and any that moved
+        # grammar must already be loaded (see loadGrammarParseSourceFile); the first call parses every entry
+        # later calls re-parse only the entries whose text changed (entries that just moved have their parse positions shifted instead)
+        # but a converted entry is only reused if it is unchanged AND has not moved, since the AST holds source positions; so an edit that changes the length of an entry re-converts every entry after it
+        # we keep the parse tree (and its mapping to entries) around between calls so unchanged entries can be reused
+        self.jrparser.parseSourceFromFilePath(env, self.jrparser.sourceFilePath, startSymbol, encoding, True)
+        return self.convertParseTreeToAst(env, True)
 
 
 
     def setupCasebookStuff(self, env):
-        # setup built-in vars
-        self.ast.setupBuiltInVars(env)
-        # setup built-in core functions
-        self.ast.loadCoreFunctions(env)
+        with env.getProfiler().span("setup", DefProfileCategoryPhase):
+            # setup built-in vars
+            self.ast.setupBuiltInVars(env)
+            # setup built-in core functions
+            self.ast.loadCoreFunctions(env)
+            # now that functions are loaded, bind function call sites to them once, instead of looking them up on every call
+            self.ast.bindFunctionCalls(env)
 
 
 
 
-    def convertParseTreeToAst(self, env):
+    def convertParseTreeToAst(self, env, flagKeepParseTree=False):
+        # unless asked to keep it (see reloadSourceFileIncremental), we drop the parse tree once converted; the AST holds nothing from it, so this frees it
         start_time = time.perf_counter()
 
         # get data from parser
@@ -57,14 +189,21 @@ class JrInterpreterCasebook:
 
         # convert parse tree to our AST
         self.ast.setRawSourceDict(rawSourceDict)
-        self.ast.convertParseTreeToAst(env, parseTree)
+        with env.getProfiler().span("convert", DefProfileCategoryPhase):
+            self.ast.convertParseTreeToAst(env, parseTree)
 
         # report elapsed time?
-        if (env.getDebugMode()):
+        if (env.isTracing(DefTraceCategoryAst)):
             end_time = time.perf_counter()
             elapsed_time = end_time - start_time
-            self.printDebug()
-            jrprint("Elapsed time to run convert parseTree (): {}.".format(jrfuncs.niceElapsedTimeStr(elapsed_time)))
+            if (env.isTracing(DefTraceCategoryAst, DefTraceLevelDetail)):
+                self.printDebug()
+            entryReuseTracker = self.ast.entryReuseTracker
+            jrprint("Elapsed time to run convert parseTree (converted {} entries, reused {}): {}.".format(entryReuseTracker.convertedCount, entryReuseTracker.reusedCount, jrfuncs.niceElapsedTimeStr(elapsed_time)))
+
+        if (not flagKeepParseTree):
+            self.ast.releaseParseTreeReferences()
+            self.jrparser.releaseParseTree()
 
         return self.ast
 
@@ -76,9 +215,50 @@ class JrInterpreterCasebook:
 
 
 
-    def taskRenderRun(self, env, task):
+    def taskRenderRun(self, env, task, flagParallel=None):
         # just pass it off to the ast
-        self.ast.taskRenderRun(env, task)
+        # flagParallel (if not None) overrides option to render leads in parallel worker processes
+        if (flagParallel is not None):
+            self.options["parallelRender"] = flagParallel
+        context = env.getContext()
+        renderCache = None
+        if (self.options["renderCache"]):
+            renderCache = self.loadRenderCache(env)
+            renderCache.attachToContext(context)
+        try:
+            with env.getProfiler().span("renderRun " + task.getTaskId(), DefProfileCategoryPhase):
+                self.ast.taskRenderRun(env, task, self.options["parallelRender"], self.options["parallelRenderWorkers"])
+        finally:
+            if (renderCache is not None):
+                context.setRenderCache(None)
+                renderCache.save()
+                if (env.isTracing(DefTraceCategoryRun)):
+                    jrprint(renderCache.getStatsString())
+
+
+    def loadRenderCache(self, env):
+        # the cache is thrown away whole if the interpreter or grammar change
+        jrparser = self.jrparser
+        headerText = "\n".join([calcInterpreterSourceHash(), str(sys.version_info[:2]), jrparser.grammarText])
+        headerKey = hashlib.sha256(headerText.encode("utf-8")).hexdigest()
+        cacheFilePath = calcRenderCacheFilePath(self.options["renderCacheDir"], jrparser.sourceFilePath)
+        self.renderCache = JrRenderCache(cacheFilePath, headerKey, self.options["renderCacheMaxBytes"])
+        with env.getProfiler().span("loadRenderCache", DefProfileCategoryPhase):
+            self.renderCache.load()
+        return self.renderCache
+
+    def getRenderCache(self):
+        return self.renderCache
+
+
+
+
+
+
+
+
+
+
 
 
 
@@ -95,6 +275,18 @@ class JrInterpreterCasebook:
 
 
 
+def calcInterpreterSourceHash():
+    # hash of the source of our ast/interpreter modules, and of the parser (jrlark) and helper (jr) modules they depend on, so that snapshots made by a different version of any of them are never loaded
+    global moduleInterpreterSourceHash
+    if (moduleInterpreterSourceHash is None):
+        hasher = hashlib.sha256()
+        libDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        for subDirName in ["casebook", "jrlark", "jr"]:
+            for filePath in sorted(glob.glob(libDir + "/" + subDirName + "/*.py")):
+                with open(filePath, "rb") as f:
+                    hasher.update(f.read())
+        moduleInterpreterSourceHash = hasher.hexdigest()
+    return moduleInterpreterSourceHash
 
 
 
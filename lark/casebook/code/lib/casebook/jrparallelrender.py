@@ -0,0 +1,119 @@
+# parallel rendering of level 2 entries (leads) in a pool of worker processes (see JrAstRoot.renderRunParallel)
+# each worker is handed one pickled snapshot of the ast and env, taken after the special always-run entries have set up global state, and renders whichever leads it is given against it
+# leads are independent of each other as long as they don't change the env; one that does is reported, and the worker goes back to the snapshot before its next lead
+
+# ast modules
+from .jrastutilclasses import JrSourceLocation, DefTraceCategoryRun
+
+# my libs
+from lib.jr import jrfuncs
+from lib.jr.jrfuncs import jrprint
+
+# python
+import os
+import pickle
+import concurrent.futures
+
+
+
+
+class JrParallelRenderWriteTracker:
+    # records declarations and assignments made while rendering, which (in a parallel render) no other entry will see
+    # the env reports to whatever tracker is set on the context (see JrAstContext.envTracker)
+    def __init__(self):
+        # list of [writeKind, identifierName, sloc]
+        self.writes = []
+
+    def noteRead(self, identifierName, val):
+        pass
+
+    def noteWrite(self, sloc, identifierName, writeKind):
+        self.writes.append([writeKind, identifierName, None if (sloc is None) else JrSourceLocation(sloc)])
+
+    def noteSideEffect(self, reason):
+        pass
+
+
+
+
+def makeParallelRenderSnapshot(root, env):
+    # pickle the ast and env together (so that function call sites stay bound to this env); the root leaves out its raw source, which we pass along separately
+    # we leave out the profiler, render cache and env tracker, which are only meaningful here
+    context = env.getContext()
+    profiler = context.getProfiler()
+    renderCache = context.getRenderCache()
+    envTracker = context.getEnvTracker()
+    context.setProfiler(profiler.__class__(False))
+    context.setRenderCache(None)
+    context.setEnvTracker(None)
+    try:
+        return pickle.dumps((root, env), protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        context.setProfiler(profiler)
+        context.setRenderCache(renderCache)
+        context.setEnvTracker(envTracker)
+
+
+def iterateParallelLeadRenders(root, env, rmode, leadPaths, workerCount):
+    # render the leads at leadPaths ([sectionIndex, leadIndex] into root entries) in worker processes, yielding their results in the same order (see renderLeadInParallelWorker)
+    # results start coming back while the caller works on something else (e.g. rendering section bodies); the pool is shut down once the last result has been taken
+    if (workerCount is None):
+        workerCount = os.cpu_count()
+    workerCount = max(1, min(workerCount, len(leadPaths)))
+    # a few chunks per worker keeps the pickling overhead down without leaving a worker idle at the end
+    chunkSize = max(1, len(leadPaths) // (workerCount * 4))
+    snapshotBytes = makeParallelRenderSnapshot(root, env)
+    if (env.isTracing(DefTraceCategoryRun)):
+        jrprint("Parallel render of {} entries using {} worker processes (snapshot is {} bytes).".format(len(leadPaths), workerCount, len(snapshotBytes)))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workerCount, initializer=initParallelRenderWorker, initargs=(snapshotBytes, root.getRawSourceDict(), rmode)) as executor:
+        for result in executor.map(renderLeadInParallelWorker, leadPaths, chunksize=chunkSize):
+            yield result
+
+
+def reportParallelRenderWrites(entry, writes):
+    for [writeKind, identifierName, sloc] in writes:
+        jrprint("Warning: {} of '{}' ({}) in entry {} was made during a parallel render, so entries rendered in parallel did not see it.".format(writeKind, identifierName, "unknown location" if (sloc is None) else sloc.debugString(), entry.getDisplayIdLabel()), severity=jrfuncs.DefLogSeverityWarning)
+
+
+
+
+# each worker process keeps the unpickled snapshot it was started with, and reloads it after a lead changes the env
+parallelRenderWorkerState = None
+
+def initParallelRenderWorker(snapshotBytes, rawSourceDict, rmode):
+    global parallelRenderWorkerState
+    parallelRenderWorkerState = {"snapshotBytes": snapshotBytes, "rawSourceDict": rawSourceDict, "rmode": rmode, "root": None, "env": None}
+
+def loadParallelRenderWorkerSnapshot():
+    state = parallelRenderWorkerState
+    [root, env] = pickle.loads(state["snapshotBytes"])
+    root.setRawSourceDict(state["rawSourceDict"])
+    state["root"] = root
+    state["env"] = env
+
+def renderLeadInParallelWorker(leadPath):
+    # return dict with what the main process needs to merge the render of this lead: its captured output (logRecords), what it changed on its entries (renderResults, see JrAstEntry.collectRenderResults), its env writes, and the text of any exception that stopped it
+    state = parallelRenderWorkerState
+    if (state["env"] is None):
+        loadParallelRenderWorkerSnapshot()
+    env = state["env"]
+    context = env.getContext()
+    lead = state["root"].entries.childList[leadPath[0]].entries.childList[leadPath[1]]
+
+    tracker = JrParallelRenderWriteTracker()
+    context.setEnvTracker(tracker)
+    jrfuncs.startLogCapture()
+    exceptionText = None
+    try:
+        lead.renderRun(state["rmode"], env)
+    except Exception as e:
+        exceptionText = str(e)
+    finally:
+        context.setEnvTracker(None)
+        logRecords = jrfuncs.stopLogCapture()
+
+    if (len(tracker.writes) > 0) or (exceptionText is not None):
+        # the next lead we render should see the snapshot, not this lead's changes
+        state["env"] = None
+
+    return {"logRecords": logRecords, "renderResults": lead.collectRenderResults([]), "writes": tracker.writes, "exception": exceptionText}
@@ -0,0 +1,279 @@
+# render skip cache
+# remembers which entry bodies rendered without side effects, keyed on the entry's own source text and the task, so a later render can skip running them again; each record also remembers the values of every env variable the body read, and is only reused if they all still have those values
+# note block renders don't return any output yet (entries don't collect their output, see JrAstEntry.renderRun), so the fragment we store is just what the body's renderRun returned, and a hit means the body is skipped rather than its output replayed
+# an entry body that writes to the env, raises, or logs a warning is never cached, since reusing its fragment would skip those side effects
+
+# ast modules
+from .jrastvals import AstVal, AstValFunction
+from .jrastutilclasses import AstTask
+
+# my libs
+from lib.jr import jrfuncs
+from lib.jr.jrfuncs import jrprint
+
+# python
+import os
+import pickle
+import hashlib
+import collections
+
+
+
+
+# bump this if we change the format of what we store in a render cache file
+DefRenderCacheFormatVersion = 1
+
+# default size bound for one cache file (least recently used fragments are evicted past this)
+DefRenderCacheMaxBytes = 16 * 1024 * 1024
+
+# fingerprint we record for a read of a variable that does not exist
+DefFingerprintMissing = ("missing",)
+
+# dicts/lists deeper or bigger than this are not worth fingerprinting; an entry that reads one is just not cached
+DefFingerprintMaxDepth = 4
+DefFingerprintMaxItems = 64
+
+
+
+
+class JrRenderCache:
+    def __init__(self, cacheFilePath, headerKey, maxBytes=DefRenderCacheMaxBytes):
+        # headerKey should change whenever the interpreter or grammar does, which throws away the whole file (see load)
+        self.cacheFilePath = cacheFilePath
+        self.headerKey = headerKey
+        self.maxBytes = maxBytes
+        # key -> [reads, fragment, byteSize]; least recently used first
+        self.records = collections.OrderedDict()
+        self.totalBytes = 0
+        self.flagDirty = False
+        # function call sites are bound to functions once (see JrAstFunctionCall.bindFunction), so calls aren't env reads we track; instead we stop using the cache if anything rebinds them
+        self.functionBindingGeneration = None
+        self.resetStats()
+
+
+    def attachToContext(self, context):
+        # call after setup (once functions are bound) and before rendering
+        self.functionBindingGeneration = context.getFunctionBindingGeneration()
+        context.setRenderCache(self)
+    def calcIsUsable(self, context):
+        return (context.getFunctionBindingGeneration() == self.functionBindingGeneration)
+
+
+    def resetStats(self):
+        self.stats = {"hits": 0, "misses": 0, "uncacheable": 0, "stores": 0, "evictions": 0}
+    def getStats(self):
+        return self.stats
+
+    def calcHitRate(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        if (lookups == 0):
+            return 0.0
+        return self.stats["hits"] / lookups
+
+    def getStatsString(self):
+        stats = self.stats
+        return "Render cache: {} hits, {} misses ({:.1f}% hit rate), {} uncacheable, {} stored, {} evicted; {} fragments ({} bytes).".format(stats["hits"], stats["misses"], self.calcHitRate() * 100.0, stats["uncacheable"], stats["stores"], stats["evictions"], len(self.records), self.totalBytes)
+
+
+
+    def load(self):
+        # a missing, stale or unreadable file just means an empty cache
+        self.records = collections.OrderedDict()
+        self.totalBytes = 0
+        self.flagDirty = False
+        if (not jrfuncs.pathExists(self.cacheFilePath)):
+            return False
+        if (not jrfuncs.isPrivateCacheFile(self.cacheFilePath)):
+            jrprint("Warning: ignoring render cache '{}' because other users could have written it.".format(self.cacheFilePath), severity=jrfuncs.DefLogSeverityWarning)
+            return False
+        try:
+            with open(self.cacheFilePath, "rb") as f:
+                cacheData = pickle.load(f)
+            if (cacheData["formatVersion"] != DefRenderCacheFormatVersion) or (cacheData["headerKey"] != self.headerKey):
+                return False
+            self.records = cacheData["records"]
+            self.totalBytes = sum([record[2] for record in self.records.values()])
+            return True
+        except Exception as e:
+            jrprint("Warning: failed to load render cache from '{}'; starting empty ({}).".format(self.cacheFilePath, repr(e)), severity=jrfuncs.DefLogSeverityWarning)
+            self.records = collections.OrderedDict()
+            self.totalBytes = 0
+            return False
+
+
+    def save(self):
+        if (not self.flagDirty):
+            return
+        try:
+            jrfuncs.createPrivateDirForFullFilePathIfMissing(self.cacheFilePath)
+            cacheData = {"formatVersion": DefRenderCacheFormatVersion, "headerKey": self.headerKey, "records": self.records}
+            # write to temp file and rename so a concurrent build never sees a partial file
+            tempFilePath = "{}.{}.tmp".format(self.cacheFilePath, os.getpid())
+            with open(tempFilePath, "wb") as f:
+                pickle.dump(cacheData, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tempFilePath, self.cacheFilePath)
+            self.flagDirty = False
+        except Exception as e:
+            jrprint("Warning: failed to save render cache to '{}' ({}).".format(self.cacheFilePath, repr(e)), severity=jrfuncs.DefLogSeverityWarning)
+
+
+
+    def calcEntryKey(self, entry, task):
+        # key on the entry's own source text (its header, options and body, but not its children entries, which are cached on their own), and the task
+        # return None if the entry can't be cached
+        if (entry.flagMerged):
+            # some of our body came from another place in the source
+            return None
+        sourceText = entry.getRootRawSourceDict().get("text")
+        if (sourceText is None):
+            return None
+        sloc = entry.getSourceLoc()
+        startPos = sloc.getSourceStartPos()
+        endPos = sloc.getSourceEndPos()
+        if (len(entry.entries.childList) > 0):
+            endPos = entry.entries.childList[0].getSourceLoc().getSourceStartPos()
+        keyText = "\n".join([str(entry.level), task.getTaskId(), str(task.getRmode()), str(task.getRenderFormat()), sourceText[startPos:endPos]])
+        return hashlib.sha256(keyText.encode("utf-8")).hexdigest()
+
+
+    def lookup(self, key, env):
+        # return [True, fragment] if we have a fragment for key whose reads all still have the values they had; otherwise [False, None]
+        record = self.records.get(key)
+        if (record is None) or (not self.calcReadsStillValid(record[0], env)):
+            self.stats["misses"] += 1
+            return [False, None]
+        # (recency is saved too, so eviction is least recently used across builds)
+        self.records.move_to_end(key)
+        self.flagDirty = True
+        self.stats["hits"] += 1
+        return [True, record[1]]
+
+
+    def calcReadsStillValid(self, reads, env):
+        for [identifierName, fingerprint] in reads.items():
+            try:
+                [envVar, baseName, partList] = env.lookupJrEnvVar(None, identifierName, True)
+                if (envVar is None):
+                    currentFingerprint = DefFingerprintMissing
+                else:
+                    currentFingerprint = calcValueFingerprint(envVar.getWrappedValue(None, partList))
+            except Exception:
+                # e.g. a dotted property that no longer exists
+                return False
+            if (currentFingerprint != fingerprint):
+                return False
+        return True
+
+
+    def noteUncacheable(self):
+        self.stats["uncacheable"] += 1
+
+
+    def store(self, key, tracker, fragment):
+        if (tracker.uncacheableReason is not None):
+            self.noteUncacheable()
+            return
+        record = [tracker.reads, fragment, 0]
+        try:
+            record[2] = len(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            self.noteUncacheable()
+            return
+        oldRecord = self.records.pop(key, None)
+        if (oldRecord is not None):
+            self.totalBytes -= oldRecord[2]
+        self.records[key] = record
+        self.totalBytes += record[2]
+        self.stats["stores"] += 1
+        self.flagDirty = True
+        # evict least recently used
+        while (self.totalBytes > self.maxBytes) and (len(self.records) > 0):
+            [evictedKey, evictedRecord] = self.records.popitem(last=False)
+            self.totalBytes -= evictedRecord[2]
+            self.stats["evictions"] += 1
+
+
+
+
+
+
+
+
+
+class JrRenderCacheTracker:
+    # records what an entry body reads from the env while it renders, and whether it did anything that makes it uncacheable
+    # the env reports to whatever tracker is set on the context (see JrAstContext.envTracker)
+    def __init__(self):
+        # identifier name -> fingerprint of the value it had when first read
+        self.reads = {}
+        self.uncacheableReason = None
+
+    def noteRead(self, identifierName, val):
+        if (self.uncacheableReason is not None) or (identifierName in self.reads):
+            return
+        fingerprint = DefFingerprintMissing if (val is None) else calcValueFingerprint(val)
+        if (fingerprint is None):
+            self.uncacheableReason = "read of '{}', whose value we can't fingerprint".format(identifierName)
+        else:
+            self.reads[identifierName] = fingerprint
+
+    def noteWrite(self, sloc, identifierName, writeKind):
+        self.noteSideEffect("{} of '{}'".format(writeKind, identifierName))
+
+    def noteSideEffect(self, reason):
+        if (self.uncacheableReason is None):
+            self.uncacheableReason = reason
+
+
+
+
+
+
+
+
+
+def calcValueFingerprint(val, depth=0):
+    # return a small picklable value that compares equal for equal values, or None if we can't make one
+    if (isinstance(val, AstValFunction)):
+        # built-in functions; their implementations are covered by the cache headerKey
+        return ("function", val.getWrapped().getName())
+    if (isinstance(val, AstVal)):
+        val = val.getWrapped()
+    if (val is None) or (isinstance(val, (str, int, float, bool))):
+        return (type(val).__name__, val)
+    if (isinstance(val, AstTask)):
+        return ("task", val.getTaskId(), val.getRmode(), val.getRenderFormat())
+    if (depth >= DefFingerprintMaxDepth):
+        return None
+    if (isinstance(val, dict)):
+        if (len(val) > DefFingerprintMaxItems):
+            return None
+        items = []
+        for [itemKey, itemVal] in val.items():
+            itemFingerprint = calcValueFingerprint(itemVal, depth + 1)
+            if (itemFingerprint is None):
+                return None
+            items.append((str(itemKey), itemFingerprint))
+        return ("dict", tuple(sorted(items)))
+    if (isinstance(val, (list, tuple))):
+        if (len(val) > DefFingerprintMaxItems):
+            return None
+        items = []
+        for itemVal in val:
+            itemFingerprint = calcValueFingerprint(itemVal, depth + 1)
+            if (itemFingerprint is None):
+                return None
+            items.append(itemFingerprint)
+        return ("list", tuple(items))
+    # arbitrary python objects (e.g. entries)
+    return None
+
+
+
+
+def calcRenderCacheFilePath(cacheDir, sourceFilePath):
+    # one cache file per source file path, named so that different source files don't collide
+    if (cacheDir is None):
+        cacheDir = jrfuncs.calcUserCacheDir("rendercache")
+    sourcePathHash = hashlib.sha256(os.path.realpath(sourceFilePath).encode("utf-8")).hexdigest()[0:16]
+    return cacheDir + "/render_" + os.path.splitext(os.path.basename(sourceFilePath))[0] + "_" + sourcePathHash + ".pickle"
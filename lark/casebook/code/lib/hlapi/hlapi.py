@@ -1,6 +1,5 @@
 # imports
 from lib.jr import jrfuncs
-from lib.jr import jroptions
 from lib.jr.jrfuncs import jrprint
 from lib.jr.jrfuncs import jrException
 
@@ -9,10 +8,31 @@ import csv
 import os
 import pathlib
 import json
+import collections
+import itertools
+import array
+import bisect
+import math
+import pickle
+import hashlib
+import heapq
+import copy
 from difflib import SequenceMatcher
 
 
 
+# how many of the names and addresses most like a query (by trigrams) we re-score first in findLeadRowSimilarByNameOrAddress (option 'similarShortlistSize')
+DefSimilarShortlistSize = 100
+# after those, we also re-score the other names and addresses at least this fraction as like the query as the last of them, and close enough to it in length to beat the best so far (see calcSimilarShortlist)
+DefSimilarNearShortlistFraction = 0.5
+# findLeadRowSimilarByNameOrAddress gives a bonus to rows whose name starts with this many characters of the query
+DefSimilarStartLen = 5
+
+# bump this if we change the format of what we store in a lead cache file (see HlLeadCache)
+DefLeadCacheFormatVersion = 1
+
+
+
 # ---------------------------------------------------------------------------
 class HlApi:
     def __init__(self, dataDir, options={}):
@@ -20,7 +40,13 @@ class HlApi:
         self.options = options
         #
         self.unusedLeads = None
-        self.leads = None
+        # all lead rows, by column (see HlLeadTable)
+        self.leadTable = None
+        #
+        # lookup indexes by name, each built the first time it's needed (see getLeadIndex)
+        self.leadIndexes = None
+        # trigram index of lead names and addresses for similarity search, built on first use (see getSimilarIndex)
+        self.similarIndex = None
 
     def setDataDir(self, dataDir):
         self.dataDir = dataDir
@@ -31,6 +57,9 @@ class HlApi:
     def enableSlowSearch(self):
         return ('disableSlowSearch' not in self.options) or (not self.options['disableSlowSearch'])
 
+    def enableLeadCache(self):
+        return ('disableLeadCache' not in self.options) or (not self.options['disableLeadCache'])
+
 
 
 # ---------------------------------------------------------------------------
@@ -59,7 +88,13 @@ class HlApi:
         if (not self.isEnabled()):
             return False
         
-        self.leads = {}
+        # we only parse the json of lead files that have changed since they were last compiled into the lead cache
+        leadCache = None
+        if (self.enableLeadCache()):
+            leadCache = HlLeadCache(self.options.get('leadCacheFilePath', calcLeadCacheFilePath(self.dataDir)))
+            leadCache.load()
+
+        segments = {}
         directoryPath = self.dataDir + '/leads/'
 
         for (dirPath, dirNames, fileNames) in os.walk(directoryPath):
@@ -68,41 +103,87 @@ class HlApi:
                 if (fileNameLower.endswith('.json')):
                     baseName = pathlib.Path(fileName).stem
                     fileFinishedPath = dirPath + '/' + fileName
-                    self.loadLeadFile(fileFinishedPath, baseName)
+                    segment = None
+                    fileSignature = None
+                    if (leadCache is not None):
+                        [segment, fileSignature] = leadCache.lookup(fileFinishedPath)
+                    if (segment is None):
+                        segment = self.loadLeadFile(fileFinishedPath, baseName)
+                        if (leadCache is not None):
+                            leadCache.store(fileFinishedPath, fileSignature, segment)
+                    segments[baseName] = segment
 
+        if (leadCache is not None):
+            leadCache.save()
+            jrprint('Loaded {} leads from {} lead files ({} compiled from json, {} from lead cache "{}")'.format(sum([segment['rowCount'] for segment in segments.values()]), len(segments), leadCache.getStats()['compiled'], leadCache.getStats()['hits'], leadCache.cacheFilePath))
+        self.leadTable = HlLeadTable(segments)
+        self.resetLeadIndexes()
         return True
 
 
     def loadLeadFile(self, filePath, fileSourceLabel):
+        # return the columns we keep of the rows in a lead file (see makeLeadSegment)
         #jrprint('Loading leads from "{}" ({})..'.format(fileSourceLabel, filePath))
         encoding='utf-8'
         with open(filePath, 'r', encoding=encoding) as jsonFile:
             jsonRows = json.load(jsonFile)
             features = jsonRows['features']
-            rows = []
-            for row in features:
-                #thisRow = row['properties']
-                rows.append(row)
-
             jrprint('Loaded {} leads from "{}" ({})'.format(len(features), fileSourceLabel, filePath))
-            self.leads[fileSourceLabel] = rows
+            return makeLeadSegment(features)
+
+
+    def resetLeadIndexes(self):
+        # throw away any indexes of previously loaded leads; they are built again as they are needed (see getLeadIndex, getSimilarIndex), so loading leads stays quick
+        self.leadIndexes = {}
+        self.similarIndex = None
+
+
+    def getLeadIndex(self, indexName):
+        # return dict that maps a key to the row id of the first row (in scan order) with that key, so lookups don't have to scan every row (and find the same row a scan would)
+        # indexName is 'leadId' or 'nameOrAddress' (a row matches on either its address or its name, so both go in one index), plus 'Normalized' for the index keyed on normalized text (see normalizeLeadKey)
+        index = self.leadIndexes.get(indexName)
+        if (index is None):
+            leadTable = self.leadTable
+            if (indexName.startswith('leadId')):
+                keyRows = [(key, rowIndex) for rowIndex, key in enumerate(leadTable.leadIds)]
+            else:
+                keyRows = [(key, rowIndex) for rowIndex, keys in enumerate(zip(leadTable.addresses, leadTable.dNames)) for key in keys]
+            keyRows = [(key, rowIndex) for key, rowIndex in keyRows if (isinstance(key, str))]
+            if (indexName.endswith('Normalized')):
+                keyRows = [(normalizeLeadKey(key), rowIndex) for key, rowIndex in keyRows]
+            # a later row with the same key overwrites an earlier one, so we add them in reverse to keep the first
+            index = dict(reversed(keyRows))
+            self.leadIndexes[indexName] = index
+        return index
+
+
+    def getSimilarIndex(self):
+        # the similarity index is slow to build and only needed for slow search, so we build it the first time it's needed
+        if (self.similarIndex is None):
+            self.similarIndex = HlLeadTrigramIndex(self.leadTable)
+        return self.similarIndex
+
+
+    def lookupLeadIndex(self, indexName, key):
+        # exact match first, then one that differs only in case or whitespace
+        rowIndex = self.getLeadIndex(indexName).get(key)
+        if (rowIndex is None):
+            rowIndex = self.getLeadIndex(indexName + 'Normalized').get(normalizeLeadKey(key))
+        if (rowIndex is None):
+            return [None, None]
+        return [self.leadTable.makeRow(rowIndex), self.leadTable.getSourceKey(rowIndex)]
 
 
     def findLeadRowByLeadId(self, leadId):
         if (not self.isEnabled()):
             return [None, None]
         
-        if (self.leads is None):
+        if (self.leadTable is None):
             self.loadLeads()
         if (leadId.startswith('#')):
             leadId = leadId[1:]
         #
-        for sourceKey, leadRows in self.leads.items():
-            for row in leadRows:
-                if (row['properties']['lead']==leadId):
-                    return [row, sourceKey]
-        # not found
-        return [None, None]
+        return self.lookupLeadIndex('leadId', leadId)
 
 
     def findLeadRowByNameOrAddress(self, txt):
@@ -114,15 +195,9 @@ class HlApi:
         if (txt==''):
             return [None, None]
 
-        if (self.leads is None):
+        if (self.leadTable is None):
             self.loadLeads()
-        for sourceKey, leadRows in self.leads.items():
-            for row in leadRows:
-                if (row['properties']['address']==txt) or (row['properties']['dName']==txt):
-                    return [row, sourceKey]
-                dName = row['properties']['dName']
-        # not found
-        return [None, None]
+        return self.lookupLeadIndex('nameOrAddress', txt)
 
 
     def findLeadRowSimilarByNameOrAddress(self, txt):
@@ -133,27 +208,452 @@ class HlApi:
         txt = txt.strip()
         if (txt==''):
             return [None, None]
+        return self.findDistinctLeadRowsSimilarByNameOrAddress([txt])[0]
+
+
+    def findDistinctLeadRowsSimilarByNameOrAddress(self, txts):
+        # return what findLeadRowSimilarByNameOrAddress does for each of txts (which should be distinct and stripped)
+        # the queries are shortlisted and re-scored together, so the work they share (trigram postings, fetching candidate rows) is done once for all of them (see calcShortlists and calcBestSimilarShortlistRows)
+        if (not self.isEnabled()) or (not self.enableSlowSearch()):
+            return [[None, None, 0] for txt in txts]
+        queryTxts = [txt for txt in txts if (txt != '')]
+        # only re-score rows that share trigrams with each txt (plus any that get the startswith bonus, see calcSimilarShortlist)
+        shortlistSize = self.options.get('similarShortlistSize', DefSimilarShortlistSize)
+        shortlists = self.calcSimilarShortlists(queryTxts, shortlistSize)
+        bests = calcBestSimilarShortlistRows(queryTxts, shortlists, self.makeSimilarCandidateRows)
+        resultsByTxt = dict(zip(queryTxts, [self.makeSimilarResult(maxRowIndex, maxDist) for maxRowIndex, maxDist in bests]))
+        return [resultsByTxt.get(txt, [None, None]) for txt in txts]
 
-        if (self.leads is None):
+
+    def calcSimilarShortlists(self, txts, shortlistSize):
+        if (self.leadTable is None):
+            self.loadLeads()
+        return self.getSimilarIndex().calcShortlists(txts, shortlistSize)
+
+
+    def findLeadRowSimilarByNameOrAddressScan(self, txt):
+        # score every row (what findLeadRowSimilarByNameOrAddress did before it had an index; useful to check the index against)
+        if (self.leadTable is None):
             self.loadLeads()
         # walk ALL and find max
-        txtUpper = txt.upper()
-        startLen = 5 
-        maxDist = 0
-        maxMatchRow = None
-        maxMatchSourceKey = None
-        for sourceKey, leadRows in self.leads.items():
-            for row in leadRows:
-                distName = SequenceMatcher(None, txt, row['properties']['dName']).ratio()
-                distAddr = SequenceMatcher(None, txt, row['properties']['address']).ratio()
-                # kludge for startswith
-                if (txtUpper.startswith(row['properties']['dName'][0:startLen].upper())):
-                    distName += 0.5
-                thisMaxDist = max(distName, distAddr)
-                if (thisMaxDist > maxDist):
-                    maxDist = thisMaxDist
-                    maxMatchRow = row
-                    maxMatchSourceKey = sourceKey
+        [maxRowIndex, maxDist] = calcBestSimilarRow(txt.strip(), self.makeSimilarCandidateRows(range(0, self.leadTable.getRowCount())))
+        return self.makeSimilarResult(maxRowIndex, maxDist)
+
+
+    def makeSimilarCandidateRows(self, rowIndices):
+        # (rowIndex, dName, address) of each of the lead rows at rowIndices, as calcBestSimilarRow takes them
+        leadTable = self.leadTable
+        return [(rowIndex, leadTable.dNames[rowIndex], leadTable.addresses[rowIndex]) for rowIndex in rowIndices]
+
+
+    def makeSimilarResult(self, maxRowIndex, maxDist):
+        # return [row, sourceKey, dist] for the best scoring row
         # not found
-        return [maxMatchRow, maxMatchSourceKey, maxDist]
+        if (maxRowIndex is None):
+            return [None, None, 0]
+        return [self.leadTable.makeRow(maxRowIndex), self.leadTable.getSourceKey(maxRowIndex), maxDist]
+# ---------------------------------------------------------------------------
+
+
+# ---------------------------------------------------------------------------
+# batch lookups, for resolving many lead references at once; each returns a list with the result for each query, in order (the same results the single lookups give)
+# each distinct query is only looked up once, and a repeated query gets its own copy of the result
+
+    def findLeadRowsByLeadIds(self, leadIds):
+        # (an id and the same id with a leading # are the same query)
+        return self.mapDistinctLeadQueries(leadIds, lambda leadId: leadId[1:] if (leadId.startswith('#')) else leadId, lambda distinctLeadIds: [self.findLeadRowByLeadId(leadId) for leadId in distinctLeadIds])
+
+
+    def findLeadRowsByNameOrAddress(self, txts):
+        return self.mapDistinctLeadQueries(txts, lambda txt: txt.strip(), lambda distinctTxts: [self.findLeadRowByNameOrAddress(txt) for txt in distinctTxts])
+
+
+    def findLeadRowsSimilarByNameOrAddress(self, txts):
+        return self.mapDistinctLeadQueries(txts, lambda txt: txt.strip(), self.findDistinctLeadRowsSimilarByNameOrAddress)
+
+
+    def mapDistinctLeadQueries(self, queries, calcQueryKey, lookupFunction):
+        # calcQueryKey should give the same key for queries lookupFunction treats the same; lookupFunction is given the list of distinct keys and returns the list of their results
+        queryKeys = [calcQueryKey(query) for query in queries]
+        distinctQueryKeys = list(dict.fromkeys(queryKeys))
+        resultsByKey = dict(zip(distinctQueryKeys, lookupFunction(distinctQueryKeys)))
+        results = []
+        returnedKeys = set()
+        for queryKey in queryKeys:
+            result = resultsByKey[queryKey]
+            # (so a caller can change one result without changing another)
+            if (queryKey in returnedKeys):
+                result = copy.deepcopy(result)
+            returnedKeys.add(queryKey)
+            results.append(result)
+        return results
+# ---------------------------------------------------------------------------
+
+
+
+
+# ---------------------------------------------------------------------------
+class HlLeadTable:
+    # all lead rows, stored by column and keeping only the properties we use (lead id, name, address, and point coordinates), in scan order; a row's index in here is its row id
+    # rows are handed out as small geojson feature dicts made on demand (see makeRow)
+    def __init__(self, segments):
+        # segments maps the source key of each lead file (in scan order) to its columns (see makeLeadSegment)
+        self.sourceKeys = []
+        # row id of the first row of each source
+        self.sourceRowStarts = []
+        self.leadIds = []
+        self.dNames = []
+        self.addresses = []
+        # x, y of each row (nan for rows without a point)
+        self.coordinates = array.array('d')
+        for sourceKey, segment in segments.items():
+            self.sourceKeys.append(sourceKey)
+            self.sourceRowStarts.append(len(self.dNames))
+            self.leadIds.extend(decodeLeadStringColumn(segment['lead']))
+            self.dNames.extend(decodeLeadStringColumn(segment['dName']))
+            self.addresses.extend(decodeLeadStringColumn(segment['address']))
+            self.coordinates.frombytes(segment['coordinates'])
+
+    def getRowCount(self):
+        return len(self.dNames)
+
+    def getSourceKey(self, rowIndex):
+        return self.sourceKeys[bisect.bisect_right(self.sourceRowStarts, rowIndex) - 1]
+
+    def makeRow(self, rowIndex):
+        return makeLeadRow(self.leadIds[rowIndex], self.dNames[rowIndex], self.addresses[rowIndex], self.coordinates[rowIndex*2], self.coordinates[rowIndex*2+1])
+
+
+
+
+class HlLeadCache:
+    # compiled lead files (the columns we keep of their rows, see makeLeadSegment), so loadLeads only parses the json of a lead file when it has changed
+    # a lead file is recompiled when its modification time or size changes; one cache file holds all the lead files of a data directory
+    def __init__(self, cacheFilePath):
+        self.cacheFilePath = cacheFilePath
+        # lead file path -> [fileSignature, segment]
+        self.records = {}
+        # lead file paths looked up since load; the rest are dropped on save
+        self.seenFilePaths = set()
+        self.flagDirty = False
+        self.stats = {'hits': 0, 'compiled': 0}
+
+    def getStats(self):
+        return self.stats
+
+
+    def load(self):
+        # a missing, stale or unreadable file just means an empty cache
+        self.records = {}
+        self.seenFilePaths = set()
+        self.flagDirty = False
+        if (not jrfuncs.pathExists(self.cacheFilePath)):
+            return False
+        if (not jrfuncs.isPrivateCacheFile(self.cacheFilePath)):
+            jrprint('Warning: ignoring lead cache "{}" because other users could have written it.'.format(self.cacheFilePath), severity=jrfuncs.DefLogSeverityWarning)
+            return False
+        try:
+            with open(self.cacheFilePath, 'rb') as f:
+                cacheData = pickle.load(f)
+            if (cacheData['formatVersion'] != DefLeadCacheFormatVersion):
+                return False
+            self.records = cacheData['records']
+            return True
+        except Exception as e:
+            jrprint('Warning: failed to load lead cache from "{}"; starting empty ({}).'.format(self.cacheFilePath, repr(e)), severity=jrfuncs.DefLogSeverityWarning)
+            self.records = {}
+            return False
+
+
+    def save(self):
+        # drop lead files that are gone
+        for filePath in list(self.records.keys()):
+            if (filePath not in self.seenFilePaths):
+                del self.records[filePath]
+                self.flagDirty = True
+        if (not self.flagDirty):
+            return
+        try:
+            jrfuncs.createPrivateDirForFullFilePathIfMissing(self.cacheFilePath)
+            cacheData = {'formatVersion': DefLeadCacheFormatVersion, 'records': self.records}
+            # write to temp file and rename so a concurrent build never sees a partial file
+            tempFilePath = '{}.{}.tmp'.format(self.cacheFilePath, os.getpid())
+            with open(tempFilePath, 'wb') as f:
+                pickle.dump(cacheData, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tempFilePath, self.cacheFilePath)
+            self.flagDirty = False
+        except Exception as e:
+            jrprint('Warning: failed to save lead cache to "{}" ({}).'.format(self.cacheFilePath, repr(e)), severity=jrfuncs.DefLogSeverityWarning)
+
+
+    def lookup(self, filePath):
+        # return [segment, fileSignature] for a lead file, where segment is None if we don't have it compiled as it is now (pass the fileSignature to store once it is)
+        filePath = os.path.realpath(filePath)
+        self.seenFilePaths.add(filePath)
+        fileStat = os.stat(filePath)
+        fileSignature = (fileStat.st_mtime_ns, fileStat.st_size)
+        record = self.records.get(filePath)
+        if (record is None) or (record[0] != fileSignature):
+            return [None, fileSignature]
+        self.stats['hits'] += 1
+        return [record[1], fileSignature]
+
+
+    def store(self, filePath, fileSignature, segment):
+        self.records[os.path.realpath(filePath)] = [fileSignature, segment]
+        self.stats['compiled'] += 1
+        self.flagDirty = True
+
+
+
+
+def makeLeadRow(leadId, dName, address, x, y):
+    # a geojson feature shaped dict with just the properties we keep (x and y are nan, or None, for a row without a point)
+    properties = {'lead': leadId, 'dName': dName, 'address': address}
+    geometry = None
+    if (x is not None) and (not math.isnan(x)):
+        geometry = {'type': 'Point', 'coordinates': [x, y]}
+    return {'type': 'Feature', 'properties': properties, 'geometry': geometry}
+
+
+def makeLeadSegment(features):
+    # return the columns we keep of some geojson lead features, in a compact form that is quick to pickle and load: a dict with rowCount, lead/dName/address string columns (see encodeLeadStringColumn), and packed x, y coordinates
+    columns = {'lead': [], 'dName': [], 'address': []}
+    coordinates = array.array('d')
+    for row in features:
+        properties = row['properties']
+        for columnName, values in columns.items():
+            val = properties.get(columnName)
+            values.append(val if (isinstance(val, str)) else None)
+        geometry = row.get('geometry')
+        if (geometry is not None) and (geometry.get('type') == 'Point'):
+            coordinates.extend(geometry['coordinates'][0:2])
+        else:
+            coordinates.extend([math.nan, math.nan])
+    segment = {'rowCount': len(features), 'coordinates': coordinates.tobytes()}
+    for columnName, values in columns.items():
+        segment[columnName] = encodeLeadStringColumn(values)
+    return segment
+
+
+def encodeLeadStringColumn(values):
+    # return [text, endOffsets, noneIndices]: the values joined into one string, the offset in it where each one ends, and the indices of values that are None (stored as '')
+    endOffsets = array.array('I')
+    noneIndices = array.array('I')
+    offset = 0
+    for index, val in enumerate(values):
+        if (val is None):
+            noneIndices.append(index)
+        else:
+            offset += len(val)
+        endOffsets.append(offset)
+    text = ''.join([val for val in values if (val is not None)])
+    return [text, endOffsets.tobytes(), noneIndices.tobytes()]
+
+
+def decodeLeadStringColumn(column):
+    [text, endOffsetBytes, noneIndexBytes] = column
+    endOffsets = array.array('I')
+    endOffsets.frombytes(endOffsetBytes)
+    values = [text[startOffset:endOffset] for startOffset, endOffset in zip(itertools.chain([0], endOffsets), endOffsets)]
+    noneIndices = array.array('I')
+    noneIndices.frombytes(noneIndexBytes)
+    for index in noneIndices:
+        values[index] = None
+    return values
+
+
+def calcLeadCacheFilePath(dataDir):
+    # one cache file per data directory (option 'leadCacheFilePath' overrides this)
+    dataDirHash = hashlib.sha256(os.path.realpath(dataDir).encode('utf-8')).hexdigest()[0:16]
+    return jrfuncs.calcUserCacheDir('leadcache') + '/leads_' + dataDirHash + '.pickle'
+# ---------------------------------------------------------------------------
+
+
+
+
+# ---------------------------------------------------------------------------
+class HlLeadTrigramIndex:
+    # inverted index from character trigrams to the lead rows whose name or address contain them, for shortlisting rows similar to a query
+    def __init__(self, leadTable):
+        # trigram -> list of keys, where key is rowIndex*2 for a row's name and rowIndex*2+1 for its address
+        self.postings = {}
+        # number of distinct trigrams, and length, of the text of each key
+        self.keyTrigramCounts = array.array('I')
+        self.keyTextLengths = array.array('I')
+        # name prefix (as used for the startswith bonus in calcBestSimilarRow) -> list of row indices
+        self.namePrefixRows = {}
+        for rowIndex in range(0, leadTable.getRowCount()):
+            dName = leadTable.dNames[rowIndex]
+            for field, text in enumerate([dName, leadTable.addresses[rowIndex]]):
+                key = rowIndex * 2 + field
+                # (a row without a name or address has None for it, and matches nothing on it)
+                if (text is None):
+                    self.keyTrigramCounts.append(0)
+                    self.keyTextLengths.append(0)
+                    continue
+                trigrams = calcTrigrams(text)
+                for trigram in trigrams:
+                    posting = self.postings.get(trigram)
+                    if (posting is None):
+                        self.postings[trigram] = [key]
+                    else:
+                        posting.append(key)
+                self.keyTrigramCounts.append(len(trigrams))
+                self.keyTextLengths.append(len(text))
+            if (dName is not None):
+                namePrefix = dName[0:DefSimilarStartLen].upper()
+                self.namePrefixRows.setdefault(namePrefix, []).append(rowIndex)
+
+
+    def calcShortlists(self, txts, shortlistSize):
+        # return the shortlist of rows to re-score for each of txts (see calcSimilarShortlist)
+        # we walk the posting of each trigram once, counting its keys for every one of txts that has it
+        keyCountsList = [collections.Counter() for txt in txts]
+        txtIndicesByTrigram = {}
+        for txtIndex, txt in enumerate(txts):
+            for trigram in calcTrigrams(txt):
+                txtIndicesByTrigram.setdefault(trigram, []).append(txtIndex)
+        for trigram, txtIndices in txtIndicesByTrigram.items():
+            posting = self.postings.get(trigram)
+            if (posting is not None):
+                for txtIndex in txtIndices:
+                    keyCountsList[txtIndex].update(posting)
+        keyTrigramCounts = self.keyTrigramCounts
+        keyTextLengths = self.keyTextLengths
+        shortlists = []
+        for txt, keyCounts in zip(txts, keyCountsList):
+            keyMatches = ((key, sharedCount, keyTrigramCounts[key], keyTextLengths[key]) for key, sharedCount in keyCounts.items())
+            # a name prefix is shorter than DefSimilarStartLen only if the whole name is, so we look up each length
+            txtUpper = txt.upper()
+            prefixRowIndices = []
+            for prefixLen in range(0, DefSimilarStartLen+1):
+                prefixRowIndices.extend(self.namePrefixRows.get(txtUpper[0:prefixLen], []))
+            shortlists.append(calcSimilarShortlist(txt, keyMatches, prefixRowIndices, shortlistSize))
+        return shortlists
+
+
+
+
+def calcSimilarShortlist(txt, keyMatches, prefixRowIndices, shortlistSize):
+    # return [rowIndices, nearKeyLengths], the rows to re-score for txt first and the (key, textLength) of names and addresses to re-score after them if they could still win (see calcBestSimilarShortlistRows)
+    # keyMatches is (key, sharedCount, trigramCount, textLength) (any iterable of them) for every name or address sharing a trigram with txt (key as in HlLeadTrigramIndex), and prefixRowIndices the rows whose name gets the startswith bonus for txt
+    # rowIndices are the rows of the shortlistSize keys with the highest dice coefficient of their trigrams and those of txt (so a short query prefers short texts), plus all of prefixRowIndices
+    # (the bonus is big enough that such a row can win on it alone, so we always include them)
+    # keys that score the same are taken lowest first, so every backend given the same keyMatches shortlists the same rows
+    txtTrigramCount = len(calcTrigrams(txt))
+    scoredKeys = [(-sharedCount / (txtTrigramCount + trigramCount), key, textLength) for key, sharedCount, trigramCount, textLength in keyMatches]
+    bestScoredKeys = heapq.nsmallest(shortlistSize, scoredKeys)
+    bestKeys = set([scoredKey[1] for scoredKey in bestScoredKeys])
+    rowIndices = set([key // 2 for key in bestKeys])
+    rowIndices.update(prefixRowIndices)
+    # a short query can share all its trigrams with many more texts than fit on the shortlist, and which of those scores best comes down to the characters they share (in case too), which trigrams don't see; so we keep the keys nearly as alike as the shortlisted ones to fall back on
+    nearKeyLengths = []
+    if (len(bestScoredKeys) > 0):
+        nearScore = bestScoredKeys[-1][0] * DefSimilarNearShortlistFraction
+        nearKeyLengths = [(key, textLength) for score, key, textLength in scoredKeys if (score <= nearScore) and (key not in bestKeys)]
+    return [rowIndices, nearKeyLengths]
+
+
+def calcBestSimilarShortlistRows(txts, shortlists, makeCandidateRows):
+    # return [rowIndex, dist] for each of txts, the best scoring for it of the rows of its shortlist (see calcSimilarShortlist), as calcBestSimilarRow does
+    # makeCandidateRows(rowIndices) should return (rowIndex, dName, address) for each of a sorted list of row indices; we ask it for each row once, however many of the shortlists have it
+    candidateRowsByIndex = {}
+    addSimilarCandidateRows(candidateRowsByIndex, set().union(*[rowIndices for rowIndices, nearKeyLengths in shortlists]), makeCandidateRows)
+    bests = [calcBestSimilarRow(txt, [candidateRowsByIndex[rowIndex] for rowIndex in sorted(rowIndices)]) for txt, [rowIndices, nearKeyLengths] in zip(txts, shortlists)]
+    # after the shortlisted rows we re-score the rows of the near keys that are close enough in length to txt to beat (or tie with) the best of them
+    moreRowIndicesList = []
+    for txt, [rowIndices, nearKeyLengths], [maxRowIndex, maxDist] in zip(txts, shortlists, bests):
+        txtLen = len(txt)
+        moreRowIndices = set([key // 2 for key, textLength in nearKeyLengths if (calcRatioUpperBound(txtLen, textLength) >= maxDist)])
+        moreRowIndices.difference_update(rowIndices)
+        moreRowIndicesList.append(sorted(moreRowIndices))
+    addSimilarCandidateRows(candidateRowsByIndex, set().union(*moreRowIndicesList), makeCandidateRows)
+    for txtIndex, moreRowIndices in enumerate(moreRowIndicesList):
+        if (len(moreRowIndices) > 0):
+            [maxRowIndex, maxDist] = bests[txtIndex]
+            bests[txtIndex] = calcBestSimilarRow(txts[txtIndex], [candidateRowsByIndex[rowIndex] for rowIndex in moreRowIndices], maxRowIndex, maxDist)
+    return bests
+
+
+def addSimilarCandidateRows(candidateRowsByIndex, rowIndices, makeCandidateRows):
+    # add to candidateRowsByIndex the candidate rows (see calcBestSimilarShortlistRows) of those of rowIndices it doesn't have yet
+    newRowIndices = sorted(rowIndices.difference(candidateRowsByIndex.keys()))
+    if (len(newRowIndices) > 0):
+        for candidateRow in makeCandidateRows(newRowIndices):
+            candidateRowsByIndex[candidateRow[0]] = candidateRow
+
+
+
+
+def calcBestSimilarRow(txt, candidateRows, maxRowIndex=None, maxDist=0):
+    # return [rowIndex, dist] for the best scoring for txt of candidateRows, a list of (rowIndex, dName, address); the earliest row wins a tie, and we return [None, 0] if none scores above 0
+    # a dName or address of None scores 0
+    # pass the best [maxRowIndex, maxDist] of rows scored before to carry on from them
+    # the ratios are slow, so we score rows in order of an upper bound on their score (from lengths alone; see SequenceMatcher.real_quick_ratio), and stop once no remaining row can beat (or tie with an earlier row) our best
+    # before working out a ratio we also check the tighter (but still cheap) bound of SequenceMatcher.quick_ratio (see calcQuickRatio)
+    txtUpper = txt.upper()
+    txtLen = len(txt)
+    txtCharCounts = list(collections.Counter(txt).items())
+    startLen = DefSimilarStartLen
+    candidates = []
+    for rowIndex, dName, address in candidateRows:
+        # kludge for startswith
+        nameBonus = 0.5 if (dName is not None) and (txtUpper.startswith(dName[0:startLen].upper())) else 0
+        # (a bound of 0 can never beat our best, so we never score a None)
+        nameBound = 0 if (dName is None) else calcRatioUpperBound(txtLen, len(dName)) + nameBonus
+        addressBound = 0 if (address is None) else calcRatioUpperBound(txtLen, len(address))
+        candidates.append((max(nameBound, addressBound), rowIndex, nameBound, addressBound, nameBonus, dName, address))
+    candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+
+    matcher = SequenceMatcher(None, txt, '')
+    for bound, rowIndex, nameBound, addressBound, nameBonus, dName, address in candidates:
+        if (not calcCouldBeatBest(bound, rowIndex, maxDist, maxRowIndex)):
+            break
+        thisMaxDist = 0
+        if (calcCouldBeatBest(nameBound, rowIndex, maxDist, maxRowIndex)):
+            if (calcCouldBeatBest(calcQuickRatio(txtCharCounts, txtLen, dName) + nameBonus, rowIndex, maxDist, maxRowIndex)):
+                matcher.set_seq2(dName)
+                thisMaxDist = matcher.ratio() + nameBonus
+        if (calcCouldBeatBest(addressBound, rowIndex, max(maxDist, thisMaxDist), maxRowIndex)):
+            if (calcCouldBeatBest(calcQuickRatio(txtCharCounts, txtLen, address), rowIndex, max(maxDist, thisMaxDist), maxRowIndex)):
+                matcher.set_seq2(address)
+                thisMaxDist = max(thisMaxDist, matcher.ratio())
+        if (calcCouldBeatBest(thisMaxDist, rowIndex, maxDist, maxRowIndex)):
+            maxDist = thisMaxDist
+            maxRowIndex = rowIndex
+    return [maxRowIndex, maxDist]
+
+
+def calcCouldBeatBest(dist, rowIndex, maxDist, maxRowIndex):
+    # true if a row at rowIndex scoring dist would replace our best so far (when scanning rows in order, only a strictly better score would)
+    if (dist > maxDist):
+        return True
+    return (dist == maxDist) and (maxRowIndex is not None) and (rowIndex < maxRowIndex)
+
+
+def calcTrigrams(txt):
+    # case and whitespace insensitive; padded so that short words and word starts get trigrams of their own
+    paddedTxt = '  ' + ' '.join(txt.lower().split()) + ' '
+    return set([paddedTxt[i:i+3] for i in range(0, len(paddedTxt)-2)])
+
+
+def calcQuickRatio(txtCharCounts, txtLen, text):
+    # the same as SequenceMatcher(None, txt, text).quick_ratio(), given the items of collections.Counter(txt) and len(txt); quicker when checking one txt against many texts, since we don't count every character of each text into a dict
+    matchCount = sum([min(txtCount, text.count(char)) for char, txtCount in txtCharCounts])
+    if (txtLen + len(text) == 0):
+        return 1.0
+    return 2.0 * matchCount / (txtLen + len(text))
+
+
+def calcRatioUpperBound(lenA, lenB):
+    # upper bound on SequenceMatcher ratio of strings of these lengths
+    if (lenA + lenB == 0):
+        return 1.0
+    return 2.0 * min(lenA, lenB) / (lenA + lenB)
+
+
+def normalizeLeadKey(txt):
+    # for matching lead ids, names and addresses regardless of case and whitespace
+    return ' '.join(txt.split()).upper()
 # ---------------------------------------------------------------------------
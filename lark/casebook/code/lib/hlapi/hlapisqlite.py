@@ -0,0 +1,309 @@
+# HlApi backed by a local sqlite database of the leads and unused leads, built from the json and csv files of a data directory (see importHlApiDatabase)
+# lookups are indexed queries against the (shared, page-cached) database file, so a build doesn't have to load every lead into memory first, and concurrent builds share one store
+# row ids in the database are the same as those of HlLeadTable, so lookups find the same rows HlApi would
+
+# hlapi
+from .hlapi import HlApi, makeLeadRow, normalizeLeadKey, calcBestSimilarRow, calcSimilarShortlist, calcTrigrams, DefSimilarShortlistSize, DefSimilarStartLen
+
+# imports
+from lib.jr import jrfuncs
+from lib.jr.jrfuncs import jrprint
+
+# python imports
+import os
+import re
+import json
+import pathlib
+import sqlite3
+import hashlib
+
+
+
+# bump this if we change the schema (an older database is rebuilt)
+DefLeadDatabaseFormatVersion = 3
+
+DefLeadDatabaseSchema = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE leads (rowId INTEGER PRIMARY KEY, sourceKey TEXT NOT NULL, lead TEXT, dName TEXT, address TEXT, x REAL, y REAL, leadNormalized TEXT, dNameNormalized TEXT, addressNormalized TEXT, namePrefix TEXT);
+CREATE INDEX leadsByLead ON leads (lead);
+CREATE INDEX leadsByDName ON leads (dName);
+CREATE INDEX leadsByAddress ON leads (address);
+CREATE INDEX leadsByLeadNormalized ON leads (leadNormalized);
+CREATE INDEX leadsByDNameNormalized ON leads (dNameNormalized);
+CREATE INDEX leadsByAddressNormalized ON leads (addressNormalized);
+CREATE INDEX leadsByNamePrefix ON leads (namePrefix);
+CREATE VIRTUAL TABLE leadText USING fts5 (dName, address, content='leads', content_rowid='rowId', prefix='1 2 3');
+CREATE TABLE leadTrigrams (trigram TEXT NOT NULL, key INTEGER NOT NULL, PRIMARY KEY (trigram, key)) WITHOUT ROWID;
+CREATE TABLE leadTrigramKeys (key INTEGER PRIMARY KEY, trigramCount INTEGER NOT NULL, textLength INTEGER NOT NULL);
+CREATE TABLE unusedLeads (position INTEGER PRIMARY KEY, fields TEXT NOT NULL);
+'''
+
+
+
+# ---------------------------------------------------------------------------
+class HlApiSqlite(HlApi):
+    # same methods as HlApi; options are those of HlApi, plus 'leadDatabaseFilePath' (default under our per-user cache directory, see calcLeadDatabaseFilePath)
+    # the database is (re)built from dataDir whenever it is missing or any of the files it was built from have changed (see calcHlApiSourceSignature); with a dataDir of None we just use the database as it is
+    def __init__(self, dataDir, options={}):
+        super().__init__(dataDir, options)
+        self.connection = None
+        # position in unusedLeads of the next lead popAvailableLead will return (we hand them out last first, as HlApi does)
+        self.unusedLeadPosition = None
+
+    def getDatabaseFilePath(self):
+        return self.options.get('leadDatabaseFilePath', calcLeadDatabaseFilePath(self.dataDir))
+
+
+
+# ---------------------------------------------------------------------------
+    def loadLeads(self):
+        if (not self.isEnabled()):
+            return False
+        databaseFilePath = self.getDatabaseFilePath()
+        if (self.dataDir is not None) and (not calcLeadDatabaseIsCurrent(databaseFilePath, self.dataDir)):
+            importHlApiDatabase(self.dataDir, databaseFilePath, self.options)
+        # read only, so any number of builds can share it
+        self.connection = sqlite3.connect(pathlib.Path(os.path.abspath(databaseFilePath)).as_uri() + '?mode=ro', uri=True)
+        return True
+
+
+    def loadUnusedLeadsFromFile(self):
+        if (self.connection is None):
+            self.loadLeads()
+        self.unusedLeadPosition = self.connection.execute('SELECT count(*) FROM unusedLeads').fetchone()[0] - 1
+
+
+    def popAvailableLead(self):
+        if (not self.isEnabled()):
+            return None
+        if (self.unusedLeadPosition is None):
+            self.loadUnusedLeadsFromFile()
+        if (self.unusedLeadPosition < 0):
+            raise IndexError('pop from empty list of unused leads')
+        fields = self.connection.execute('SELECT fields FROM unusedLeads WHERE position = ?', (self.unusedLeadPosition,)).fetchone()[0]
+        self.unusedLeadPosition -= 1
+        return json.loads(fields)
+
+
+
+# ---------------------------------------------------------------------------
+    def findLeadRowByLeadId(self, leadId):
+        if (not self.isEnabled()):
+            return [None, None]
+
+        if (self.connection is None):
+            self.loadLeads()
+        if (leadId.startswith('#')):
+            leadId = leadId[1:]
+        #
+        return self.lookupLeadColumns(['lead'], leadId)
+
+
+    def findLeadRowByNameOrAddress(self, txt):
+        if (not self.isEnabled()):
+            return [None, None]
+        txt = txt.strip()
+        if (txt==''):
+            return [None, None]
+
+        if (self.connection is None):
+            self.loadLeads()
+        return self.lookupLeadColumns(['address', 'dName'], txt)
+
+
+    def lookupLeadColumns(self, columnNames, key):
+        # return [row, sourceKey] for the first row (in scan order) with key in any of columnNames; exact match first, then one that differs only in case or whitespace
+        rowId = self.queryFirstRowId(columnNames, key)
+        if (rowId is None):
+            rowId = self.queryFirstRowId([columnName + 'Normalized' for columnName in columnNames], normalizeLeadKey(key))
+        if (rowId is None):
+            return [None, None]
+        return self.makeRow(rowId)
+
+
+    def queryFirstRowId(self, columnNames, key):
+        # one indexed query per column, rather than an OR (which sqlite can't answer from the indexes)
+        sql = 'SELECT min(rowId) FROM (' + ' UNION ALL '.join(['SELECT rowId FROM leads WHERE {} = ?'.format(columnName) for columnName in columnNames]) + ')'
+        return self.connection.execute(sql, [key] * len(columnNames)).fetchone()[0]
+
+
+    def makeRow(self, rowId):
+        # return [row, sourceKey]
+        [leadId, dName, address, x, y, sourceKey] = self.connection.execute('SELECT lead, dName, address, x, y, sourceKey FROM leads WHERE rowId = ?', (rowId,)).fetchone()
+        return [makeLeadRow(leadId, dName, address, x, y), sourceKey]
+
+
+
+# ---------------------------------------------------------------------------
+    def calcSimilarShortlists(self, txts, shortlistSize):
+        # the same shortlists HlLeadTrigramIndex gives (keys being rowId*2 for a name and rowId*2+1 for an address; see calcSimilarShortlist), from one query over all of txts (per batch of them)
+        if (self.connection is None):
+            self.loadLeads()
+        keyMatchesList = [[] for txt in txts]
+        trigramRowGroups = [[[txtIndex, trigram] for trigram in sorted(calcTrigrams(txt))] for txtIndex, txt in enumerate(txts)]
+        for [txtIndex, key, sharedCount, trigramCount, textLength] in self.queryWithValues('SELECT matches.txtIndex, matches.key, matches.sharedCount, leadTrigramKeys.trigramCount, leadTrigramKeys.textLength FROM (SELECT queryValues.column1 AS txtIndex, leadTrigrams.key AS key, COUNT(*) AS sharedCount FROM queryValues JOIN leadTrigrams ON leadTrigrams.trigram = queryValues.column2 GROUP BY queryValues.column1, leadTrigrams.key) AS matches JOIN leadTrigramKeys ON leadTrigramKeys.key = matches.key', trigramRowGroups):
+            keyMatchesList[txtIndex].append((key, sharedCount, trigramCount, textLength))
+        prefixRowIdsList = [[] for txt in txts]
+        prefixRowGroups = [[[txtIndex, txt.upper()[0:prefixLen]] for prefixLen in range(0, DefSimilarStartLen+1)] for txtIndex, txt in enumerate(txts)]
+        for [txtIndex, rowId] in self.queryWithValues('SELECT queryValues.column1, leads.rowId FROM queryValues JOIN leads ON leads.namePrefix = queryValues.column2', prefixRowGroups):
+            prefixRowIdsList[txtIndex].append(rowId)
+        return [calcSimilarShortlist(txt, keyMatches, prefixRowIds, shortlistSize) for txt, keyMatches, prefixRowIds in zip(txts, keyMatchesList, prefixRowIdsList)]
+
+
+    def queryWithValues(self, sql, valueRowGroups):
+        # return the rows of sql run over the rows of values in valueRowGroups (a list of groups, each a list of rows, each a list of values), which sql gets as table queryValues (with columns column1, column2 and so on)
+        # (in batches, to stay under sqlite's limit on query parameters; a group is never split over batches, so sql can aggregate over one)
+        rows = []
+        batchValueRows = []
+        for valueRows in valueRowGroups + [None]:
+            if (len(batchValueRows) > 0) and ((valueRows is None) or ((len(batchValueRows) + len(valueRows)) * len(batchValueRows[0]) > 500)):
+                columnSql = '(' + ','.join(['?'] * len(batchValueRows[0])) + ')'
+                rows.extend(self.connection.execute('WITH queryValues AS (VALUES {}) '.format(','.join([columnSql] * len(batchValueRows))) + sql, [val for valueRow in batchValueRows for val in valueRow]))
+                batchValueRows = []
+            if (valueRows is not None):
+                batchValueRows.extend(valueRows)
+        return rows
+
+
+    def findLeadRowSimilarByNameOrAddressScan(self, txt):
+        # score every row (useful to check the shortlist against)
+        if (self.connection is None):
+            self.loadLeads()
+        candidateRows = self.connection.execute('SELECT rowId, dName, address FROM leads ORDER BY rowId').fetchall()
+        [maxRowId, maxDist] = calcBestSimilarRow(txt.strip(), candidateRows)
+        return self.makeSimilarResult(maxRowId, maxDist)
+
+
+    def makeSimilarCandidateRows(self, rowIds):
+        # (rowId, dName, address) of each of the rows at rowIds, as calcBestSimilarRow takes them
+        candidateRows = []
+        # (in batches, to stay under sqlite's limit on query parameters)
+        for batchStart in range(0, len(rowIds), 500):
+            batchRowIds = rowIds[batchStart:batchStart+500]
+            candidateRows.extend(self.connection.execute('SELECT rowId, dName, address FROM leads WHERE rowId IN ({}) ORDER BY rowId'.format(','.join(['?'] * len(batchRowIds))), batchRowIds))
+        return candidateRows
+
+
+    def makeSimilarResult(self, maxRowId, maxDist):
+        # not found
+        if (maxRowId is None):
+            return [None, None, 0]
+        return self.makeRow(maxRowId) + [maxDist]
+
+
+
+# ---------------------------------------------------------------------------
+    def findLeadRowsByText(self, txt, maxCount=10):
+        # return list of [row, sourceKey] (best first) for rows whose name or address have words starting with every word of txt
+        if (not self.isEnabled()):
+            return []
+        if (self.connection is None):
+            self.loadLeads()
+        matchQuery = makeLeadTextMatchQuery(txt)
+        if (matchQuery is None):
+            return []
+        rowIds = [row[0] for row in self.connection.execute('SELECT rowid FROM leadText WHERE leadText MATCH ? ORDER BY rank LIMIT ?', (matchQuery, maxCount))]
+        return [self.makeRow(rowId) for rowId in rowIds]
+# ---------------------------------------------------------------------------
+
+
+
+
+# ---------------------------------------------------------------------------
+def importHlApiDatabase(dataDir, databaseFilePath, options={}):
+    # build a lead database from the leads/*.json and unusedLeads.csv of dataDir (reading them as HlApi does, so rows keep their row ids)
+    jrprint('Building lead database "{}" from "{}"..'.format(databaseFilePath, dataDir))
+    sourceSignature = calcHlApiSourceSignature(dataDir)
+    hlapi = HlApi(dataDir, options)
+    hlapi.loadLeads()
+    # a data directory without unused leads just has none to hand out
+    if (jrfuncs.pathExists(dataDir + '/unusedLeads.csv')):
+        hlapi.loadUnusedLeadsFromFile()
+    else:
+        hlapi.unusedLeads = []
+    leadTable = hlapi.leadTable
+
+    leadRows = []
+    trigramRows = []
+    trigramKeyRows = []
+    for rowIndex in range(0, leadTable.getRowCount()):
+        [leadId, dName, address] = [leadTable.leadIds[rowIndex], leadTable.dNames[rowIndex], leadTable.addresses[rowIndex]]
+        normalizedKeys = [normalizeLeadKey(key) if (isinstance(key, str)) else None for key in [leadId, dName, address]]
+        x = leadTable.coordinates[rowIndex*2]
+        y = leadTable.coordinates[rowIndex*2+1]
+        namePrefix = None if (dName is None) else dName[0:DefSimilarStartLen].upper()
+        leadRows.append([rowIndex, leadTable.getSourceKey(rowIndex), leadId, dName, address, x, y] + normalizedKeys + [namePrefix])
+        # (as HlLeadTrigramIndex indexes them)
+        for field, text in enumerate([dName, address]):
+            if (text is None):
+                continue
+            trigrams = calcTrigrams(text)
+            trigramRows.extend([[trigram, rowIndex * 2 + field] for trigram in trigrams])
+            trigramKeyRows.append([rowIndex * 2 + field, len(trigrams), len(text)])
+
+    # build in a temp file and rename so a concurrent build never sees a partial database
+    jrfuncs.createPrivateDirForFullFilePathIfMissing(databaseFilePath)
+    tempFilePath = '{}.{}.tmp'.format(databaseFilePath, os.getpid())
+    if (os.path.exists(tempFilePath)):
+        os.remove(tempFilePath)
+    connection = sqlite3.connect(tempFilePath)
+    try:
+        connection.executescript(DefLeadDatabaseSchema)
+        # (sqlite stores nan as NULL)
+        connection.executemany('INSERT INTO leads VALUES (?,?,?,?,?,?,?,?,?,?,?)', leadRows)
+        connection.execute("INSERT INTO leadText (leadText) VALUES ('rebuild')")
+        connection.executemany('INSERT INTO leadTrigrams VALUES (?,?)', trigramRows)
+        connection.executemany('INSERT INTO leadTrigramKeys VALUES (?,?,?)', trigramKeyRows)
+        connection.executemany('INSERT INTO unusedLeads VALUES (?,?)', [[position, json.dumps(row)] for position, row in enumerate(hlapi.unusedLeads)])
+        connection.executemany('INSERT INTO meta VALUES (?,?)', [['formatVersion', str(DefLeadDatabaseFormatVersion)], ['sourceSignature', sourceSignature]])
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tempFilePath, databaseFilePath)
+    jrprint('Built lead database with {} leads and {} unused leads.'.format(len(leadRows), len(hlapi.unusedLeads)))
+
+
+def calcLeadDatabaseIsCurrent(databaseFilePath, dataDir):
+    # true if the database exists, has our schema, and was built from the files dataDir has now
+    if (not jrfuncs.pathExists(databaseFilePath)):
+        return False
+    try:
+        connection = sqlite3.connect(pathlib.Path(os.path.abspath(databaseFilePath)).as_uri() + '?mode=ro', uri=True)
+        try:
+            meta = dict(connection.execute('SELECT key, value FROM meta').fetchall())
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return False
+    return (meta.get('formatVersion') == str(DefLeadDatabaseFormatVersion)) and (meta.get('sourceSignature') == calcHlApiSourceSignature(dataDir))
+
+
+def calcHlApiSourceSignature(dataDir):
+    # json text listing each file a lead database is built from, with its modification time and size
+    filePaths = [dataDir + '/unusedLeads.csv']
+    for (dirPath, dirNames, fileNames) in os.walk(dataDir + '/leads/'):
+        for fileName in fileNames:
+            if (fileName.lower().endswith('.json')):
+                filePaths.append(dirPath + '/' + fileName)
+    signature = []
+    for filePath in sorted(filePaths):
+        if (os.path.exists(filePath)):
+            fileStat = os.stat(filePath)
+            signature.append([os.path.relpath(filePath, dataDir), fileStat.st_mtime_ns, fileStat.st_size])
+    return json.dumps(signature)
+
+
+def calcLeadDatabaseFilePath(dataDir):
+    # one database per data directory
+    dataDirHash = hashlib.sha256(os.path.realpath(dataDir).encode('utf-8')).hexdigest()[0:16]
+    return jrfuncs.calcUserCacheDir('leaddb') + '/leads_' + dataDirHash + '.sqlite'
+
+
+def makeLeadTextMatchQuery(txt):
+    # return an fts5 query (for leadText) matching names or addresses with words starting with each of the words of txt, or None if txt has no words
+    words = re.findall(r'\w+', txt.lower())
+    if (len(words) == 0):
+        return None
+    # (quoted, so words like "and" or "or" aren't taken as operators)
+    return ' '.join(['"{}"*'.format(word) for word in words])
+# ---------------------------------------------------------------------------
@@ -16,6 +16,10 @@ import random
 import json
 import math
 import traceback
+import sys
+import queue
+import threading
+import atexit
 
 
 
@@ -24,8 +28,19 @@ import traceback
 
 #---------------------------------------------------------------------------
 LogFilePath = 'logs'
-moduleLogFile = None
+moduleLogWriter = None
 moduleErrorPrintCount = 0
+moduleWarningPrintCount = 0
+# when not None, jrprint/jrlog append [textLine, severity, flagPrint] records here instead of logging and printing (see startLogCapture)
+moduleLogCapture = None
+
+# severities that can be passed to jrprint/jrlog (severity=...); errors and warnings are counted for end run reporting
+DefLogSeverityInfo = 0
+DefLogSeverityWarning = 1
+DefLogSeverityError = 2
+
+# size of the log file write buffer; the writer thread only flushes when asked (see flushLog) or at exit
+DefLogFileBufferSize = 256 * 1024
 
 def setLogFileDir(path):
     global LogFilePath
@@ -48,22 +63,115 @@ def calcLogFilePath():
     return filePath
 
 def openLogFile():
-    global moduleLogFile
+    global moduleLogWriter
     filePath = calcLogFilePath()
     encoding = 'utf-8'
-    moduleLogFile = open(filePath, 'a+', encoding=encoding)
+    moduleLogWriter = JrLogWriter(filePath, encoding)
     print('>LOGGING TO: {}..'.format(filePath))
-    return moduleLogFile
+    return moduleLogWriter
 
 def getOpenLogFile():
-    global moduleLogFile
-    if (not moduleLogFile):
-        moduleLogFile = openLogFile()
-    return moduleLogFile
+    global moduleLogWriter
+    if (not moduleLogWriter):
+        moduleLogWriter = openLogFile()
+    return moduleLogWriter
+
+def flushLog():
+    # block until everything logged so far is on disk
+    if (moduleLogWriter):
+        moduleLogWriter.flush()
+
+def closeLogFile():
+    global moduleLogWriter
+    if (moduleLogWriter):
+        moduleLogWriter.close()
+        moduleLogWriter = None
+
+def startLogCapture():
+    # capture what jrprint/jrlog would output (e.g. in a worker process, so that the main process can output it in the right order with replayLogCapture)
+    global moduleLogCapture
+    moduleLogCapture = []
+
+def stopLogCapture():
+    # return the captured records and go back to normal output
+    global moduleLogCapture
+    records = moduleLogCapture
+    moduleLogCapture = None
+    return records
+
+def replayLogCapture(records):
+    # log, print and count records captured by startLogCapture, as if they had been output here
+    for [textLine, severity, flagPrint] in records:
+        countLogSeverity(severity)
+        getOpenLogFile().write(textLine)
+        if (flagPrint):
+            sys.stdout.write(textLine)
+
+def countLogSeverity(severity):
+    if (severity >= DefLogSeverityError):
+        incLogErrorPrintCount()
+    elif (severity == DefLogSeverityWarning):
+        incLogWarningPrintCount()
 
 def incLogErrorPrintCount():
     global moduleErrorPrintCount
     moduleErrorPrintCount += 1
+
+def incLogWarningPrintCount():
+    global moduleWarningPrintCount
+    moduleWarningPrintCount += 1
+
+
+
+
+class JrLogWriter:
+    # callers just queue already formatted text; a background thread drains the queue into a block-buffered log file, so logging never waits on disk io
+    def __init__(self, filePath, encoding):
+        self.filePath = filePath
+        self.file = open(filePath, 'a+', encoding=encoding, buffering=DefLogFileBufferSize)
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.writerLoop, name='JrLogWriter', daemon=True)
+        self.thread.start()
+        # make sure the tail of the log gets written
+        atexit.register(self.close)
+
+    def write(self, text):
+        self.queue.put(text)
+
+    def flush(self):
+        # queue a flush request and wait for the writer thread to get to it
+        if (not self.thread.is_alive()):
+            return
+        doneEvent = threading.Event()
+        self.queue.put(doneEvent)
+        doneEvent.wait()
+
+    def close(self):
+        if (not self.thread.is_alive()):
+            return
+        self.queue.put(None)
+        self.thread.join()
+
+    def writerLoop(self):
+        # None means close; an Event is a flush request which we set once the file is flushed
+        while (True):
+            item = self.queue.get()
+            try:
+                if (item is None):
+                    self.file.close()
+                    return
+                elif (isinstance(item, threading.Event)):
+                    self.file.flush()
+                    item.set()
+                else:
+                    self.file.write(item)
+            except Exception as e:
+                incLogErrorPrintCount()
+                print('EXCEPTION1 WHILE TRYING TO PRINT TO FILE: {}'.format(e), file=sys.stderr)
+                if (isinstance(item, threading.Event)):
+                    item.set()
+                elif (item is None):
+                    return
 #---------------------------------------------------------------------------
 
 
@@ -92,6 +200,35 @@ def createDirForFullFilePathIfMissing(filePath):
 
 
 
+def calcUserCacheDir(subDirName):
+    # directory (per user, under XDG_CACHE_HOME or ~/.cache) for our caches of pickled data, which must never be somewhere other users can write (see isPrivateCacheFile)
+    baseDir = os.environ.get('XDG_CACHE_HOME')
+    if (not baseDir):
+        baseDir = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(baseDir, 'casebook', subDirName)
+
+
+def createPrivateDirForFullFilePathIfMissing(filePath):
+    # like createDirForFullFilePathIfMissing, but only we can read or write a directory we create
+    dirPath = os.path.dirname(filePath)
+    if not os.path.exists(dirPath):
+       mylog('creating directory: ' + dirPath)
+       os.makedirs(dirPath, mode=0o700)
+
+
+def isPrivateCacheFile(filePath):
+    # true if filePath and its directory belong to us and no one else can write them; loading a pickle runs code, so we only load cache files that pass this
+    # (on platforms without posix owners and permissions we can't tell, and allow it)
+    if (os.name != 'posix'):
+        return True
+    for path in [filePath, os.path.dirname(os.path.abspath(filePath))]:
+        pathStat = os.stat(path)
+        if (pathStat.st_uid != os.getuid()) or (pathStat.st_mode & 0o022):
+            return False
+    return True
+
+
+
 def pathExists(path):
     pathExists = os.path.exists(path)
     return pathExists
@@ -109,7 +246,7 @@ def copyFile(sourcePath, destPath, fname):
     jrprint('Asked to copy "{}" from "{}" to "{}".'.format(fname, sourcePath, destPath))
     srcFile = sourcePath + '/' + fname
     if (not pathExists(srcFile)):
-        jrprint('Error: cannot copy from "{}" to "{}" because source file does not exist.'.format(sourcePath, destPath))
+        jrprint('Error: cannot copy from "{}" to "{}" because source file does not exist.'.format(sourcePath, destPath), severity=DefLogSeverityError)
         return False
     createDirIfMissing(destPath)
     shutil.copy2(sourcePath+'/'+fname, destPath)
@@ -433,7 +570,7 @@ def deepMerge(a, b, path=None):
                 # jr mod to merge lists
                 a[key] = a[key] + b[key]
             else:
-                jrprint('WARNING: attmempting to merge dictionaries but got conflicting values at key {}; merging {} and {}.'.format(key, a, b))
+                jrprint('WARNING: attmempting to merge dictionaries but got conflicting values at key {}; merging {} and {}.'.format(key, a, b), severity=DefLogSeverityWarning)
                 raise Exception('Conflict at %s' % '.'.join(path + [str(key)]))
         else:
             a[key] = b[key]
@@ -719,47 +856,41 @@ def formatLocLabel(locLabel):
 
 # ---------------------------------------------------------------------------
 #
-def jrprint(*args, **kwargs):
+def jrprint(*args, severity=DefLogSeverityInfo, **kwargs):
     # replacement for print function that will allow logging
-    global moduleErrorPrintCount
-
-    # create log file if needed
-    logFile = getOpenLogFile()
-
-    # check for any presence of the word error (this is just for end run reporting, its ok if its not precise)
-
-    textLine = jrSprintf(args,kwargs).upper()
-    if ('ERROR' in textLine) or ('EXCEPTION' in textLine):
-        moduleErrorPrintCount += 1
-
-    # log
-    try:
-        print(*args, file=logFile, **kwargs)
-    except Exception as e:
-        incLogErrorPrintCount()
-        print('EXCEPTION1 WHILE TRYING TO PRINT TO FILE: {}'.format(e))
-        # invoke normal print
-        print(*args, **kwargs)
+    # pass severity=DefLogSeverityError (or Warning) for messages that should be counted for end run reporting
+    textLine = jrLogFormatAndCount(args, severity, kwargs)
+    if (moduleLogCapture is not None):
+        moduleLogCapture.append([textLine, severity, True])
         return
 
+    # log (queued to the log writer thread)
+    getOpenLogFile().write(textLine)
+
     # invoke normal print
-    return print(*args, **kwargs)
+    sys.stdout.write(textLine)
+    if (kwargs.get('flush')):
+        sys.stdout.flush()
 
 
-def jrlog(*args, **kwargs):
-    # replacement for print function that will allow logging
-    global moduleErrorPrintCount
+def jrlog(*args, severity=DefLogSeverityInfo, **kwargs):
+    # like jrprint but only goes to the log file
+    textLine = jrLogFormatAndCount(args, severity, kwargs)
+    if (moduleLogCapture is not None):
+        moduleLogCapture.append([textLine, severity, False])
+        return
+    getOpenLogFile().write(textLine)
 
-    # create log file if needed
-    logFile = getOpenLogFile()
 
-    # log
-    try:
-        print(*args, file=logFile, **kwargs)
-    except Exception as e:
-        incLogErrorPrintCount()
-        print('EXCEPTION2 WHILE TRYING TO PRINT TO FILE: {}'.format(e))
-        return
+def jrLogFormatAndCount(args, severity, kwargs):
+    # format the message the way print would (just once, for both the log and stdout), and count it by severity
+    sep = kwargs.get('sep')
+    end = kwargs.get('end')
+    textLine = (' ' if (sep is None) else sep).join([str(arg) for arg in args]) + ('\n' if (end is None) else end)
+    # (captured records are counted when they are replayed)
+    if (moduleLogCapture is None):
+        countLogSeverity(severity)
+    return textLine
 
 
 # see https://stackoverflow.com/questions/5309978/sprintf-like-functionality-in-python
@@ -773,10 +904,14 @@ def getJrPrintErrorCount():
     global moduleErrorPrintCount
     return moduleErrorPrintCount
 
+def getJrPrintWarningCount():
+    global moduleWarningPrintCount
+    return moduleWarningPrintCount
+
 
 def jrException(msg):
     textLine = 'EXCEPTION: ' + msg
-    jrprint(textLine)
+    jrprint(textLine, severity=DefLogSeverityError)
      
 # ---------------------------------------------------------------------------
 
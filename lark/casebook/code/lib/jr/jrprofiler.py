@@ -0,0 +1,140 @@
+# lightweight span profiler (timing instrumentation)
+# spans are cheap enough to leave on all the time: begin/end just record perf_counter_ns times in a list; all the work of naming and summarizing happens at export
+
+# my libs
+from . import jrfuncs
+from .jrfuncs import jrprint
+
+# python
+import time
+import os
+import json
+
+
+
+
+# standard span categories
+DefProfileCategoryPhase = "phase"
+DefProfileCategoryEntry = "entry"
+DefProfileCategoryFunction = "function"
+DefProfileCategoryRender = "render"
+
+# span list fields
+DefSpanIndexName = 0
+DefSpanIndexCategory = 1
+DefSpanIndexStart = 2
+DefSpanIndexEnd = 3
+DefSpanIndexChildTime = 4
+
+
+
+
+class JrProfiler:
+    def __init__(self, flagEnabled=True):
+        self.enabled = flagEnabled
+        self.reset()
+
+    def reset(self):
+        # finished spans, in the order they ended
+        self.spans = []
+        # currently open spans (innermost last), so that we can charge child time to parents and compute self time
+        self.openSpans = []
+        self.baseTime = time.perf_counter_ns()
+
+    def setEnabled(self, flagEnabled):
+        self.enabled = flagEnabled
+    def getEnabled(self):
+        return self.enabled
+
+
+    def begin(self, name, category):
+        # name can be any object (e.g. an entry id); it is only converted to a string at export
+        if (not self.enabled):
+            return None
+        span = [name, category, time.perf_counter_ns(), 0, 0]
+        self.openSpans.append(span)
+        return span
+
+    def end(self, span):
+        if (span is None):
+            return
+        now = time.perf_counter_ns()
+        span[DefSpanIndexEnd] = now
+        # pop up to and including this span; normally it is the innermost, but if an exception skipped the end of a nested span, we drop it here
+        openSpans = self.openSpans
+        while (len(openSpans) > 0) and (openSpans.pop() is not span):
+            pass
+        if (len(openSpans) > 0):
+            openSpans[-1][DefSpanIndexChildTime] += now - span[DefSpanIndexStart]
+        self.spans.append(span)
+
+    def span(self, name, category):
+        # for use in a with statement around coarse phases: with profiler.span("parse", DefProfileCategoryPhase):
+        return JrProfilerSpan(self, name, category)
+
+
+    def calcSummary(self):
+        # return list of dicts (one per category+name), sorted by self time (time not spent in child spans), largest first
+        summaryDict = {}
+        for span in self.spans:
+            key = (span[DefSpanIndexCategory], str(span[DefSpanIndexName]))
+            totalTime = span[DefSpanIndexEnd] - span[DefSpanIndexStart]
+            row = summaryDict.get(key)
+            if (row is None):
+                row = {"category": key[0], "name": key[1], "count": 0, "totalSecs": 0.0, "selfSecs": 0.0}
+                summaryDict[key] = row
+            row["count"] += 1
+            row["totalSecs"] += totalTime / 1e9
+            row["selfSecs"] += (totalTime - span[DefSpanIndexChildTime]) / 1e9
+        return sorted(summaryDict.values(), key=lambda row: row["selfSecs"], reverse=True)
+
+    def printSummary(self, topCount=25):
+        summary = self.calcSummary()
+        jrprint("Profile summary ({} spans; top {} by self time):".format(len(self.spans), min(topCount, len(summary))))
+        jrprint("  {:<10} {:<40} {:>8} {:>10} {:>10}".format("category", "name", "count", "selfSecs", "totalSecs"))
+        for row in summary[0:topCount]:
+            jrprint("  {:<10} {:<40} {:>8} {:>10.4f} {:>10.4f}".format(row["category"], row["name"][0:40], row["count"], row["selfSecs"], row["totalSecs"]))
+
+
+    def calcChromeTraceDict(self):
+        # chrome trace-event format (load in chrome://tracing or https://ui.perfetto.dev); complete ("X") events with times in microseconds
+        pid = os.getpid()
+        traceEvents = []
+        for span in self.spans:
+            traceEvents.append({
+                "name": str(span[DefSpanIndexName]),
+                "cat": span[DefSpanIndexCategory],
+                "ph": "X",
+                "ts": (span[DefSpanIndexStart] - self.baseTime) / 1000.0,
+                "dur": (span[DefSpanIndexEnd] - span[DefSpanIndexStart]) / 1000.0,
+                "pid": pid,
+                "tid": 0,
+                })
+        # viewers prefer events sorted by start time
+        traceEvents.sort(key=lambda event: event["ts"])
+        return {"traceEvents": traceEvents, "displayTimeUnit": "ms"}
+
+    def exportChromeTrace(self, filePath):
+        if (os.path.dirname(filePath) != ""):
+            jrfuncs.createDirForFullFilePathIfMissing(filePath)
+        with open(filePath, "w", encoding="utf-8") as outFile:
+            json.dump(self.calcChromeTraceDict(), outFile)
+
+
+
+
+class JrProfilerSpan:
+    # context manager helper; see JrProfiler.span
+    def __init__(self, profiler, name, category):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.span = None
+
+    def __enter__(self):
+        self.span = self.profiler.begin(self.name, self.category)
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.profiler.end(self.span)
+        return False
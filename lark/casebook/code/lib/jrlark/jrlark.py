@@ -1,13 +1,46 @@
 # lark
+import lark
 from lark import Lark, tree, logger, UnexpectedInput
+from lark.exceptions import GrammarError
+from lark.load_grammar import load_grammar
+from lark.parsers.earley_forest import SymbolNode, PackedNode
 
 # python
 import os
+import sys
 import time
+import json
+import pickle
+import hashlib
+import re
+import bisect
+import concurrent.futures
+import multiprocessing.reduction
 
 # my libs
 from lib.jr import jrfuncs
 from lib.jr.jrfuncs import jrprint
+from lib.jr.jrprofiler import DefProfileCategoryPhase
+
+
+
+# in-process memo of built parsers, keyed by the same content hash we use for the on-disk cache
+# this lets repeated parseText calls (and multiple engine objects) share one parser instance
+moduleParserMemo = {}
+
+# trace category (see env.isTracing) for our debug output; level 2 (detail) also prints the whole parse tree
+DefTraceCategoryParse = "parse"
+DefTraceLevelInfo = 1
+DefTraceLevelDetail = 2
+
+# bump this if we change the format of what we store in the on-disk parser cache
+DefParserCacheFormatVersion = 1
+
+# for incremental parsing, we split source into one chunk per entry (at header lines) and parse each chunk on its own, using these start symbols (index is header level; level 0 is the preliminary matter before first header)
+DefIncrementalChunkStartSymbols = ["start", "level1_entry", "level2_entry", "level3_entry"]
+# finds header lines to split at; we skip over constructs that could hide a # at the start of a line (raw text, block comments, triple quoted strings)
+# ATTN: this does not have to be perfect -- a bad split will just fail to parse and we fall back to a full parse; and a missed header just stays inside the previous chunk
+DefIncrementalSplitRegex = re.compile(r"<<<[\s\S]*?>>>|/\*[\s\S]*?\*/|\"\"\"[\s\S]*?\"\"\"|'''[\s\S]*?'''|//[^\r\n]*|^(#{1,3})(?!#)", re.MULTILINE)
 
 
 
@@ -20,9 +53,18 @@ class JrParserEngineLark:
         self.sourceFilePath = None
         #
         self.grammarText = None
+        self.grammarTextLalr = None
         self.sourceText = None
         #
         self.parseTree = None
+        self.parser = None
+        # "lalr" or "earley", whichever actually produced the last parse tree ("incremental" if it was stitched together from cached entry chunks)
+        self.parserUsed = None
+        #
+        # incremental parsing: cache of parsed entry chunks keyed by hash of chunk text, and text hashes of chunks that failed to parse on their own
+        self.incrementalChunkCache = {}
+        self.incrementalFailedChunkKeys = set()
+        self.incrementalStats = None
         #
         # see https://lark-parser.readthedocs.io/en/latest/classes.html
         # lexer:
@@ -57,7 +99,24 @@ class JrParserEngineLark:
             "maybe_placeholders": True,
 
             "propagate_positions": True,
-            "regex": True
+            "regex": True,
+
+            # on-disk cache of compiled parsers, keyed on grammar text + options + lark version; None cacheDir means use our per user cache dir (see jrfuncs.calcUserCacheDir)
+            "diskCache": True,
+            "cacheDir": None,
+
+            # if there is an LALR variant of the grammar next to the main grammar file (<name>_lalr.lark) we try it first since it is MUCH faster; we fall back to the main (earley) grammar on any syntax error
+            "lalrFirst": True,
+            "lalrGrammarSuffix": "_lalr",
+
+            # incremental parsing splits source into entries (at header lines) and only re-parses entries whose text has changed since last parse (see parseTextIncremental)
+            # incrementalVerify does a full parse as well and compares (slow; for debugging only)
+            "incremental": False,
+            "incrementalVerify": False,
+
+            # parallel parsing splits source at level 1 entries and parses them in a pool of worker processes (see parseTextParallel); parallelWorkers None means one per cpu
+            "parallel": False,
+            "parallelWorkers": None,
         }
     
 
@@ -66,6 +125,14 @@ class JrParserEngineLark:
         self.grammarFilePath = grammarFilePath
         grammarText = jrfuncs.loadTxtFromFile(self.grammarFilePath, True, encoding=encoding)
         self.grammarText = grammarText
+        # optional lalr variant
+        self.grammarTextLalr = None
+        lalrGrammarFilePath = self.calcLalrGrammarFilePath(grammarFilePath)
+        if (self.options["lalrFirst"]) and (jrfuncs.pathExists(lalrGrammarFilePath)):
+            self.grammarTextLalr = jrfuncs.loadTxtFromFile(lalrGrammarFilePath, True, encoding=encoding)
+
+    def calcLalrGrammarFilePath(self, grammarFilePath):
+        return jrfuncs.createSisterFileName(grammarFilePath, self.options["lalrGrammarSuffix"]) + os.path.splitext(grammarFilePath)[1]
 
     def loadSourceFromFilePath(self, sourceFilePath, encoding):
         self.sourceFilePath = sourceFilePath
@@ -73,9 +140,15 @@ class JrParserEngineLark:
         self.sourceText = text
         return text
 
-    def parseSourceFromFilePath(self, env, sourceFilePath, startSymbol, encoding):
-        sourceText = self.loadSourceFromFilePath(sourceFilePath, encoding)
-        self.parseTree = self.parseText(env, sourceText, startSymbol)
+    def parseSourceFromFilePath(self, env, sourceFilePath, startSymbol, encoding, flagIncremental=None):
+        with env.getProfiler().span("load", DefProfileCategoryPhase):
+            self.loadSourceFromFilePath(sourceFilePath, encoding)
+        return self.parseLoadedSource(env, startSymbol, flagIncremental)
+
+    def parseLoadedSource(self, env, startSymbol, flagIncremental=None):
+        # parse the source text we already loaded (see loadSourceFromFilePath)
+        with env.getProfiler().span("parse", DefProfileCategoryPhase):
+            self.parseTree = self.parseText(env, self.sourceText, startSymbol, flagIncremental)
         return self.parseTree
 
     def getRawSourceDict(self):
@@ -85,45 +158,179 @@ class JrParserEngineLark:
     def getParseTree(self):
         return self.parseTree
 
-    def buildParser(self):
+    def releaseParseTree(self):
+        # let go of the last parse tree (once the caller has converted it, it can be freed)
+        self.parseTree = None
+
+    def calcLarkOptions(self):
+        # the subset of our options that are actually passed to Lark (and so affect the built parser)
+        options = self.options
+        larkOptions = {
+            "parser": options["parser"],
+            "start": options["start"],
+            "ambiguity": options["ambiguity"],
+            "lexer": options["lexer"],
+            "strict": options["strict"],
+            "debug": options["larkDebug"],
+            "maybe_placeholders": options["maybe_placeholders"],
+            "propagate_positions": options["propagate_positions"],
+            "regex": options["regex"],
+        }
+        return larkOptions
+
+    def calcLarkOptionsLalr(self):
+        # same as above but for the lalr variant of the grammar
+        larkOptions = self.calcLarkOptions()
+        larkOptions["parser"] = "lalr"
+        larkOptions["lexer"] = "contextual"
+        larkOptions["ambiguity"] = "auto"
+        return larkOptions
+
+
+    def calcLarkCallbackOptions(self, larkOptions):
+        # options passed to Lark that can't go into the cache key (functions)
+        if (larkOptions["parser"] == "lalr"):
+            return {"lexer_callbacks": {"_NLV": fixNewlineEndingTokenEndPosition, "_NEWLINE": fixNewlineEndingTokenEndPosition, "RAWTEXT": fixNewlineEndingTokenEndPosition}}
+        return {}
+
+
+    def calcParserCacheKey(self, grammarText, larkOptions):
+        # content hash of everything that goes into building a parser
+        keyText = "\n".join([str(DefParserCacheFormatVersion), lark.__version__, str(sys.version_info[:2]), json.dumps(larkOptions, sort_keys=True), grammarText])
+        return hashlib.sha256(keyText.encode("utf-8")).hexdigest()
+
+
+    def calcParserCacheFilePath(self, cacheKey):
+        cacheDir = self.options["cacheDir"]
+        if (cacheDir is None):
+            cacheDir = jrfuncs.calcUserCacheDir("larkcache")
+        return cacheDir + "/parser_" + cacheKey + ".pickle"
+
+
+    def buildParser(self, grammarText, larkOptions):
         larkDebug = self.options["larkDebug"]
         if (larkDebug):
             import logging
             logger.setLevel(logging.DEBUG)
-        self.parser = Lark(self.grammarText, parser = self.options["parser"], start=self.options["start"], ambiguity=self.options["ambiguity"], lexer=self.options["lexer"], strict=self.options["strict"], debug=larkDebug, propagate_positions=self.options["propagate_positions"], regex=self.options["regex"])
+
+        # reuse parser from memory if we've already built this exact one
+        cacheKey = self.calcParserCacheKey(grammarText, larkOptions)
+        if (cacheKey in moduleParserMemo):
+            self.parser = moduleParserMemo[cacheKey]
+            return self.parser
+
+        # otherwise try disk cache, and fall back to building it from scratch
+        parser = None
+        if (self.options["diskCache"]):
+            cacheFilePath = self.calcParserCacheFilePath(cacheKey)
+            parser = self.loadParserFromDiskCache(cacheFilePath, larkOptions)
+        if (parser is None):
+            [parser, grammarData] = self.buildParserFromGrammarText(grammarText, larkOptions)
+            if (self.options["diskCache"]):
+                self.saveParserToDiskCache(cacheFilePath, parser, grammarData)
+
+        moduleParserMemo[cacheKey] = parser
+        self.parser = parser
         return self.parser
 
 
+    def buildParserFromGrammarText(self, grammarText, larkOptions):
+        # returns [parser, grammarData] where grammarData is the pickled compiled grammar (earley only) for the disk cache
+        if (larkOptions["parser"] == "lalr"):
+            return [Lark(grammarText, **larkOptions, **self.calcLarkCallbackOptions(larkOptions)), None]
+        # we compile the grammar ourselves so we can cache it; pickle it BEFORE handing it to lark in case lark modifies it
+        grammar, usedFiles = load_grammar(grammarText, "<string>", [], False)
+        grammarData = pickle.dumps(grammar, protocol=pickle.HIGHEST_PROTOCOL)
+        return [Lark(grammar, **larkOptions), grammarData]
 
 
-    def parseText(self, env, text, startSymbol):
+    def loadParserFromDiskCache(self, cacheFilePath, larkOptions):
+        # return None on any problem; the cache is only an optimization
+        if (not jrfuncs.pathExists(cacheFilePath)):
+            return None
+        try:
+            # loading a cached parser unpickles it, so we won't touch a file anyone else could have written
+            if (not jrfuncs.isPrivateCacheFile(cacheFilePath)):
+                jrprint("Warning: ignoring cached parser '{}', since it (or its directory) is not owned by us or is writable by others.".format(cacheFilePath), severity=jrfuncs.DefLogSeverityWarning)
+                return None
+            with open(cacheFilePath, "rb") as f:
+                if (larkOptions["parser"] == "lalr"):
+                    # lark can serialize a full lalr parser (including parse tables)
+                    # ATTN: Lark.load() doesn't let us pass our lexer callbacks, so we use _load() which does (this is what lark's own cache= option does)
+                    parser = Lark.__new__(Lark)
+                    return parser._load(f, **self.calcLarkCallbackOptions(larkOptions))
+                # earley parsers cannot be saved by lark, so we store the compiled grammar and just rebuild the (cheap) earley frontend from it
+                grammar = pickle.load(f)
+                return Lark(grammar, **larkOptions)
+        except Exception as e:
+            jrprint("Warning: failed to load cached parser from '{}'; rebuilding it ({}).".format(cacheFilePath, repr(e)), severity=jrfuncs.DefLogSeverityWarning)
+            return None
+
+
+    def saveParserToDiskCache(self, cacheFilePath, parser, grammarData):
+        try:
+            jrfuncs.createPrivateDirForFullFilePathIfMissing(cacheFilePath)
+            # write to temp file and rename so a concurrent build never sees a partial file
+            tempFilePath = "{}.{}.tmp".format(cacheFilePath, os.getpid())
+            with open(tempFilePath, "wb") as f:
+                if (grammarData is None):
+                    parser.save(f)
+                else:
+                    f.write(grammarData)
+            os.replace(tempFilePath, cacheFilePath)
+        except Exception as e:
+            jrprint("Warning: failed to save parser cache to '{}' ({}).".format(cacheFilePath, repr(e)), severity=jrfuncs.DefLogSeverityWarning)
+
+
+
+
+    def parseText(self, env, text, startSymbol, flagIncremental=None):
         # build parser using self options
         #
         self.options["start"] = startSymbol
-        parser = self.buildParser()
+        if (flagIncremental is None):
+            flagIncremental = self.options["incremental"]
 
         # parse and get result
         start_time = time.perf_counter()
-        try:
-            parseResult = parser.parse(text)
-        except UnexpectedInput as u:
-            handled = self.handleExceptionUnexpectedInput(parser, text, u)
-            if (not handled):
-                raise u
-        except Exception as e:
-            print("Caught an unknown exception while parsing: ")
-            print(e)
-            raise e
+
+        # incremental parse only re-parses the entries that changed since the last call
+        parseResult = None
+        if (flagIncremental) and (startSymbol == DefIncrementalChunkStartSymbols[0]):
+            parseResult = self.parseTextIncremental(env, text)
+
+        # parallel parse of level 1 entries
+        if (parseResult is None) and (self.options["parallel"]) and (startSymbol == DefIncrementalChunkStartSymbols[0]):
+            parseResult = self.parseTextParallel(env, text)
+
+        # try the fast lalr grammar first, if we have one (it only defines the main start symbol)
+        if (parseResult is None) and (self.grammarTextLalr is not None) and (self.lalrGrammarDefinesRule(startSymbol)):
+            parseResult = self.parseTextLalr(env, text)
+
+        # fall back on (or just use) the main earley grammar
+        if (parseResult is None):
+            parser = self.buildParser(self.grammarText, self.calcLarkOptions())
+            self.parserUsed = self.options["parser"]
+            try:
+                parseResult = parser.parse(text)
+            except UnexpectedInput as u:
+                handled = self.handleExceptionUnexpectedInput(parser, text, u)
+                if (not handled):
+                    raise u
+            except Exception as e:
+                jrprint("Caught an unknown exception while parsing: {}".format(e), severity=jrfuncs.DefLogSeverityError)
+                raise e
 
         # report elapsed time
         end_time = time.perf_counter()
 
         # display pretyy result
-        if (env.getDebugMode()):
+        if (env.isTracing(DefTraceCategoryParse, DefTraceLevelDetail)):
             parseResultPretty = parseResult.pretty()
             jrprint(parseResultPretty)
+        if (env.isTracing(DefTraceCategoryParse)):
             elapsed_time = end_time - start_time
-            jrprint("Total time to parse ({}): {}.".format(startSymbol, jrfuncs.niceElapsedTimeStr(elapsed_time)))
+            jrprint("Total time to parse ({}, using {} parser): {}.".format(startSymbol, self.parserUsed, jrfuncs.niceElapsedTimeStr(elapsed_time)))
 
         # generate diagrams
         if (self.options["diagrams"]):
@@ -134,6 +341,232 @@ class JrParserEngineLark:
 
 
 
+    def parseTextLalr(self, env, text):
+        # try to parse using lalr variant of grammar; return None if it can't handle it (caller falls back to earley)
+        # the lalr grammar is written so that it refuses anything it can't parse exactly the same way as the earley grammar
+        try:
+            parser = self.buildParser(self.grammarTextLalr, self.calcLarkOptionsLalr())
+        except GrammarError as e:
+            # this is a bug in the lalr grammar (conflicts), or a start symbol it doesn't define
+            jrprint("Warning: could not build LALR variant of grammar; falling back to earley ({}).".format(str(e).splitlines()[0]), severity=jrfuncs.DefLogSeverityWarning)
+            return None
+        try:
+            parseResult = parser.parse(text)
+        except UnexpectedInput as u:
+            if (env.isTracing(DefTraceCategoryParse)):
+                jrprint("LALR grammar could not parse source at line {} column {}; falling back to earley parser.".format(u.line, u.column))
+            return None
+        self.parserUsed = "lalr"
+        return parseResult
+
+    def lalrGrammarDefinesRule(self, ruleName):
+        return (re.search(r"^[?!]?" + re.escape(ruleName) + r"\s*:", self.grammarTextLalr, re.MULTILINE) is not None)
+
+    def parseTextWithParser(self, text, startSymbol, parserType):
+        # parse with an explicitly chosen grammar variant ("lalr" or "earley") and no fallback; used by the parity checker
+        self.options["start"] = startSymbol
+        if (parserType == "lalr"):
+            parser = self.buildParser(self.grammarTextLalr, self.calcLarkOptionsLalr())
+        else:
+            parser = self.buildParser(self.grammarText, self.calcLarkOptions())
+        return parser.parse(text)
+
+
+
+    # ambiguity and hot rule profiling (see larkprofile.py)
+    # we parse with the earley grammar but ask lark for the shared packed parse forest instead of a resolved tree, so we can count every ambiguity that "resolve" would silently choose between
+    # and we hook the earley parser to count the items in its chart (and time spent) at every source position
+    # note this is much slower than a normal parse
+
+    def profileText(self, env, text, startSymbol):
+        # returns profile dict (see calcEarleyProfile)
+        self.options["start"] = startSymbol
+        larkOptions = self.calcLarkOptions()
+        larkOptions["parser"] = "earley"
+        larkOptions["ambiguity"] = "forest"
+        parser = self.buildParser(self.grammarText, larkOptions)
+        self.parserUsed = "earley"
+
+        chartRecorder = JrEarleyChartRecorder(parser.parser.parser, text)
+        start_time = time.perf_counter()
+        try:
+            forestRoot = parser.parse(text)
+        finally:
+            chartRecorder.detach()
+        parseSecs = time.perf_counter() - start_time
+
+        return calcEarleyProfile(text, forestRoot, chartRecorder, parseSecs)
+
+
+
+
+    # incremental parsing
+    # we split the source into chunks at entry header lines, and parse each chunk on its own (as a level1_entry, level2_entry, etc.)
+    # parsed chunks are cached by a hash of their text, so on the next call we only re-parse the chunks that changed, and shift the source positions of the ones that moved
+    # the chunk trees are then stitched back together into one start tree, identical to what a full parse would give
+    # entries whose chunk (and children) are completely unchanged and have not moved get back the very same tree node as last time, which lets the AST converter reuse its entry for them
+    # (entries that moved get a new tree node, since their positions changed, and so are re-converted even though they were not re-parsed)
+
+    def parseTextIncremental(self, env, text):
+        # return None if we can't do it this way (caller should fall back to a full parse)
+        try:
+            chunkParsers = self.buildIncrementalChunkParsers()
+        except GrammarError as e:
+            jrprint("Warning: could not build entry parsers for incremental parse; falling back to full parse ({}).".format(str(e).splitlines()[0]), severity=jrfuncs.DefLogSeverityWarning)
+            return None
+
+        # parse (or reuse) each chunk; a chunk that won't parse on its own (e.g. a line starting with # that is not a valid header) gets glued onto the previous chunk
+        chunks = splitTextIntoEntryChunks(text)
+        oldChunkCache = self.incrementalChunkCache
+        newChunkCache = {}
+        records = []
+        stats = {"chunks": len(chunks), "reparsed": 0, "shifted": 0}
+        index = 0
+        while (index < len(chunks)):
+            chunk = chunks[index]
+            record = self.parseIncrementalChunk(chunk, chunkParsers, oldChunkCache, newChunkCache, stats)
+            if (record is None):
+                if (len(records) == 0) or (chunk.get("glued")):
+                    if (env.isTracing(DefTraceCategoryParse)):
+                        jrprint("Incremental parse could not handle entry at line {}; falling back to full parse.".format(chunk["line"]))
+                    return None
+                # glue onto previous chunk and try that one again
+                # (we leave the previous chunk's own record in the cache, so next time we don't have to re-parse it just to find out we need to glue again)
+                records.pop()
+                previousChunk = chunks[index-1]
+                chunks[index-1:index+1] = [{"level": previousChunk["level"], "text": previousChunk["text"] + chunk["text"], "pos": previousChunk["pos"], "line": previousChunk["line"], "glued": True}]
+                index -= 1
+                stats["chunks"] -= 1
+                continue
+            records.append(record)
+            index += 1
+
+        # stitch into one tree
+        parseResult = assembleIncrementalParseTree(records)
+        if (parseResult is None):
+            if (env.isTracing(DefTraceCategoryParse)):
+                jrprint("Incremental parse found entries out of order (e.g. a level 3 entry directly under level 1); falling back to full parse.")
+            return None
+
+        # only now that we've succeeded do we replace the cache (this drops chunks that no longer exist)
+        self.incrementalChunkCache = newChunkCache
+        self.incrementalStats = stats
+        self.parserUsed = "incremental"
+        if (env.isTracing(DefTraceCategoryParse)):
+            jrprint("Incremental parse re-parsed {} and shifted {} of {} entries.".format(stats["reparsed"], stats["shifted"], stats["chunks"]))
+
+        if (self.options["incrementalVerify"]):
+            parseResult = self.verifyIncrementalParse(env, text, parseResult)
+
+        return parseResult
+
+
+    def buildIncrementalChunkParsers(self):
+        # list of parsers to try on each chunk in order (lalr variant first, if we have one); each accepts all of the chunk start symbols
+        chunkParsers = []
+        if (self.grammarTextLalr is not None) and (all([self.lalrGrammarDefinesRule(startSymbol) for startSymbol in DefIncrementalChunkStartSymbols])):
+            larkOptions = self.calcLarkOptionsLalr()
+            larkOptions["start"] = DefIncrementalChunkStartSymbols
+            chunkParsers.append(self.buildParser(self.grammarTextLalr, larkOptions))
+        larkOptions = self.calcLarkOptions()
+        larkOptions["start"] = DefIncrementalChunkStartSymbols
+        chunkParsers.append(self.buildParser(self.grammarText, larkOptions))
+        return chunkParsers
+
+
+    def parseIncrementalChunk(self, chunk, chunkParsers, oldChunkCache, newChunkCache, stats):
+        # return a cache record for this chunk (reused from last time if text is unchanged), or None if chunk won't parse on its own
+        chunkText = chunk["text"]
+        level = chunk["level"]
+        key = hashlib.sha256("{}\n{}".format(level, chunkText).encode("utf-8")).hexdigest()
+        if (key in self.incrementalFailedChunkKeys):
+            return None
+
+        # the same text could occur more than once in a source, so cache holds a list of records for each key, and each record can only be used once per parse
+        record = None
+        if (key in oldChunkCache) and (len(oldChunkCache[key]) > 0):
+            record = oldChunkCache[key].pop(0)
+            lineDelta = chunk["line"] - record["line"]
+            posDelta = chunk["pos"] - record["pos"]
+            record["flagClean"] = (lineDelta == 0) and (posDelta == 0)
+            if (not record["flagClean"]):
+                shiftParseTreePositions(record["tree"], lineDelta, posDelta)
+                stats["shifted"] += 1
+        else:
+            chunkTree = parseEntryChunk(chunkParsers, chunk)
+            if (chunkTree is None):
+                self.incrementalFailedChunkKeys.add(key)
+                return None
+            record = {"key": key, "level": level, "tree": chunkTree, "assembled": None, "childRecords": None, "flagClean": False}
+            stats["reparsed"] += 1
+
+        record["line"] = chunk["line"]
+        record["pos"] = chunk["pos"]
+        if (key not in newChunkCache):
+            newChunkCache[key] = []
+        newChunkCache[key].append(record)
+        return record
+
+
+    def parseTextParallel(self, env, text):
+        # parallel parse: split source into level 1 entries (which are independent of each other), and parse them in a pool of worker processes
+        # each worker builds (or loads from cache) the entry parsers once, and hands back trees with positions already shifted to where the chunk sits in the full source
+        # return None if we can't do it this way (caller should fall back to a full parse)
+        chunks = splitTextIntoEntryChunks(text, 1)
+        if (len(chunks) < 3):
+            # not worth starting up processes for a single entry
+            return None
+
+        # make sure the parsers are in the disk cache before workers start, so they don't all build them at the same time
+        try:
+            chunkParsers = self.buildIncrementalChunkParsers()
+        except GrammarError as e:
+            jrprint("Warning: could not build entry parsers for parallel parse; falling back to full parse ({}).".format(str(e).splitlines()[0]), severity=jrfuncs.DefLogSeverityWarning)
+            return None
+
+        workerCount = self.options["parallelWorkers"]
+        if (workerCount is None):
+            workerCount = os.cpu_count()
+        workerCount = max(1, min(workerCount, len(chunks)))
+        workerOptions = dict(self.options)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workerCount, initializer=initParallelParseWorker, initargs=(self.grammarText, self.grammarTextLalr, workerOptions)) as executor:
+            chunkTrees = list(executor.map(parseEntryChunkInParallelWorker, chunks))
+
+        # a chunk that won't parse on its own (e.g. a line starting with # that is not a valid header) gets glued onto the previous chunk and parsed again here
+        index = 0
+        while (index < len(chunks)):
+            if (chunkTrees[index] is None):
+                if (index == 0) or (chunks[index].get("glued")):
+                    if (env.isTracing(DefTraceCategoryParse)):
+                        jrprint("Parallel parse could not handle entry at line {}; falling back to full parse.".format(chunks[index]["line"]))
+                    return None
+                previousChunk = chunks[index-1]
+                chunks[index-1:index+1] = [{"level": previousChunk["level"], "text": previousChunk["text"] + chunks[index]["text"], "pos": previousChunk["pos"], "line": previousChunk["line"], "glued": True}]
+                chunkTrees[index-1:index+1] = [parseEntryChunk(chunkParsers, chunks[index-1])]
+                index -= 1
+                continue
+            index += 1
+
+        self.parserUsed = "parallel"
+        if (env.isTracing(DefTraceCategoryParse)):
+            jrprint("Parallel parse of {} entries using {} worker processes.".format(len(chunks)-1, workerCount))
+        return assembleStartParseTree(chunkTrees[0], chunkTrees[1:])
+
+
+    def verifyIncrementalParse(self, env, text, parseResult):
+        # debug helper: compare incremental result with a full parse, and return the full parse tree if they differ
+        fullParseResult = self.parseText(env, text, DefIncrementalChunkStartSymbols[0], False)
+        differences = compareParseTrees(fullParseResult, parseResult, True)
+        if (len(differences) > 0):
+            jrprint("Warning: incremental parse differs from full parse (full parse first); using full parse:", severity=jrfuncs.DefLogSeverityWarning)
+            for difference in differences:
+                jrprint("  {}".format(difference))
+            return fullParseResult
+        return parseResult
+
+
+
+
     # helper for making parse tree diagrams
     def makeDiagrams(self, parseResult, outputFilePath):
         tree.pydot__tree_to_png( parseResult, outputFilePath+".png")
@@ -177,6 +610,367 @@ class JrParserEngineLark:
             raise
         raise exc_class(u.get_context(text), u.line, u.column)
 
+# the earley (dynamic) lexer ends a token on the line of its last character (so a newline token ends on the same line it starts on), whereas the standard lexer ends it at the start of the next line if the token ends with a newline
+# rule positions (propagate_positions) are computed from these, so we match earley
+def fixNewlineEndingTokenEndPosition(token):
+    if (not token.endswith("\n")):
+        return token
+    lastLineStart = token.rfind("\n", 0, len(token)-1)
+    if (lastLineStart == -1):
+        token.end_line = token.line
+        token.end_column = token.column + len(token)
+    else:
+        token.end_line = token.line + token.count("\n", 0, len(token)-1)
+        token.end_column = len(token) - lastLineStart
+    return token
+
+
+
+
+# helpers for incremental parsing (see JrParserEngineLark.parseTextIncremental)
+def splitTextIntoEntryChunks(text, maxLevel=3):
+    # returns list of chunks of source text, split at the start of header lines (up to level maxLevel); first chunk is the (possibly empty) preliminary matter with level 0
+    chunks = []
+    chunkLevel = 0
+    chunkPos = 0
+    chunkLine = 1
+    for match in DefIncrementalSplitRegex.finditer(text):
+        if (match.group(1) is None) or (len(match.group(1)) > maxLevel):
+            # something we skip over
+            continue
+        pos = match.start()
+        chunks.append({"level": chunkLevel, "text": text[chunkPos:pos], "pos": chunkPos, "line": chunkLine})
+        chunkLine += text.count("\n", chunkPos, pos)
+        chunkLevel = len(match.group(1))
+        chunkPos = pos
+    chunks.append({"level": chunkLevel, "text": text[chunkPos:], "pos": chunkPos, "line": chunkLine})
+    return chunks
+
+
+def parseEntryChunk(chunkParsers, chunk):
+    # parse one chunk, trying each parser in turn, and shift positions to where the chunk sits in the full source; returns None if it won't parse on its own
+    for parser in chunkParsers:
+        try:
+            chunkTree = parser.parse(chunk["text"], start=DefIncrementalChunkStartSymbols[chunk["level"]])
+        except UnexpectedInput as u:
+            continue
+        shiftParseTreePositions(chunkTree, chunk["line"] - 1, chunk["pos"])
+        return chunkTree
+    return None
+
+
+def shiftParseTreePositions(parseTree, lineDelta, posDelta):
+    # shift all positions in a tree (in place) by a number of lines and characters; columns are unchanged since chunks always start at the start of a line
+    if (lineDelta == 0) and (posDelta == 0):
+        return
+    for node in parseTree.iter_subtrees():
+        meta = node.meta
+        if (not meta.empty):
+            meta.line += lineDelta
+            meta.end_line += lineDelta
+            meta.start_pos += posDelta
+            meta.end_pos += posDelta
+            if (hasattr(meta, "container_line")):
+                meta.container_line += lineDelta
+                meta.container_start_pos += posDelta
+            if (hasattr(meta, "container_end_line")):
+                meta.container_end_line += lineDelta
+                meta.container_end_pos += posDelta
+        for child in node.children:
+            if isinstance(child, lark.Token) and (child.line is not None):
+                child.line += lineDelta
+                child.end_line += lineDelta
+                child.start_pos += posDelta
+                child.end_pos += posDelta
+
+
+def assembleIncrementalParseTree(records):
+    # stitch chunk trees back into a hierarchical start tree; returns None if the entry levels don't nest properly
+    # first record is always the preliminary matter, parsed as a start tree of its own
+    topNodes = []
+    stack = []
+    for record in records[1:]:
+        level = record["level"]
+        node = [record, []]
+        if (level - 1 > len(stack)):
+            return None
+        if (level > 1):
+            stack[level-2][1].append(node)
+        stack = stack[0:level-1] + [node]
+        if (level == 1):
+            topNodes.append(node)
+
+    return assembleStartParseTree(records[0]["tree"], [assembleIncrementalEntryTree(node) for node in topNodes])
+
+
+def assembleStartParseTree(preliminaryTree, entryTrees):
+    # the preliminary chunk was parsed as a start tree, so we just add the level 1 entries to (a copy of) it
+    children = preliminaryTree.children + entryTrees
+    return tree.Tree(preliminaryTree.data, children, calcSpanningParseMeta(children))
+
+
+def assembleIncrementalEntryTree(node):
+    # returns the tree node for an entry plus its child entries; if nothing about it has changed we return the same tree node as last time
+    [record, childNodes] = node
+    childTrees = [assembleIncrementalEntryTree(childNode) for childNode in childNodes]
+    childRecords = [childNode[0] for childNode in childNodes]
+    flagClean = record["flagClean"] and (record["assembled"] is not None) and (record["childRecords"] is not None) and (len(childRecords) == len(record["childRecords"]))
+    flagClean = flagClean and all([(childRecord is oldChildRecord) and (childRecord["flagClean"]) for childRecord, oldChildRecord in zip(childRecords, record["childRecords"])])
+    if (not flagClean):
+        chunkTree = record["tree"]
+        children = chunkTree.children + childTrees
+        record["assembled"] = tree.Tree(chunkTree.data, children, calcSpanningParseMeta(children))
+        record["childRecords"] = childRecords
+    # let our parent know whether we are unchanged
+    record["flagClean"] = flagClean
+    return record["assembled"]
+
+
+# each worker process in a parallel parse builds the entry parsers once (they come from the disk cache) and reuses them for every chunk it is handed
+parallelWorkerChunkParsers = None
+
+def initParallelParseWorker(grammarText, grammarTextLalr, options):
+    global parallelWorkerChunkParsers
+    engine = JrParserEngineLark()
+    engine.grammarText = grammarText
+    engine.grammarTextLalr = grammarTextLalr
+    engine.options = options
+    parallelWorkerChunkParsers = engine.buildIncrementalChunkParsers()
+
+def parseEntryChunkInParallelWorker(chunk):
+    return parseEntryChunk(parallelWorkerChunkParsers, chunk)
+
+# lark tokens only pickle their start position, so we register our own reducer for sending trees back from worker processes (this only affects multiprocessing pickles)
+def reduceTokenWithEndPosition(token):
+    return (token.__class__, (token.type, str(token), token.start_pos, token.line, token.column, token.end_line, token.end_column, token.end_pos))
+
+multiprocessing.reduction.ForkingPickler.register(lark.Token, reduceTokenWithEndPosition)
+
+
+def calcSpanningParseMeta(children):
+    # build position meta for a tree node from its children, the same way lark's propagate_positions does
+    meta = tree.Meta()
+    positionedChildren = [child for child in children if (isinstance(child, tree.Tree) and (not child.meta.empty)) or (isinstance(child, lark.Token) and (child.line is not None))]
+    if (len(positionedChildren) == 0):
+        return meta
+    first = positionedChildren[0].meta if isinstance(positionedChildren[0], tree.Tree) else positionedChildren[0]
+    last = positionedChildren[-1].meta if isinstance(positionedChildren[-1], tree.Tree) else positionedChildren[-1]
+    meta.empty = False
+    meta.line = meta.container_line = getattr(first, "container_line", first.line)
+    meta.column = meta.container_column = getattr(first, "container_column", first.column)
+    meta.start_pos = meta.container_start_pos = getattr(first, "container_start_pos", first.start_pos)
+    meta.end_line = meta.container_end_line = getattr(last, "container_end_line", last.end_line)
+    meta.end_column = meta.container_end_column = getattr(last, "container_end_column", last.end_column)
+    meta.end_pos = meta.container_end_pos = getattr(last, "container_end_pos", last.end_pos)
+    return meta
+
+
+
+
+# helpers for profiling (see JrParserEngineLark.profileText)
+class JrEarleyChartRecorder:
+    # lark's earley parser calls predict_and_complete once per source character position, with the chart (list of item sets) built so far
+    # we wrap it (on this parser instance only, until detach) to count the items at each position by rule and line, and to time each position
+    # time at a position is then split among the rules in proportion to their items there, which is only an estimate
+    def __init__(self, earleyParser, text):
+        self.earleyParser = earleyParser
+        self.lineStartPositions = calcLineStartPositions(text)
+        #
+        self.ruleItems = {}
+        self.ruleSecs = {}
+        self.ruleLineItems = {}
+        self.lineItems = {}
+        self.lineSecs = {}
+        self.totalItems = 0
+        #
+        self.lastLine = None
+        self.lastRuleCounts = None
+        self.lastTime = None
+        self.lastOverheadSecs = 0
+        #
+        originalPredictAndComplete = earleyParser.predict_and_complete
+        def recordingPredictAndComplete(i, to_scan, columns, transitives, node_cache):
+            startTime = time.perf_counter()
+            self.finishPosition(startTime)
+            retv = originalPredictAndComplete(i, to_scan, columns, transitives, node_cache)
+            countStartTime = time.perf_counter()
+            self.countPosition(i, columns[i], to_scan)
+            self.lastTime = startTime
+            self.lastOverheadSecs = time.perf_counter() - countStartTime
+            return retv
+        earleyParser.predict_and_complete = recordingPredictAndComplete
+
+    def detach(self):
+        self.finishPosition(time.perf_counter())
+        del self.earleyParser.predict_and_complete
+
+    def countPosition(self, pos, column, scanItems):
+        line = bisect.bisect_right(self.lineStartPositions, pos)
+        ruleCounts = {}
+        for items in [column, scanItems]:
+            for item in items:
+                ruleName = item.rule.origin.name
+                ruleCounts[ruleName] = ruleCounts.get(ruleName, 0) + 1
+        itemCount = 0
+        for ruleName, count in ruleCounts.items():
+            self.ruleItems[ruleName] = self.ruleItems.get(ruleName, 0) + count
+            ruleLineItems = self.ruleLineItems.setdefault(ruleName, {})
+            ruleLineItems[line] = ruleLineItems.get(line, 0) + count
+            itemCount += count
+        self.lineItems[line] = self.lineItems.get(line, 0) + itemCount
+        self.totalItems += itemCount
+        self.lastLine = line
+        self.lastRuleCounts = ruleCounts
+
+    def finishPosition(self, now):
+        # charge the time since the last position started (less our own counting) to it
+        if (self.lastTime is None):
+            return
+        secs = max(now - self.lastTime - self.lastOverheadSecs, 0)
+        self.lineSecs[self.lastLine] = self.lineSecs.get(self.lastLine, 0) + secs
+        itemCount = sum(self.lastRuleCounts.values())
+        for ruleName, count in self.lastRuleCounts.items():
+            self.ruleSecs[ruleName] = self.ruleSecs.get(ruleName, 0) + secs * count / itemCount
+        self.lastTime = None
+
+
+def calcLineStartPositions(text):
+    return [0] + [match.end() for match in re.finditer("\n", text)]
+
+
+def calcEarleyProfile(text, forestRoot, chartRecorder, parseSecs, topLineCount=5):
+    # walk the parse forest counting symbol nodes, and ambiguous ones (those with more than one derivation), by rule and line
+    # returns a json-friendly dict with overall totals, "rules" (ranked by chart items) and source "lines" (ranked by time)
+    lineStartPositions = chartRecorder.lineStartPositions
+    ruleNodes = {}
+    ruleAmbiguous = {}
+    ruleExtraDerivations = {}
+    ruleLineAmbiguous = {}
+    lineAmbiguous = {}
+    seenIds = set()
+    stack = [forestRoot]
+    while (len(stack) > 0):
+        node = stack.pop()
+        if (id(node) in seenIds):
+            continue
+        seenIds.add(id(node))
+        if isinstance(node, SymbolNode):
+            # intermediate nodes (partly matched rules) are keyed by (rule, ptr)
+            ruleName = node.s[0].origin.name if (node.is_intermediate) else node.s.name
+            derivations = node.children
+            ruleNodes[ruleName] = ruleNodes.get(ruleName, 0) + 1
+            if (len(derivations) > 1):
+                line = bisect.bisect_right(lineStartPositions, node.start)
+                ruleAmbiguous[ruleName] = ruleAmbiguous.get(ruleName, 0) + 1
+                ruleExtraDerivations[ruleName] = ruleExtraDerivations.get(ruleName, 0) + len(derivations) - 1
+                ruleLineAmbiguous.setdefault(ruleName, {})
+                ruleLineAmbiguous[ruleName][line] = ruleLineAmbiguous[ruleName].get(line, 0) + 1
+                lineAmbiguous[line] = lineAmbiguous.get(line, 0) + 1
+            stack += derivations
+        elif isinstance(node, PackedNode):
+            for child in [node.left, node.right]:
+                if (child is not None):
+                    stack.append(child)
+
+    def calcTopLines(lineCounts):
+        return [line for line, count in sorted(lineCounts.items(), key=lambda lineCount: -lineCount[1])[0:topLineCount]]
+
+    sourceLines = text.split("\n")
+    rules = []
+    for ruleName in set(ruleNodes) | set(chartRecorder.ruleItems):
+        rules.append({
+            "rule": str(ruleName),
+            "chartItems": chartRecorder.ruleItems.get(ruleName, 0),
+            "estSecs": round(chartRecorder.ruleSecs.get(ruleName, 0), 6),
+            "forestNodes": ruleNodes.get(ruleName, 0),
+            "ambiguousNodes": ruleAmbiguous.get(ruleName, 0),
+            "extraDerivations": ruleExtraDerivations.get(ruleName, 0),
+            "topChartLines": calcTopLines(chartRecorder.ruleLineItems.get(ruleName, {})),
+            "topAmbiguousLines": calcTopLines(ruleLineAmbiguous.get(ruleName, {})),
+        })
+    rules.sort(key=lambda rule: (-rule["chartItems"], -rule["ambiguousNodes"], rule["rule"]))
+
+    lines = []
+    for line in set(chartRecorder.lineItems) | set(lineAmbiguous):
+        lines.append({
+            "line": line,
+            "secs": round(chartRecorder.lineSecs.get(line, 0), 6),
+            "chartItems": chartRecorder.lineItems.get(line, 0),
+            "ambiguousNodes": lineAmbiguous.get(line, 0),
+            "text": sourceLines[line-1] if (line-1 < len(sourceLines)) else "",
+        })
+    lines.sort(key=lambda line: (-line["secs"], line["line"]))
+
+    return {
+        "parseSecs": round(parseSecs, 6),
+        "characters": len(text),
+        "lineCount": len(sourceLines),
+        "chartItems": chartRecorder.totalItems,
+        "forestNodes": sum(ruleNodes.values()),
+        "ambiguousNodes": sum(ruleAmbiguous.values()),
+        "rules": rules,
+        "lines": lines,
+    }
+
+
+
+
+# helpers for comparing parse trees from different grammars/parsers (see larkparity.py)
+# returns a list of strings describing (up to maxDifferences) differences; empty list means trees are identical
+def compareParseTrees(treeA, treeB, flagCompareMeta, maxDifferences=10):
+    differences = []
+    compareParseTreeNodes(treeA, treeB, "", flagCompareMeta, differences, maxDifferences)
+    return differences
+
+def compareParseTreeNodes(nodeA, nodeB, path, flagCompareMeta, differences, maxDifferences):
+    if (len(differences) >= maxDifferences):
+        return
+    #
+    if isinstance(nodeA, tree.Tree) and isinstance(nodeB, tree.Tree):
+        path = path + "/" + str(nodeA.data)
+        if (nodeA.data != nodeB.data):
+            differences.append("{}: rule '{}' vs '{}' at {}".format(path, nodeA.data, nodeB.data, calcParseNodePositionString(nodeA)))
+            return
+        if (flagCompareMeta):
+            positionA = calcParseNodePositionString(nodeA)
+            positionB = calcParseNodePositionString(nodeB)
+            if (positionA != positionB):
+                differences.append("{}: position {} vs {}".format(path, positionA, positionB))
+        if (len(nodeA.children) != len(nodeB.children)):
+            differences.append("{}: {} children vs {} at {}".format(path, len(nodeA.children), len(nodeB.children), calcParseNodePositionString(nodeA)))
+            return
+        for index, childA in enumerate(nodeA.children):
+            compareParseTreeNodes(childA, nodeB.children[index], path + "[{}]".format(index), flagCompareMeta, differences, maxDifferences)
+    elif isinstance(nodeA, lark.Token) and isinstance(nodeB, lark.Token):
+        # anonymous terminals are numbered in the order lark sees them, so they will differ between grammars
+        typeA = calcNormalizedTokenType(nodeA)
+        typeB = calcNormalizedTokenType(nodeB)
+        if (typeA != typeB) or (str(nodeA) != str(nodeB)):
+            differences.append("{}: token {} {} vs {} {} at {}".format(path, typeA, repr(str(nodeA)), typeB, repr(str(nodeB)), calcParseNodePositionString(nodeA)))
+        elif (flagCompareMeta) and (nodeA.start_pos != nodeB.start_pos):
+            differences.append("{}: token {} position {} vs {}".format(path, repr(str(nodeA)), nodeA.start_pos, nodeB.start_pos))
+    elif (nodeA is None) and (nodeB is None):
+        pass
+    else:
+        differences.append("{}: {} vs {}".format(path, repr(nodeA)[0:60], repr(nodeB)[0:60]))
+
+def calcNormalizedTokenType(token):
+    if (token.type.startswith("__ANON")):
+        return "__ANON"
+    return token.type
+
+def calcParseNodePositionString(node):
+    if isinstance(node, tree.Tree):
+        if (node.meta.empty):
+            return "(no position)"
+        return "L{}:{}-L{}:{}".format(node.meta.line, node.meta.column, node.meta.end_line, node.meta.end_column)
+    if isinstance(node, lark.Token):
+        return "L{}:{}".format(node.line, node.column)
+    return "(no position)"
+
+
+
+
 # helpers for error reporting
 class JrParserSyntaxError(SyntaxError):
     def __str__(self):
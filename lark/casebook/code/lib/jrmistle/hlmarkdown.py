@@ -10,6 +10,9 @@ from .jrhtmlrenderer import JrHtmlRenderer
 import pylatex
 from pylatex.utils import NoEscape
 
+# my libs
+from lib.jr.jrprofiler import DefProfileCategoryRender
+
 # other python libs
 import json
 import re
@@ -19,11 +22,22 @@ class HlMarkdown:
     def __init__(self, hlParserRef):
         self.parserRef = hlParserRef
         self.options = None
+        self.profiler = None
     
     def setOptions(self, options):
         self.options = options
 
+    def setProfiler(self, profiler):
+        # optional JrProfiler; if set, each markdown render is timed as a span
+        self.profiler = profiler
+
     def renderMarkdown(self, text, renderFormat, flagSnippetVsWholeDocument):
+        if (self.profiler is None):
+            return self.renderMarkdownUntimed(text, renderFormat, flagSnippetVsWholeDocument)
+        with self.profiler.span("markdown " + renderFormat, DefProfileCategoryRender):
+            return self.renderMarkdownUntimed(text, renderFormat, flagSnippetVsWholeDocument)
+
+    def renderMarkdownUntimed(self, text, renderFormat, flagSnippetVsWholeDocument):
         extras = {}
 
         if (self.options['forceLinebreaks']):
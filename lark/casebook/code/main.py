@@ -54,17 +54,15 @@ def main():
 
 
     # PART 1: Parse source file using grammar
+    # PART 2: Convert parse tree to our interpretter AST class
+    # (both are skipped if we have a snapshot of the ast from a previous run on the same source)
     try:
-        # PART 1: Ask interpretter to parse
-        jrinterp.loadGrammarParseSourceFile(env, grammarFilePath, sourceFilePath, startSymbol, encoding)
+        jrinterp.loadGrammarParseConvertSourceFile(env, grammarFilePath, sourceFilePath, startSymbol, encoding)
     except Exception as e:
         msg = jrfuncs.exceptionPlusSimpleTraceback(e, "Parsing source")
-        jrprint(msg)
+        jrprint(msg, severity=jrfuncs.DefLogSeverityError)
         return
 
-    # PART 2: Convert parse tree to our interpretter AST class
-    jrinterp.convertParseTreeToAst(env)
-
     # PART 3: Load any core variables and functions into our environment
     jrinterp.setupCasebookStuff(env)
 
@@ -80,4 +78,6 @@ def main():
 
 if __name__ == '__main__':
     main()
+    # end run report of everything logged as an error or warning (see jrprint severity)
+    jrprint("Finished with {} errors and {} warnings.".format(jrfuncs.getJrPrintErrorCount(), jrfuncs.getJrPrintWarningCount()))
 
@@ -0,0 +1,62 @@
+import os
+import sys
+
+codeDir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "code")
+sys.path.insert(0, os.path.realpath(codeDir))
+
+from lib.casebook.jrinterpCasebook import JrInterpreterCasebook
+from lib.casebook.jrastutilclasses import JrAstContext, JrAstEnvironment
+from lib.jr import jrfuncs
+
+
+grammarFilePath = os.path.realpath(codeDir) + "/grammar/casebook_grammar.lark"
+
+
+def buildAst(sourceFilePath, snapshotDir):
+    # parse and convert (or load a snapshot), returning the interpreter and the number of errors reported
+    env = JrAstEnvironment(JrAstContext(False, True), None)
+    jrinterp = JrInterpreterCasebook()
+    jrinterp.options["snapshotDir"] = snapshotDir
+    errorCountBefore = jrfuncs.getJrPrintErrorCount()
+    jrinterp.loadGrammarParseConvertSourceFile(env, grammarFilePath, sourceFilePath, "start", "utf-8")
+    return [jrinterp, jrfuncs.getJrPrintErrorCount() - errorCountBefore]
+
+
+def writeSource(tmp_path, text):
+    sourceFilePath = str(tmp_path / "book.casebook")
+    with open(sourceFilePath, "w", encoding="utf-8") as f:
+        f.write(text)
+    return sourceFilePath
+
+
+def test_clean_book_reuses_snapshot(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sourceFilePath = writeSource(tmp_path, "# LEADS\n## 1-1\nHello.\n\n")
+    snapshotDir = str(tmp_path / "snapshots")
+    [jrinterp, errorCount] = buildAst(sourceFilePath, snapshotDir)
+    assert (not jrinterp.astSnapshotUsed) and (errorCount == 0)
+    [jrinterp, errorCount] = buildAst(sourceFilePath, snapshotDir)
+    assert jrinterp.astSnapshotUsed and (errorCount == 0)
+
+
+def test_conversion_errors_are_reported_on_every_run(tmp_path, monkeypatch):
+    # a snapshot must not hide errors reported while converting the original parse
+    monkeypatch.chdir(tmp_path)
+    sourceFilePath = writeSource(tmp_path, '# LEADS\n## 1-1\n$format(font="a", font="b")\nHello.\n\n')
+    snapshotDir = str(tmp_path / "snapshots")
+    for run in range(2):
+        [jrinterp, errorCount] = buildAst(sourceFilePath, snapshotDir)
+        assert (not jrinterp.astSnapshotUsed) and (errorCount == 1)
+
+
+def test_snapshot_writable_by_others_is_ignored(tmp_path, monkeypatch):
+    if (os.name != "posix"):
+        return
+    monkeypatch.chdir(tmp_path)
+    sourceFilePath = writeSource(tmp_path, "# LEADS\n## 1-1\nHello.\n\n")
+    snapshotDir = str(tmp_path / "snapshots")
+    [jrinterp, errorCount] = buildAst(sourceFilePath, snapshotDir)
+    for fileName in os.listdir(snapshotDir):
+        os.chmod(os.path.join(snapshotDir, fileName), 0o666)
+    [jrinterp, errorCount] = buildAst(sourceFilePath, snapshotDir)
+    assert not jrinterp.astSnapshotUsed
@@ -0,0 +1,91 @@
+import os
+import sys
+
+import pytest
+
+codeDir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "code")
+sys.path.insert(0, os.path.realpath(codeDir))
+
+from lib.casebook.jrastutilclasses import JrAstContext, JrAstEnvironment
+from lib.casebook.jrastvals import AstValIdentifier, AstValNumber, AstValString, AstValFunction
+from lib.casebook.jriexception import JriException
+
+
+# identifiers cache the (depth, slot) address their variable was found at (see JrAstEnvironment.lookupJrEnvVarForIdentifier)
+# these check that a later declaration that shadows the variable is seen through the cache
+
+
+@pytest.fixture
+def globalEnv(tmp_path, monkeypatch):
+    # (run in a temp dir so our log files don't end up in the tree)
+    monkeypatch.chdir(tmp_path)
+    return JrAstEnvironment(JrAstContext(False, True), None)
+
+
+def resolve(env, identifierVal):
+    return env.getEnvValueForIdentifier(None, identifierVal, None).getWrapped()
+
+
+def test_declaration_in_intermediate_scope_shadows_cached_address(globalEnv):
+    globalEnv.declareEnvVar(None, "x", "", AstValString(None, None, "global"), False)
+    midEnv = globalEnv.makeChildEnv()
+    innerEnv = midEnv.makeChildEnv()
+    identifierVal = AstValIdentifier(None, None, "x")
+    assert resolve(innerEnv, identifierVal) == "global"
+    assert identifierVal.envAddressCache[2][0] == 2
+    # served from the cache while nothing changes
+    assert resolve(innerEnv, identifierVal) == "global"
+
+    midEnv.declareEnvVar(None, "x", "", AstValString(None, None, "mid"), False)
+    assert resolve(innerEnv, identifierVal) == "mid"
+    assert identifierVal.envAddressCache[2][0] == 1
+    innerEnv.declareEnvVar(None, "x", "", AstValString(None, None, "inner"), False)
+    assert resolve(innerEnv, identifierVal) == "inner"
+    assert resolve(midEnv, identifierVal) == "mid"
+    assert resolve(globalEnv, identifierVal) == "global"
+
+
+def test_loop_variable_shadows_cached_address(globalEnv):
+    # a loop declares its variable in a scope of its own each time round, which the loop body's scope is under
+    globalEnv.declareEnvVar(None, "i", "", AstValString(None, None, "outer"), False)
+    identifierVal = AstValIdentifier(None, None, "i")
+    assert resolve(globalEnv, identifierVal) == "outer"
+    for index in range(3):
+        loopEnv = globalEnv.makeChildEnv()
+        bodyEnv = loopEnv.makeChildEnv()
+        assert resolve(bodyEnv, identifierVal) == "outer"
+        loopEnv.declareEnvVar(None, "i", "", AstValNumber(None, None, index), False)
+        assert resolve(bodyEnv, identifierVal) == index
+        assert resolve(loopEnv, identifierVal) == index
+    assert resolve(globalEnv, identifierVal) == "outer"
+
+
+def test_function_redeclaration_shadows_cached_address_and_bindings(globalEnv):
+    context = globalEnv.getContext()
+    outerFunction = object()
+    innerFunction = object()
+    globalEnv.declareEnvVar(None, "f", "", AstValFunction(None, None, outerFunction), False)
+    midEnv = globalEnv.makeChildEnv()
+    innerEnv = midEnv.makeChildEnv()
+    identifierVal = AstValIdentifier(None, None, "f")
+    assert resolve(innerEnv, identifierVal) is outerFunction
+
+    # redeclaring it in the same scope is an error, and changes nothing
+    bindingGeneration = context.getFunctionBindingGeneration()
+    with pytest.raises(JriException):
+        globalEnv.declareEnvVar(None, "f", "", AstValFunction(None, None, innerFunction), False)
+    assert context.getFunctionBindingGeneration() == bindingGeneration
+    assert resolve(innerEnv, identifierVal) is outerFunction
+
+    addressGeneration = context.getEnvAddressGeneration()
+    midEnv.declareEnvVar(None, "f", "", AstValFunction(None, None, innerFunction), False)
+    assert context.getEnvAddressGeneration() > addressGeneration
+    assert context.getFunctionBindingGeneration() > bindingGeneration
+    assert resolve(innerEnv, identifierVal) is innerFunction
+
+    # shadowing a function with something that isn't one changes what call sites with its name should call too
+    bindingGeneration = context.getFunctionBindingGeneration()
+    innerEnv.declareEnvVar(None, "f", "", AstValNumber(None, None, 3), False)
+    assert context.getFunctionBindingGeneration() > bindingGeneration
+    assert resolve(innerEnv, identifierVal) == 3
+    assert resolve(globalEnv, identifierVal) is outerFunction
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+
+import pytest
+
+codeDir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "code")
+sys.path.insert(0, os.path.realpath(codeDir))
+
+import benchmark
+from lib.hlapi.hlapi import HlApi, HlLeadTable, makeLeadSegment
+from lib.hlapi.hlapisqlite import HlApiSqlite
+
+
+leadProperties = [
+    {"lead": "1-10", "dName": "Acme Supply", "address": "12 Broadway"},
+    {"lead": "2-20", "dName": "Royal Hotel", "address": "450 Park Ave"},
+    # same lead id, name and address as earlier rows; lookups should find the earlier ones
+    {"lead": "1-10", "dName": "Acme Supply", "address": "450 Park Ave"},
+    {"lead": "3-30", "dName": "Grand  Theater", "address": "12 Broadway"},
+]
+
+
+def writeDataDir(tmp_path, propertiesList):
+    dataDir = str(tmp_path / "data")
+    os.makedirs(dataDir + "/leads")
+    features = [{"type": "Feature", "properties": properties, "geometry": {"type": "Point", "coordinates": [1.0, 2.0]}} for properties in propertiesList]
+    with open(dataDir + "/leads/places.json", "w", encoding="utf-8") as leadFile:
+        json.dump({"type": "FeatureCollection", "features": features}, leadFile)
+    return dataDir
+
+
+def makeHlApi(tmp_path, propertiesList=leadProperties):
+    dataDir = writeDataDir(tmp_path, propertiesList)
+    return HlApi(dataDir, {"leadCacheFilePath": str(tmp_path / "leadCache.pickle")})
+
+
+def test_lookup_by_lead_id_finds_first_row(tmp_path):
+    hlapi = makeHlApi(tmp_path)
+    [row, sourceKey] = hlapi.findLeadRowByLeadId("1-10")
+    assert (sourceKey == "places") and (row["properties"]["address"] == "12 Broadway")
+    assert hlapi.findLeadRowByLeadId("#1-10") == [row, sourceKey]
+    assert hlapi.findLeadRowByLeadId("9-99") == [None, None]
+
+
+def test_lookup_by_name_or_address_finds_first_row(tmp_path):
+    hlapi = makeHlApi(tmp_path)
+    # row 1 has this as its address before row 2 has it too
+    assert hlapi.findLeadRowByNameOrAddress("450 Park Ave")[0]["properties"]["lead"] == "2-20"
+    # an address of row 0 is the address of row 3 too
+    assert hlapi.findLeadRowByNameOrAddress("  12 Broadway ")[0]["properties"]["dName"] == "Acme Supply"
+    assert hlapi.findLeadRowByNameOrAddress("Royal Hotel")[0]["properties"]["lead"] == "2-20"
+    assert hlapi.findLeadRowByNameOrAddress("") == [None, None]
+
+
+def test_lookup_falls_back_to_normalized_keys(tmp_path):
+    hlapi = makeHlApi(tmp_path)
+    assert hlapi.findLeadRowByNameOrAddress("grand theater")[0]["properties"]["lead"] == "3-30"
+    assert hlapi.findLeadRowByNameOrAddress("ROYAL   hotel")[0]["properties"]["lead"] == "2-20"
+    assert hlapi.findLeadRowByLeadId("#2-20")[0]["properties"]["dName"] == "Royal Hotel"
+    # an exact match wins over an earlier row that only matches normalized
+    hlapi = makeHlApi(tmp_path / "exact", [{"lead": "a-1", "dName": "Star Deli", "address": "1 Canal St"}, {"lead": "A-1", "dName": "STAR DELI", "address": "2 Canal St"}])
+    assert hlapi.findLeadRowByLeadId("A-1")[0]["properties"]["address"] == "2 Canal St"
+    assert hlapi.findLeadRowByNameOrAddress("STAR DELI")[0]["properties"]["address"] == "2 Canal St"
+    assert hlapi.findLeadRowByNameOrAddress("star  deli")[0]["properties"]["address"] == "1 Canal St"
+
+
+def test_similar_search_agrees_with_scan():
+    # single words share all their trigrams with many more rows than fit on the shortlist
+    generator = benchmark.LeadGenerator(benchmark.hlApiGeneratorSeed)
+    rows = generator.generateRows(5000)
+    queries = generator.generateQueries(rows, 50) + benchmark.LeadGenerator.nameWords + benchmark.LeadGenerator.lastNames + ["Broadway", "Canal St", "Amsterdam Ave"]
+    hlapi = HlApi(None)
+    hlapi.leadTable = HlLeadTable({"synthetic": makeLeadSegment(rows)})
+    hlapi.resetLeadIndexes()
+    for query in queries:
+        assert hlapi.findLeadRowSimilarByNameOrAddress(query) == hlapi.findLeadRowSimilarByNameOrAddressScan(query), query
+
+
+def test_rows_without_names_and_no_unused_leads(tmp_path):
+    # a row can lack a name or an address, and a data directory its unusedLeads.csv
+    dataDir = writeDataDir(tmp_path, leadProperties + [{"lead": "4-40", "dName": None, "address": "7 Bowery"}, {"lead": "5-50", "dName": "Star Deli"}])
+    options = {"leadCacheFilePath": str(tmp_path / "leadCache.pickle"), "leadDatabaseFilePath": str(tmp_path / "leads.sqlite")}
+    hlapi = HlApi(dataDir, options)
+    hlapiSqlite = HlApiSqlite(dataDir, options)
+    for query in ["7 Bowery", "Bowry", "Star Deli", "Stra Deli", "Acme Suply"]:
+        result = hlapi.findLeadRowSimilarByNameOrAddressScan(query)
+        assert (result[0] is not None) and (hlapi.findLeadRowSimilarByNameOrAddress(query) == result) and (hlapiSqlite.findLeadRowSimilarByNameOrAddress(query) == result)
+    assert hlapiSqlite.findLeadRowByNameOrAddress("7 bowery")[0]["properties"]["lead"] == "4-40"
+    assert hlapiSqlite.findLeadRowByLeadId("#5-50") == hlapi.findLeadRowByLeadId("5-50")
+    with pytest.raises(IndexError):
+        hlapiSqlite.popAvailableLead()
+    queries = ["Bowry", "Star Deli", "", "Bowry", "Acme Suply"]
+    assert hlapiSqlite.findLeadRowsSimilarByNameOrAddress(queries) == hlapi.findLeadRowsSimilarByNameOrAddress(queries)
+
+
+def test_batch_lookups_look_up_each_distinct_query_once(tmp_path, monkeypatch):
+    hlapi = makeHlApi(tmp_path)
+    lookedUpLeadIds = []
+    findLeadRowByLeadId = hlapi.findLeadRowByLeadId
+    monkeypatch.setattr(hlapi, "findLeadRowByLeadId", lambda leadId: lookedUpLeadIds.append(leadId) or findLeadRowByLeadId(leadId))
+    leadIds = ["3-30", "#1-10", "1-10", "9-99", "#3-30"]
+    results = hlapi.findLeadRowsByLeadIds(leadIds)
+    assert lookedUpLeadIds == ["3-30", "1-10", "9-99"]
+    assert results == [findLeadRowByLeadId(leadId) for leadId in leadIds]
+    # a repeated query gets its own copy of the result
+    assert (results[1] is not results[2]) and (results[1][0] is not results[2][0])
+    results[1][0]["properties"]["dName"] = "Changed"
+    assert results[2][0]["properties"]["dName"] == "Acme Supply"
+
+    txts = [" Royal Hotel", "12 Broadway", "Royal Hotel  ", "", "Nothing Like It"]
+    assert hlapi.findLeadRowsByNameOrAddress(txts) == [hlapi.findLeadRowByNameOrAddress(txt) for txt in txts]
+
+    shortlistedTxts = []
+    calcSimilarShortlists = hlapi.calcSimilarShortlists
+    monkeypatch.setattr(hlapi, "calcSimilarShortlists", lambda txts, shortlistSize: shortlistedTxts.append(txts) or calcSimilarShortlists(txts, shortlistSize))
+    txts = ["Royl Hotel", " Acme Suply ", "Royl Hotel ", "", "Grand Theatre"]
+    results = hlapi.findLeadRowsSimilarByNameOrAddress(txts)
+    assert shortlistedTxts == [["Royl Hotel", "Acme Suply", "Grand Theatre"]]
+    assert [result[0]["properties"]["lead"] for result in [results[0], results[1], results[2], results[4]]] == ["2-20", "1-10", "2-20", "3-30"]
+    assert results[3] == [None, None]
+    assert results == [hlapi.findLeadRowSimilarByNameOrAddress(txt) for txt in txts]
+    assert (results[0] is not results[2]) and (results[0][0] is not results[2][0])
@@ -0,0 +1,65 @@
+import os
+import sys
+import pickle
+
+import pytest
+
+codeDir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "code")
+sys.path.insert(0, os.path.realpath(codeDir))
+
+from lib.casebook.jrinterpCasebook import JrInterpreterCasebook
+from lib.casebook.jrastutilclasses import JrAstContext, JrAstEnvironment
+from lib.jrlark import jrlark
+
+
+grammarFilePath = os.path.realpath(codeDir) + "/grammar/casebook_grammar.lark"
+
+sourceText = '# LEADS\n\n## 1-1 “First”\nHello $b(there).\n\n## 1-2\n<<<raw $ text>>>\nMore.\n\n### sub\nDeep.\n\n## 1-3\n$if (x > 2): { yes } $else: { no }\n\n# HINTS\n\n## h1\nHint.\n'
+
+# [old, new] text of one edit to one lead, and how many of the (unedited) entries must be reused rather than re-converted
+edits = [
+    # same length, so nothing moves
+    ["Hello", "Howdy", 3],
+    # the entry under the edited header is reused too
+    ["## 1-2\n", "## 1-9\n", 4],
+    # longer, so every entry after it moves
+    ["<<<raw $ text>>>", "<<<raw $$ more text>>>", 1],
+]
+
+
+def writeSource(sourceFilePath, text):
+    with open(sourceFilePath, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def makeInterpreter():
+    jrinterp = JrInterpreterCasebook()
+    jrinterp.options["astSnapshot"] = False
+    return jrinterp
+
+
+@pytest.mark.parametrize("edit", edits)
+def test_reload_after_edit_matches_full_parse(tmp_path, monkeypatch, edit):
+    monkeypatch.chdir(tmp_path)
+    sourceFilePath = str(tmp_path / "book.casebook")
+    writeSource(sourceFilePath, sourceText)
+    env = JrAstEnvironment(JrAstContext(False, True), None)
+    jrinterp = makeInterpreter()
+    jrinterp.loadGrammarParseSourceFile(env, grammarFilePath, sourceFilePath, "start", "utf-8")
+    jrinterp.reloadSourceFileIncremental(env, "start", "utf-8")
+
+    [oldText, newText, reusedCount] = edit
+    editedText = sourceText.replace(oldText, newText)
+    writeSource(sourceFilePath, editedText)
+    jrinterp.reloadSourceFileIncremental(env, "start", "utf-8")
+    jrparser = jrinterp.jrparser
+    assert (jrparser.parserUsed == "incremental") and (jrparser.incrementalStats["reparsed"] == 1)
+    assert jrinterp.ast.entryReuseTracker.reusedCount == reusedCount
+
+    # a full parse (what the incrementalVerify option compares against) gives the same tree, positions included
+    fullParseTree = jrparser.parseText(env, editedText, "start", False)
+    assert jrlark.compareParseTrees(fullParseTree, jrparser.getParseTree(), True) == []
+    # and a fresh conversion of it the same ast; a pickle holds all of it (it's what an ast snapshot is)
+    fullInterp = makeInterpreter()
+    fullInterp.loadGrammarParseConvertSourceFile(JrAstEnvironment(JrAstContext(False, True), None), grammarFilePath, sourceFilePath, "start", "utf-8")
+    assert pickle.dumps(jrinterp.ast, protocol=pickle.HIGHEST_PROTOCOL) == pickle.dumps(fullInterp.ast, protocol=pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,93 @@
+import os
+import sys
+
+import pytest
+
+codeDir = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "code"))
+sys.path.insert(0, codeDir)
+
+import benchmark
+import larkparity
+from lib.jrlark import jrlark
+
+
+# small sources the lalr grammar must either refuse or parse exactly like the earley grammar
+regressionSources = [
+    # the earley parser ignores the comment between the $ and the function name
+    '# LEADS\n## a\nIf stuck, $f(d=2): { Hint.}\n$// c\nautohint()\n\n',
+    '# LEADS\n## a\n$ f()\n\n',
+    '# LEADS\n## a\n$/* c */f()\n\n',
+    '# LEADS\n## a\n#// c\n SETUP\n\n',
+    # an empty header
+    '# LEADS\n## \nHello.\n\n',
+    '# LEADS\n##  \nHello.\n\n',
+    # an if without braces takes every following line of its block sequence
+    '# LEADS\n## a\n$if (a): b\n$p("x")\n\n',
+    '# LEADS\n## a\n$if (x):\n\n{ yes } $else: { no }\n\n',
+    '# LEADS\n## a\nText $b(x) /*c*/more.\n\n',
+    '# LEADS\n## a\n<<<//c\nraw>>>\n\n',
+    '# LEADS\n## a\n<<<raw\n>>>\n\n',
+    '# LEADS\n## a\n$f(): { }\n\n',
+    '# LEADS\n## a\n$f(): {\n }\n\n',
+    '# LEADS\n // t\n## a\nx\n\n',
+    '# LEADS\n## 8-2147 “Subway (IRT)<<<r>>> at Lexington”\nI pace the platform.\n\n',
+    '# LEADS\n## b “L” // t\n\nP.\n\n',
+    '# LEADS\n## b\n$f(), // t\n $g()\n\n',
+    '# LEADS\n## a\n$f(): {\n\n  \nx}\n\n',
+    '# LEADS\n## a\n$if (true): {\n\t\r\n$print("t")\n}\n\n',
+    '# LEADS\n## a\n// c\n  \n\n\nx\n\n',
+    '# LEADS\n## a\nx\n\t\n\n/* b */\ny\n\n',
+]
+
+# sources we edit at random; between them they use most of the grammar
+mutationSeedSources = [
+    '# LEADS\n## a\nIf stuck, $f(d=2): { Hint.}\n$// c\nautohint()\n\n',
+    '# COVER\n$(childSort= “index”)\n\n## a “Label” $(autoid=true, time=-1)\nText $b(x) more.\n$if (x > 2): { yes } $else: { no }\n\n/* block\ncomment */\n<<<raw $ text>>>\n\n### sub\nLast line.\n',
+    '# LEADS\n## 1-1\n$f(a, b=[1,2], c={"k": 3}): {one}, {two}\n  indented text\n\n\n## 1-2 \'q\'\nx // tail comment\ny\n',
+    'Preliminary text\n\n# OPTIONS $(autoid=true)\n$set(info.name, “wrongBook”)\n\n# LEADS\n\n## Lead1\n// simple iff\n$if (info.clocked): {\n\t$include(path="clocked.md")\n}\n\n$for(index in $range(0,10)): { $print("Hello" + $castNumberToString(index))}\n\nOk.\n',
+]
+mutationCount = 300
+
+
+
+
+@pytest.fixture(scope="module")
+def jrparser(tmp_path_factory):
+    # (run in a temp dir so our log files don't end up in the tree)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(tmp_path_factory.mktemp("logs"))
+        jrparser = jrlark.JrParserEngineLark()
+        jrparser.loadGrammarFileFromPath(None, larkparity.grammarFilePath, larkparity.encoding)
+        yield jrparser
+
+
+@pytest.mark.parametrize("sourceText", regressionSources)
+def test_regression_sources(jrparser, sourceText):
+    differences = larkparity.calcParityDifferences(jrparser, sourceText)
+    assert (differences is None) or (differences == [])
+
+
+def test_empty_header_is_not_refused(jrparser):
+    assert larkparity.calcParityDifferences(jrparser, '# LEADS\n## \nHello.\n\n') == []
+
+
+@pytest.mark.parametrize("fileName", ["grammar_test.casebook", "wrongbook_partial.casebook"])
+def test_grammar_directory_sources(jrparser, fileName):
+    # these must not be refused, since falling back to earley is slow
+    sourceText = open(larkparity.grammarDirectory + "/" + fileName, encoding=larkparity.encoding).read()
+    assert larkparity.calcParityDifferences(jrparser, sourceText) == []
+
+
+def test_generated_casebook(jrparser):
+    # the scaling benchmark times a build of generated casebooks, which is only meaningful if they don't fall back to earley
+    sourceText = benchmark.CasebookGenerator(benchmark.scalingGeneratorOptions).generate(1)
+    assert larkparity.calcParityDifferences(jrparser, sourceText) == []
+
+
+def test_mutated_sources(jrparser):
+    mismatches = []
+    for sourceText in larkparity.makeMutatedSources(mutationSeedSources, mutationCount, 0):
+        differences = larkparity.calcParityDifferences(jrparser, sourceText)
+        if (differences):
+            mismatches.append([sourceText, differences[0]])
+    assert mismatches == []